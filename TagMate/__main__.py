@@ -0,0 +1,5 @@
+from TagMate.cli import main
+
+# Guarded, because tag writer processes re-import the main module on platforms that spawn new processes (Windows)
+if __name__ == '__main__':
+    main()
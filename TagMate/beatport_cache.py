@@ -0,0 +1,61 @@
+import sqlite3
+import json
+from threading import Lock
+from time import time
+from .instrumentation import metrics
+
+
+class BeatportCache:
+    def __init__(self, db_path, ttl_days=30, refresh=False):
+        """
+        Persistent SQLite cache for Beatport search results, keyed by the formatted query string.
+        :param db_path: path of the SQLite database file
+        :param ttl_days: number of days a cached result stays valid (0 or None never expires)
+        :param refresh: ignore cached results and overwrite them with freshly scraped data
+        """
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.refresh = refresh
+        self._lock = Lock()  # Lookups run in a thread pool and share one connection
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS beatport_results ("
+                "query TEXT PRIMARY KEY, "
+                "result TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL)"
+            )
+
+    def get(self, query):
+        """
+        :param query: formatted query string (see normalize.format_query)
+        :return: cached track_metadata and similarity_ratios dictionary, or None if missing, expired or refreshing
+        """
+        if self.refresh:
+            metrics.cache('beatport', hit=False)
+            return None
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result, fetched_at FROM beatport_results WHERE query = ?", (query,)
+            ).fetchone()
+
+        if row is None or (self.ttl_seconds is not None and time() - row[1] > self.ttl_seconds):
+            metrics.cache('beatport', hit=False)
+            return None
+        metrics.cache('beatport', hit=True)
+        return json.loads(row[0])
+
+    def put(self, query, result):
+        """
+        :param query: formatted query string (see normalize.format_query)
+        :param result: dictionary returned by BeatportScraper.scrape_track_data
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO beatport_results (query, result, fetched_at) VALUES (?, ?, ?)",
+                (query, json.dumps(result), time())
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
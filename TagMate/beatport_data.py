@@ -1,84 +1,125 @@
-from urllib.request import Request, urlopen
-from bs4 import BeautifulSoup as bs
-from re import sub, search
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+import numpy as np
 import json
-from unidecode import unidecode
+from urllib.parse import urlparse
+from .instrumentation import metrics
+from .http_client import default_client
+from .normalize import parse_track_name, format_query, transliterate
+
+BEATPORT_SEARCH_URL = "https://www.beatport.com/search/tracks?q="
+
+# Confidence thresholds: results below any of these similarity ratios are a possible mismatch
+MIN_SIMILARITY_RATIO_ARTISTS = 90
+MIN_SIMILARITY_RATIO_TITLE = 70
+MIN_SIMILARITY_RATIO_MIX = 70
 
 
 class BeatportScraper:
-    def __init__(self, track_name):
+    def __init__(self, track_name, rate_limiter=None, cache=None, search_url=BEATPORT_SEARCH_URL, http_client=None,
+                 isrc=None):
+        """
+        :param track_name: Full track name, including artists, title, and version type
+        :param rate_limiter: optional RateLimiter shared by all lookups
+        :param cache: optional BeatportCache
+        :param search_url: Beatport track search URL, the query is appended (overridden by the benchmarks)
+        :param http_client: HttpClient shared by all lookups, None uses the shared default client
+        :param isrc: ISRC of the track (from Spotify), tried before the fuzzy name search
+        """
         self.track_name = track_name
-        self.track_artists, self.track_title_cleaned, self.track_version_type = self._extract_track_info()
+        self.isrc = isrc.upper() if isrc else None
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.search_url = search_url
+        self.http_client = http_client if http_client is not None else default_client()
+        self.track_artists, self.track_title_cleaned, self.track_version_type = parse_track_name(track_name)
+
+    @staticmethod
+    def cached_track_data(track_name, cache):
+        """
+        :param track_name: Full track name, including artists, title, and version type
+        :param cache: BeatportCache
+        :return: cached result of scrape_track_data for the track, or None if it is not cached (never scrapes)
+        """
+        return cache.get(format_query(track_name))
 
-    def _extract_track_version_type(self, track_name):
+    @staticmethod
+    def _extract_next_data(webpage):
         """
-        # Use regex to find the parenthesized pattern that contains "Mix" or "Remix" but not "feat."
-        :param track_name: Full track name, including artists, title, and version type.
-        :return: Track version type string
+        Extract the JSON embedded in the <script id="__NEXT_DATA__"> tag without parsing the rest of the page.
+        :param webpage: raw HTML of a Beatport search page (bytes)
+        :return: dictionary of the page data
         """
-        regex_pattern = r'\((?!feat\.)[^)]*(Mix|Remix)[^)]*\)'
-        match = search(regex_pattern, track_name)
+        tag_index = webpage.find(b'id="__NEXT_DATA__"')
+        if tag_index == -1:
+            raise ValueError("No __NEXT_DATA__ script found in Beatport page")
 
-        if match:
-            return match.group()
-        else:
-            return None
+        start_index = webpage.find(b'{', tag_index)
+        end_index = webpage.rfind(b'}', start_index, webpage.find(b'</script>', tag_index))
+        return json.loads(webpage[start_index:end_index + 1])
 
-    def _extract_track_info(self):
+    def _score_candidates(self, candidates):
         """
-        Extract artists, title, and track version type (e.g. Original Mix or Remix) from track name.
-        :return: cleaned up strings containing artist names, title, and version type, respectively.
+        Score all search results against the track in one batched rapidfuzz call per field.
+        :param candidates: list of Beatport track dictionaries
+        :return: arrays of artist, title and mix similarity ratios (one value per candidate)
         """
-        track_artists = unidecode(self.track_name.split(' - ')[0].lower())
-        track_title_cleaned = sub(r'\([^)]*ix[^)]*\)\s*', '', self.track_name.split(' - ')[1].lower())
-        track_title_cleaned = sub(r'\([^)]*edit[^)]*\)\s*', '', track_title_cleaned)
-        track_title_cleaned = track_title_cleaned.rstrip()
-        track_version_type = self._extract_track_version_type(self.track_name)
-        if track_version_type is not None:
-            track_version_type = track_version_type.replace("(", "").replace(")", "")
-        return track_artists, track_title_cleaned, track_version_type
+        query_artist_names = [transliterate(', '.join(artist['artist_name'] for artist in candidate['artists']))
+                              for candidate in candidates]
+        query_track_names = [transliterate(candidate['track_name']) for candidate in candidates]
+        query_mix_names = [candidate['mix_name'] or '' for candidate in candidates]
+
+        similarity_ratios_artists = process.cdist([self.track_artists], query_artist_names,
+                                                  scorer=fuzz.token_set_ratio)[0]
+        similarity_ratios_title = process.cdist([self.track_title_cleaned], query_track_names,
+                                                scorer=fuzz.ratio)[0]
+        if self.track_version_type is None:
+            similarity_ratios_mix = np.zeros(len(candidates), dtype=similarity_ratios_title.dtype)
+        else:
+            similarity_ratios_mix = process.cdist([self.track_version_type], query_mix_names,
+                                                  scorer=fuzz.ratio)[0]
+
+        # No version type in the track name usually means the original version
+        is_original = np.isin(query_mix_names, ['Original Mix', 'Extended Mix'])
+        similarity_ratios_mix[(similarity_ratios_mix == 0) & is_original] = 100.0
+
+        return similarity_ratios_artists, similarity_ratios_title, similarity_ratios_mix
 
-    def _format_query_string(self, track_name):
+    @staticmethod
+    def _pick_best_candidate(similarity_ratios_per_candidate):
         """
-        Step1: Remove non-alphabet characters (except spaces)
-        Step2: Replace one or more spaces with a single space
-        Step3: Replace single spaces with '+'
-        :param track_name: Full track name, including artists, title, and version type
-        :return:
+        Prefer candidates that pass all similarity thresholds, then the highest combined similarity.
+        :param similarity_ratios_per_candidate: artist, title and mix similarity arrays from _score_candidates
+        :return: index of the best matching candidate
         """
-        step1 = sub(r'[^a-zA-Z\s]', '', track_name)
-        step2 = sub(r'\s+', ' ', step1)
-        formatted_track_name = sub(r' ', '+', step2)
-        return formatted_track_name
-
-    def scrape_track_data(self):
+        similarity_ratios_artists, similarity_ratios_title, similarity_ratios_mix = similarity_ratios_per_candidate
+        passes_thresholds = ((similarity_ratios_artists >= MIN_SIMILARITY_RATIO_ARTISTS)
+                             & (similarity_ratios_title >= MIN_SIMILARITY_RATIO_TITLE)
+                             & (similarity_ratios_mix >= MIN_SIMILARITY_RATIO_MIX))
+        combined_ratio = similarity_ratios_artists + similarity_ratios_title + similarity_ratios_mix
+        return int(np.argmax(passes_thresholds * 1000 + combined_ratio))
+
+    def _search(self, query):
         """
-        Scrapes track genre and label from Beatport.com. To evaluate query string similarity ratios are used.
-        :return: Nested dictionaries: track_metadata and similarity_ratios
+        :param query: formatted query string or ISRC
+        :return: list of Beatport track dictionaries on the search page (150 tracks max by default)
         """
-        req = Request(
-            url="https://www.beatport.com/search/tracks?q=" + self._format_query_string(self.track_name),
-            headers={'User-Agent': 'Mozilla/5.0'}
-        )
-        webpage = urlopen(req).read()
-        soup = bs(webpage, "html.parser")
-
-        # Extract the JSON data from the script content
-        script_content = soup.find('script', {'id': '__NEXT_DATA__'}).string
-        start_index = script_content.find('{')
-        end_index = script_content.rfind('}')
-        json_data = script_content[start_index:end_index + 1]
-        data_dict = json.loads(json_data)
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(urlparse(self.search_url).netloc)
+        with metrics.http('beatport'):
+            webpage = self.http_client.get(self.search_url + query)
+        data_dict = self._extract_next_data(webpage)
 
         # Access the desired data from the dictionary
-        # 150 tracks max query by default
-        query_results = data_dict['props']['pageProps']['dehydratedState']['queries'][0]['state']['data']['data'][0]
-        all_artist_names = [artist['artist_name'] for artist in query_results['artists']]
-        query_all_artist_names = ', '.join(all_artist_names)
-        query_all_artist_names = unidecode(query_all_artist_names).lower()
-        query_track_name = unidecode(query_results['track_name']).lower()
-        query_mix_name = query_results['mix_name']
+        return data_dict['props']['pageProps']['dehydratedState']['queries'][0]['state']['data']['data']
+
+    @staticmethod
+    def _track_data(query_results, similarity_ratios):
+        """
+        :param query_results: Beatport track dictionary
+        :param similarity_ratios: artist, title and mix similarity ratio of the track
+        :return: Nested dictionaries: track_metadata and similarity_ratios
+        """
+        similarity_ratio_artists, similarity_ratio_title, similarity_ratio_mix = similarity_ratios
 
         if isinstance(query_results['genre'], list):
             query_genre_name = query_results['genre'][0]['genre_name']
@@ -90,14 +131,6 @@ class BeatportScraper:
         else:
             query_label_name = query_results['label']['label_name']
 
-        # String similarity ratios to predict whether the query is correct
-        similarity_ratio_artists = fuzz.token_set_ratio(query_all_artist_names, self.track_artists)
-        similarity_ratio_title = fuzz.ratio(query_track_name, self.track_title_cleaned)
-        similarity_ratio_mix = fuzz.ratio(query_mix_name, self.track_version_type)
-
-        if similarity_ratio_mix == 0 and (query_mix_name == 'Original Mix' or query_mix_name == 'Extended Mix'):
-            similarity_ratio_mix = 100.0
-
         track_metadata = {
             'query_genre_name': query_genre_name,
             'query_label_name': query_label_name
@@ -113,3 +146,57 @@ class BeatportScraper:
             'track_metadata': track_metadata,
             'similarity_ratios': similarity_ratios
         }
+
+    def _isrc_track_data(self, query):
+        """
+        Exact match on the ISRC: the search results for the ISRC are filtered on the same ISRC, no similarity ratios
+        are needed (reported as 100). The outcome is cached under 'isrc:{ISRC}', including misses (empty result), and a
+        match is also cached under the query of the track name.
+        :param query: formatted query string of the track name
+        :return: Nested dictionaries: track_metadata and similarity_ratios, or None if no result has the ISRC
+        """
+        isrc_key = f"isrc:{self.isrc}"
+        if self.cache is not None:
+            cached_result = self.cache.get(isrc_key)
+            if cached_result is not None:
+                return cached_result or None
+
+        matches = [candidate for candidate in self._search(self.isrc)
+                   if (candidate.get('isrc') or '').upper() == self.isrc]
+        result = self._track_data(matches[0], (100.0, 100.0, 100.0)) if matches else None
+        if self.cache is not None:
+            self.cache.put(isrc_key, result or {})
+            if result is not None:
+                self.cache.put(query, result)
+        return result
+
+    def scrape_track_data(self):
+        """
+        Scrapes track genre and label from Beatport.com. Tracks with an ISRC are looked up by ISRC first, fuzzy
+        search is the fallback: if there is no ISRC or Beatport has no track with it, the track name is searched,
+        all search results are scored with string similarity ratios and the best matching result is used.
+        Results are read from and stored in the Beatport cache (if given), so known tracks are not scraped again.
+        :return: Nested dictionaries: track_metadata and similarity_ratios
+        """
+        query = format_query(self.track_name)
+        if self.isrc is not None:
+            result = self._isrc_track_data(query)
+            if result is not None:
+                return result
+
+        if self.cache is not None:
+            cached_result = self.cache.get(query)
+            if cached_result is not None:
+                return cached_result
+
+        candidates = self._search(query)
+        if not candidates:
+            raise ValueError(f"No Beatport search results for '{self.track_name}'")
+
+        similarity_ratios_per_candidate = self._score_candidates(candidates)
+        best_index = self._pick_best_candidate(similarity_ratios_per_candidate)
+        result = self._track_data(candidates[best_index],
+                                  [float(ratios[best_index]) for ratios in similarity_ratios_per_candidate])
+        if self.cache is not None:
+            self.cache.put(query, result)
+        return result
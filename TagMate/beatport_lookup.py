@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import monotonic, sleep
+from tqdm import tqdm
+from .beatport_data import BeatportScraper, BEATPORT_SEARCH_URL
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second):
+        """
+        Spaces out requests to the same host, shared by all lookup threads. Only the first attempt of a request waits
+        for a slot: retries of the HttpClient bypass the limiter and are spaced by its backoff and Retry-After instead.
+        :param requests_per_second: maximum number of requests per second per host (0 or None disables the limit)
+        """
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._lock = Lock()
+        self._next_slot = {}  # Host as key, earliest time the next request may start as value
+
+    def wait(self, host):
+        """
+        Block the calling thread until a request to the host is allowed.
+        :param host: network location of the request, e.g. 'www.beatport.com'
+        """
+        with self._lock:
+            now = monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+
+        if slot > now:
+            sleep(slot - now)
+
+
+class BeatportLookup:
+    def __init__(self, max_workers=8, requests_per_second=4, cache=None, search_url=BEATPORT_SEARCH_URL,
+                 http_client=None):
+        """
+        Resolves Beatport metadata for a batch of tracks before any tags are written.
+        :param max_workers: number of concurrent Beatport lookups
+        :param requests_per_second: maximum number of requests per second to beatport.com
+        :param cache: optional BeatportCache shared by all lookups
+        :param search_url: Beatport track search URL
+        :param http_client: HttpClient shared by all lookups, None uses the shared default client
+        """
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.cache = cache
+        self.search_url = search_url
+        self.http_client = http_client
+
+    def _lookup(self, track_name, isrc=None):
+        """
+        Scrape a single track. Errors are returned instead of raised, so one failing track does not cancel the batch.
+        :param track_name: Full track name, including artists, title, and version type
+        :param isrc: ISRC of the track, or None
+        :return: dictionary returned by BeatportScraper.scrape_track_data or the raised exception
+        """
+        try:
+            return BeatportScraper(track_name=track_name,
+                                   rate_limiter=self.rate_limiter,
+                                   cache=self.cache,
+                                   search_url=self.search_url,
+                                   http_client=self.http_client,
+                                   isrc=isrc).scrape_track_data()
+        except Exception as e:
+            return e
+
+    def resolve(self, track_names, isrcs=None):
+        """
+        Look up all tracks concurrently.
+        :param track_names: list of full track names
+        :param isrcs: list of ISRCs (or None) in the same order as track_names, None looks up all tracks by name
+        :return: list of Beatport results (or exceptions) in the same order as track_names
+        """
+        if not track_names:
+            return []
+
+        isrcs = isrcs if isrcs is not None else [None] * len(track_names)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(tqdm(executor.map(self._lookup, track_names, isrcs),
+                             total=len(track_names),
+                             desc="Beatport lookup"))
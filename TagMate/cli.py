@@ -0,0 +1,352 @@
+from argparse import ArgumentParser
+from os import path, makedirs
+
+# Stages run by each subcommand, in order. Heavy modules (spotipy, rapidfuzz, numpy, the genre GUI) are only
+# imported by the stages that use them.
+COMMAND_STAGES = {
+    'tag': ('tag',),
+    'transfer': ('transfer',),
+    'primary': ('primary',),
+    'reconcile': ('reconcile',),
+    'sync': ('tag', 'transfer', 'primary', 'reconcile'),
+    'watch': ('tag', 'transfer', 'primary'),
+}
+SPOTIFY_STAGES = ('tag', 'reconcile')
+
+
+def build_parser():
+    parser = ArgumentParser(prog='tagmate', description="Tag local music files using Spotify and Beatport metadata.")
+    parser.set_defaults(refresh=False, force=False, rollback=False, resume=False, retry_failed=False)
+
+    common = ArgumentParser(add_help=False)
+    common.add_argument('--config', default='config.yaml',
+                        help="path of config.yaml (default: config.yaml in the current directory)")
+    common.add_argument('--output-dir', help="directory for reports and caches (default: output next to config.yaml)")
+    common.add_argument('--library', action='append',
+                        help="only process this library from the config, can be repeated (default: all libraries)")
+    common.add_argument('--profile', action='store_true',
+                        help="profile the run with cProfile, saved to {output_dir}/run_profile.prof")
+    refresh = ArgumentParser(add_help=False)
+    refresh.add_argument('--refresh', action='store_true', help="ignore cached Beatport results and scrape them again")
+    force = ArgumentParser(add_help=False)
+    force.add_argument('--force', action='store_true', help="reprocess all files, including files processed by an "
+                                                            "earlier run")
+    rollback = ArgumentParser(add_help=False)
+    rollback.add_argument('--rollback', action='store_true',
+                          help="restore the Primary/Substitute comments of an interrupted run and exit")
+
+    resume = ArgumentParser(add_help=False)
+    resume_group = resume.add_mutually_exclusive_group()
+    resume_group.add_argument('--resume', action='store_true',
+                              help="only tag the remaining files of an interrupted run, with the genres picked in it")
+    resume_group.add_argument('--retry-failed', action='store_true',
+                              help="only tag the files that failed in an earlier run (listed in Failed_tracks.txt)")
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('tag', parents=[common, refresh, force, resume],
+                          help="tag the files in music_to_be_tagged with Spotify (and Beatport) metadata")
+    subparsers.add_parser('transfer', parents=[common, force],
+                          help="copy the MP3 tags to the AIF/WAV versions of a track")
+    subparsers.add_parser('primary', parents=[common, force, rollback], help="mark tracks as Primary or Substitute")
+    subparsers.add_parser('reconcile', parents=[common], help="compare the collection with the Spotify playlist")
+    subparsers.add_parser('sync', parents=[common, refresh, force, rollback, resume],
+                          help="run tag, transfer, primary and reconcile")
+    watch = subparsers.add_parser('watch', parents=[common, refresh],
+                                  help="keep running and tag files as they arrive in music_to_be_tagged")
+    watch.add_argument('--poll', action='store_true', help="poll the directories instead of using inotify")
+    return parser
+
+
+def load_config(config_path):
+    """
+    :param config_path: path of config.yaml
+    :return: dictionary of configuration settings
+    """
+    import yaml
+
+    if not path.isfile(config_path):
+        raise SystemExit(f"Config file '{path.abspath(config_path)}' not found, pass its path with --config")
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+class Runner:
+    def __init__(self, args, config):
+        """
+        Runs the stages of a subcommand for every library. The Spotify session, Beatport lookup and caches are created
+        on first use and shared by all libraries.
+        :param args: parsed command line arguments
+        :param config: dictionary of configuration settings
+        """
+        self.args = args
+        self.config = config
+        self.stages = COMMAND_STAGES[args.command]
+        self.music_dir = config.get('music_dir', '')
+        self.mode = config.get('mode', 'manual')
+        self.output_dir = args.output_dir
+        # Relative to config.yaml, None uses the genre list installed with TagMate
+        self.custom_genres_path = (path.join(path.dirname(path.abspath(args.config)), config['custom_genres'])
+                                   if config.get('custom_genres') else None)
+        self.auth_manager = None
+        self.requests_session = None
+        self.http_client = None
+        self.beatport_cache = None
+        self.beatport_lookup = None
+        self.artwork_cache = None
+        self.preview_cache = None
+        self.playlists = {}  # Library name as key, Spotify data (a memory mapped TrackTable if cached) as value
+
+    def _open_spotify(self):
+        from .spotify_data import create_auth_manager
+        import requests
+
+        self.auth_manager = create_auth_manager()
+        self.auth_manager.get_access_token(as_dict=False)  # Authenticate once, before libraries start in parallel
+        self.requests_session = requests.Session()
+
+    def _open_tag_clients(self):
+        from .beatport_cache import BeatportCache
+        from .beatport_lookup import BeatportLookup
+        from .download_cache import ArtworkCache, PreviewCache
+        from .http_client import HttpClient
+
+        self.http_client = HttpClient(connect_timeout=self.config.get('http_connect_timeout', 5),
+                                      read_timeout=self.config.get('http_read_timeout', 30),
+                                      retries=self.config.get('http_retries', 3),
+                                      max_connections=max(self.config.get('beatport_workers', 8), 8))
+        self.beatport_cache = BeatportCache(f'{self.output_dir}/beatport_cache.sqlite',
+                                            ttl_days=self.config.get('beatport_cache_ttl_days', 30),
+                                            refresh=self.args.refresh)
+        self.beatport_lookup = BeatportLookup(max_workers=self.config.get('beatport_workers', 8),
+                                              requests_per_second=self.config.get('beatport_rate_limit', 4),
+                                              cache=self.beatport_cache,
+                                              http_client=self.http_client)
+        self.artwork_cache = ArtworkCache(f'{self.output_dir}/artwork_cache', http_client=self.http_client)
+        if self.mode == 'manual':
+            self.preview_cache = PreviewCache(f'{self.output_dir}/preview_cache', http_client=self.http_client)
+
+    def open(self):
+        """
+        Open the clients the stages of the subcommand need.
+        """
+        if any(stage in SPOTIFY_STAGES for stage in self.stages) and not self.args.rollback:
+            self._open_spotify()
+        if 'tag' in self.stages and not self.args.rollback:
+            self._open_tag_clients()
+
+    def close(self):
+        for cache in (self.artwork_cache, self.preview_cache):
+            if cache is not None:
+                cache.close()
+        if self.beatport_cache is not None:
+            self.beatport_cache.close()
+        if self.requests_session is not None:
+            self.requests_session.close()
+        if self.http_client is not None:
+            self.http_client.close()
+        for library_name in list(self.playlists):
+            self._close_playlist(library_name)
+
+    def _close_playlist(self, library_name):
+        """
+        Unmap the cached playlist of a library, so its cache file can be replaced (Windows cannot replace mapped files).
+        :param library_name: name of the library in config.yaml
+        """
+        from .track_table import TrackTable
+
+        spotify_data = self.playlists.pop(library_name, None)
+        if isinstance(spotify_data, TrackTable):
+            spotify_data.close()
+
+    def library_dirs(self, library_name):
+        """
+        :param library_name: name of the library in config.yaml
+        :return: local, possible mismatch, collection and output directory of the library (created if missing)
+        """
+        local_dir = f"{self.music_dir}/{library_name}/music_to_be_tagged"
+        possible_mismatch_dir = f"{self.music_dir}/{library_name}/possible_mismatch"
+        collection_dir = f"{self.music_dir}/{library_name}/{library_name}_collection"
+        output_dir = f"{self.output_dir}/{library_name}"
+
+        # Check if directories exist, if not, create them
+        for directory in [local_dir, possible_mismatch_dir, collection_dir, output_dir]:
+            if not path.exists(directory):
+                makedirs(directory)
+        return local_dir, possible_mismatch_dir, collection_dir, output_dir
+
+    def spotify_data(self, library_name, library_url):
+        """
+        Download (or load the cached) Spotify playlist and export its track names. The data returned by an earlier call
+        for the same library is closed and must not be used anymore.
+        :param library_name: name of the library in config.yaml
+        :param library_url: Spotify playlist URL of the library
+        :return: dictionary generated by spotify_data.py
+        """
+        from .spotify_data import SpotifyData
+
+        self._close_playlist(library_name)
+        sd = SpotifyData(library_url, cache_dir=f'{self.output_dir}/playlist_cache',
+                         auth_manager=self.auth_manager, requests_session=self.requests_session)
+
+        # Export track names from Spotify playlist
+        sd.export_playlist(output_dir=f"{self.output_dir}/{library_name}")
+        self.playlists[library_name] = sd.music_dict
+        return sd.music_dict
+
+    def music_tagger(self, library_name):
+        """
+        :param library_name: name of the library in config.yaml
+        :return: MusicTagger of the library, with tag state and reports in {output_dir}/{library_name}
+        """
+        from .music_tagger import MusicTagger
+        from .tag_state import TagState
+        from .journal import Journal
+        from .tag_checkpoint import TagCheckpoint
+        from .collection_index import CollectionIndex
+
+        local_dir, possible_mismatch_dir, collection_dir, output_dir = self.library_dirs(library_name)
+        return MusicTagger(local_dir, possible_mismatch_dir, collection_dir, library_name, self.mode,
+                          beatport_cache=self.beatport_cache,
+                          artwork_cache=self.artwork_cache,
+                          tag_state=TagState(f'{output_dir}/tag_state.json', force=self.args.force),
+                          primary_journal=Journal(f'{output_dir}/primary_journal.json'),
+                          tag_workers=self.config.get('tag_workers', 4),
+                          match_threshold=self.config.get('match_threshold', 90),
+                          collection_scan_cache=f'{output_dir}/collection_scan.json',
+                          collection_index=CollectionIndex(f'{output_dir}/collection_index.json'),
+                          beatport_lookup=self.beatport_lookup,
+                          output_dir=output_dir,
+                          preview_cache=self.preview_cache,
+                          genre_feature_cache=f'{output_dir}/genre_features.json',
+                          genre_auto_apply_threshold=self.config.get('genre_auto_apply_threshold', 0.9),
+                          checkpoint=TagCheckpoint(f'{output_dir}/tag_checkpoint.json'),
+                          checkpoint_interval=self.config.get('tag_checkpoint_interval', 200),
+                          custom_genres_path=self.custom_genres_path)
+
+    def run_library(self, library_name, library_url):
+        """
+        Run the stages for a single library. Directories, tag state and reports are per library (reports in
+        {output_dir}/{library_name}).
+        :param library_name: name of the library in config.yaml
+        :param library_url: Spotify playlist URL of the library
+        """
+        self.library_dirs(library_name)
+        spotify_data = None
+        if any(stage in SPOTIFY_STAGES for stage in self.stages) and not self.args.rollback:
+            spotify_data = self.spotify_data(library_name, library_url)
+
+        mt = self.music_tagger(library_name)
+        try:
+            if self.args.rollback:
+                mt.rollback_primary_or_substitute_journal()
+                return
+
+            if 'tag' in self.stages:
+                mt.tag_music(spotify_data=spotify_data, resume=self.args.resume, retry_failed=self.args.retry_failed)
+            if 'transfer' in self.stages:
+                mt.transfer_tags()
+            if 'primary' in self.stages:
+                mt.process_primary_or_substitute_tracks()
+            mt.flush()
+            if 'reconcile' in self.stages:
+                mt.reconcile_collection(spotify_data=spotify_data)
+        finally:
+            mt.close()
+
+    def run(self, libraries):
+        """
+        :param libraries: dictionary of library names and Spotify playlist URLs
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        self.open()
+
+        # The genre selection window of manual mode needs the main thread, so libraries only run concurrently in
+        # automatic mode
+        library_workers = self.config.get('library_workers', 1) if self.mode == 'automatic' else 1
+
+        try:
+            if library_workers > 1 and len(libraries) > 1:
+                with ThreadPoolExecutor(max_workers=library_workers) as executor:
+                    futures = {executor.submit(self.run_library, library_name, library_url): library_name
+                               for library_name, library_url in libraries.items()}
+                    for future in as_completed(futures):
+                        try:
+                            future.result()
+                        except Exception as e:
+                            print(f"Error: library '{futures[future]}' failed: {e}")
+            else:
+                for library_name, library_url in libraries.items():
+                    self.run_library(library_name, library_url)
+        finally:
+            self.close()
+
+
+def run_profiled(run, libraries, profile_path, n_functions=20):
+    """
+    Run the libraries under cProfile, save the statistics and print the most expensive functions.
+    :param run: Runner.run or WatchDaemon.run
+    :param libraries: dictionary of library names and Spotify playlist URLs
+    :param profile_path: path of the profile statistics (open with pstats or snakeviz)
+    :param n_functions: number of functions to print, by cumulative time
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run, libraries)
+    finally:
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(n_functions)
+        print(f"Profile saved to {profile_path}")
+
+
+def main(argv=None):
+    """
+    Entry point of the tagmate command.
+    :param argv: command line arguments, None uses sys.argv
+    """
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    if args.output_dir is None:
+        args.output_dir = path.join(path.dirname(path.abspath(args.config)), 'output')
+
+    # Accessing configuration settings
+    libraries = config.get('library', {})
+    if args.library:
+        unknown = [library_name for library_name in args.library if library_name not in libraries]
+        if unknown:
+            raise SystemExit(f"Unknown library {', '.join(unknown)}, expected one of: {', '.join(libraries)}")
+        libraries = {library_name: libraries[library_name] for library_name in args.library}
+
+    print(f"Running tagmate {args.command} using the following configurations:"
+          f"\n - {config.get('music_dir', '')}"
+          f"\n - {libraries}"
+          f"\n - {config.get('mode', 'manual')}")
+
+    from .instrumentation import metrics
+
+    makedirs(args.output_dir, exist_ok=True)
+    metrics.reset()
+    runner = Runner(args, config)
+    try:
+        run = runner.run
+        if args.command == 'watch':
+            from .watch import WatchDaemon
+
+            run = WatchDaemon(runner,
+                              debounce_seconds=config.get('watch_debounce_seconds', 2),
+                              max_batch_seconds=config.get('watch_max_batch_seconds', 30),
+                              playlist_refresh_seconds=config.get('watch_playlist_refresh_seconds', 300),
+                              poll=args.poll,
+                              report_path=f'{args.output_dir}/run_report.json').run
+        if args.profile:
+            run_profiled(run, libraries, f'{args.output_dir}/run_profile.prof')
+        else:
+            run(libraries)
+    finally:
+        # Stage times, HTTP latencies, cache hit rates and file counters of this run, also after a failed run
+        metrics.save(f'{args.output_dir}/run_report.json', command=args.command, libraries=list(libraries),
+                     mode=config.get('mode', 'manual'))
+        print(f"Run report saved to {args.output_dir}/run_report.json")
@@ -0,0 +1,164 @@
+from os import path
+import json
+from .json_file import save_json
+from .normalize import normalize_track_name
+
+INDEX_VERSION = 3  # Indexes of an older version are rebuilt (2: folder mtimes, 3: no illegal characters in identities)
+
+# Audio quality per format: lossless AIF/WAV above lossy MP3. The best versions of a track are Primary, the others
+# Substitute
+FORMAT_QUALITY = {'mp3': 1, 'aif': 2, 'wav': 2}
+CONDITIONS = ('Primary', 'Substitute')
+
+
+def track_identity(file_path):
+    """
+    :param file_path: path of music file
+    :return: normalized track name of the file, the same for all versions (and near identical names) of a track
+    """
+    return normalize_track_name(path.basename(file_path).rpartition('.')[0])
+
+
+def comment_condition(comment):
+    """
+    :param comment: comment tag, e.g. '/* LIBRARY_NAME / Primary / Record label name */'
+    :return: 'Primary' or 'Substitute' as marked in the comment, or None if it is not marked
+    """
+    comment_parts = [s.strip("/* ").strip(" */") for s in str(comment).split(' / ')]
+    if len(comment_parts) >= 2 and comment_parts[1] in CONDITIONS:
+        return comment_parts[1]
+    return None
+
+
+def best_conditions(formats):
+    """
+    :param formats: dictionary with file path as key and format (extension) as value, all versions of one track
+    :return: dictionary with file path as key and 'Primary' or 'Substitute' as value
+    """
+    best_quality = max(FORMAT_QUALITY[extension] for extension in formats.values())
+    return {file_path: 'Primary' if FORMAT_QUALITY[extension] == best_quality else 'Substitute'
+            for file_path, extension in formats.items()}
+
+
+class CollectionIndex:
+    def __init__(self, index_path=None):
+        """
+        Index of every music file in the collection directory (including subfolders), grouped by track identity
+        (normalized track name), with its format, quality and the Primary/Substitute condition of its comment.
+        It is updated with the files added to and removed from the folders modified since the last update, so a new
+        file only re-evaluates the versions of its own track. Conditions are read from the file when a track is first
+        evaluated.
+        :param index_path: path of the JSON index, None keeps the index in memory only
+        """
+        self.index_path = index_path
+        self._files = {}  # File path as key, identity, format, quality and condition (None if not read) as value
+        self._tracks = {}  # Identity as key, set of file paths as value
+        self._folders = {}  # Folder path as key, its mtime at the last update as value
+        self._folder_files = {}  # Folder path as key, set of indexed file paths in the folder as value
+        self._changed = set()  # Identities with versions added or removed, until evaluated (see take_changed)
+        self._loaded = False  # False until the index holds a collection, its first update only fills it
+        self._dirty = False  # True if the index changed since it was loaded or saved
+
+        if self.index_path is not None and path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as index_file:
+                index = json.load(index_file)
+            if index['version'] == INDEX_VERSION:
+                for file_path, entry in index['files'].items():
+                    self._add(file_path, entry)
+                self._folders = index['folders']
+                self._changed = set(index['changed'])
+                self._loaded = True
+
+    def _add(self, file_path, entry):
+        self._files[file_path] = entry
+        self._tracks.setdefault(entry['identity'], set()).add(file_path)
+        self._folder_files.setdefault(path.dirname(file_path), set()).add(file_path)
+
+    def _remove(self, file_path):
+        identity = self._files.pop(file_path)['identity']
+        self._tracks[identity].discard(file_path)
+        if not self._tracks[identity]:
+            del self._tracks[identity]
+        self._folder_files[path.dirname(file_path)].discard(file_path)
+        return identity
+
+    def _update_folder(self, folder, file_names):
+        """
+        :param folder: path of a collection folder
+        :param file_names: names of all files in the folder
+        :return: set of identities of the tracks with versions added to or removed from the folder
+        """
+        file_paths = {path.join(folder, file_name) for file_name in file_names
+                      if file_name.rpartition('.')[2] in FORMAT_QUALITY}
+        indexed = set(self._folder_files.get(folder, ()))
+        changed = {self._remove(file_path) for file_path in indexed - file_paths}
+        for file_path in file_paths - indexed:
+            extension = file_path.rpartition('.')[2]
+            entry = {'identity': track_identity(file_path), 'format': extension,
+                     'quality': FORMAT_QUALITY[extension], 'condition': None}
+            self._add(file_path, entry)
+            changed.add(entry['identity'])
+        if not self._folder_files.get(folder):
+            self._folder_files.pop(folder, None)
+        return changed
+
+    def update(self, listings):
+        """
+        Add the files that are new in the collection and remove the files that are gone. Only the folders modified
+        since the last update are compared. The first update only builds the index, later updates mark the tracks of
+        the added and removed files as changed.
+        :param listings: dictionary with the path of every collection folder as key and its listing (mtime and file
+        names) as value (see CollectionReconciler.scan_folders)
+        """
+        changed = set()
+        for folder in [folder for folder in self._folders if folder not in listings]:
+            changed |= self._update_folder(folder, ())
+            del self._folders[folder]
+            self._dirty = True
+        for folder, listing in listings.items():
+            if self._folders.get(folder) != listing['mtime']:
+                changed |= self._update_folder(folder, listing['files'])
+                self._folders[folder] = listing['mtime']
+                self._dirty = True
+
+        if self._loaded:
+            self._changed |= changed
+        else:
+            self._dirty = True  # Save the built index, also of an empty collection
+        self._loaded = True
+
+    def take_changed(self):
+        """
+        :return: set of identities of the tracks with versions added or removed since they were last taken
+        """
+        changed, self._changed = self._changed, set()
+        self._dirty |= bool(changed)
+        return changed
+
+    def files(self, identity):
+        """
+        :param identity: normalized track name
+        :return: dictionary with file path as key and entry (format, quality, condition) as value, the versions of the
+        track in the collection
+        """
+        return {file_path: self._files[file_path] for file_path in self._tracks.get(identity, ())}
+
+    def set_condition(self, file_path, condition):
+        """
+        :param file_path: path of a collection file
+        :param condition: 'Primary', 'Substitute' or None (unknown, read again on the next evaluation)
+        """
+        if file_path in self._files and self._files[file_path]['condition'] != condition:
+            self._files[file_path]['condition'] = condition
+            self._dirty = True
+
+    def save(self):
+        """
+        Save the index if it changed since it was loaded or saved.
+        """
+        if self.index_path is None or not self._dirty:
+            return
+
+        save_json(self.index_path, {'version': INDEX_VERSION, 'files': self._files, 'folders': self._folders,
+                                    'changed': sorted(self._changed)})
+        self._dirty = False
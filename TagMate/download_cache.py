@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from os import path, makedirs, listdir, remove, replace, utime
+from threading import Lock
+import json
+from .instrumentation import metrics
+from .http_client import default_client
+from .json_file import save_json
+
+
+class DownloadCache:
+    def __init__(self, cache_dir=None, max_memory_items=64, max_disk_items=2000, max_workers=8, extension='bin',
+                 name='download', http_client=None):
+        """
+        Content-addressed download cache. Files are downloaded in memory, deduplicated by URL and content hash and
+        kept in a bounded in-memory LRU and (optionally) a bounded on-disk LRU. Use ArtworkCache or PreviewCache.
+        :param cache_dir: directory for cached files, None keeps the cache in memory only
+        :param max_memory_items: maximum number of files kept in memory
+        :param max_disk_items: maximum number of files kept in cache_dir
+        :param max_workers: number of parallel downloads used by prefetch
+        :param extension: file extension of the cached files
+        :param name: name of the cache in the run report
+        :param http_client: HttpClient for the downloads, None uses the shared default client
+        """
+        self.cache_dir = cache_dir
+        self.extension = extension
+        self.name = name
+        self.http_client = http_client if http_client is not None else default_client()
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict()  # Content hash as key, file bytes as value
+        self._url_index = {}  # URL as key, content hash as value
+        self._pending = {}  # URL as key, download future as value
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        if self.cache_dir is not None:
+            makedirs(self.cache_dir, exist_ok=True)
+            index_path = path.join(self.cache_dir, 'index.json')
+            if path.exists(index_path):
+                with open(index_path) as index_file:
+                    self._url_index = json.load(index_file)
+
+    def _blob_path(self, content_hash):
+        return path.join(self.cache_dir, f"{content_hash}.{self.extension}")
+
+    def _remember(self, content_hash, data):
+        """
+        Add file to the in-memory LRU, evicting the least recently used file if it is full.
+        Identical files share a single bytes object.
+        """
+        with self._lock:
+            if content_hash in self._memory:
+                self._memory.move_to_end(content_hash)
+                return self._memory[content_hash]
+            self._memory[content_hash] = data
+            if len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+            return data
+
+    def _load(self, url):
+        """
+        :param url: file URL
+        :return: file bytes from memory or disk, or None if the file is not cached
+        """
+        content_hash = self._url_index.get(url)
+        if content_hash is None:
+            return None
+
+        with self._lock:
+            if content_hash in self._memory:
+                self._memory.move_to_end(content_hash)
+                return self._memory[content_hash]
+
+        if self.cache_dir is not None and path.exists(self._blob_path(content_hash)):
+            blob_path = self._blob_path(content_hash)
+            utime(blob_path)  # Mark as recently used
+            with open(blob_path, 'rb') as blob_in:
+                return self._remember(content_hash, blob_in.read())
+        return None
+
+    def _download(self, url):
+        """
+        Download file in memory and store it under its content hash.
+        :param url: file URL
+        :return: file bytes
+        """
+        with metrics.http(self.name):
+            data = self.http_client.get(url)
+        content_hash = sha1(data).hexdigest()
+
+        if self.cache_dir is not None and not path.exists(self._blob_path(content_hash)):
+            temp_path = f"{self._blob_path(content_hash)}.{id(data)}.part"
+            with open(temp_path, 'wb') as blob_out:
+                blob_out.write(data)
+            replace(temp_path, self._blob_path(content_hash))
+
+        data = self._remember(content_hash, data)
+        with self._lock:
+            self._url_index[url] = content_hash
+        return data
+
+    def _load_or_download(self, url):
+        data = self._load(url)
+        metrics.cache(self.name, hit=data is not None)
+        return data or self._download(url)
+
+    def _fetch(self, url):
+        try:
+            return self._load_or_download(url)
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def prefetch(self, urls):
+        """
+        Start downloading all files that are not cached yet, in the background.
+        :param urls: file URLs, duplicates are downloaded once
+        """
+        for url in dict.fromkeys(urls):
+            with self._lock:
+                if url in self._pending or url in self._url_index:
+                    continue
+                self._pending[url] = self._executor.submit(self._fetch, url)
+
+    def get(self, url):
+        """
+        :param url: file URL
+        :return: file bytes, waiting for a running prefetch or downloading the file if needed
+        """
+        with self._lock:
+            future = self._pending.get(url)
+        if future is not None:
+            return future.result()
+        return self._load_or_download(url)
+
+    def _prune_disk(self):
+        """
+        Remove the least recently used files when the on-disk cache exceeds max_disk_items.
+        """
+        blobs = [path.join(self.cache_dir, file) for file in listdir(self.cache_dir)
+                 if file.endswith(f'.{self.extension}')]
+        if len(blobs) <= self.max_disk_items:
+            return
+
+        blobs.sort(key=path.getmtime)
+        evicted = {path.basename(blob).rpartition('.')[0] for blob in blobs[:len(blobs) - self.max_disk_items]}
+        for content_hash in evicted:
+            remove(self._blob_path(content_hash))
+        self._url_index = {url: content_hash for url, content_hash in self._url_index.items()
+                           if content_hash not in evicted}
+
+    def close(self):
+        """
+        Wait for running downloads, then prune the on-disk cache and save the URL index.
+        """
+        self._executor.shutdown(wait=True)
+        if self.cache_dir is None:
+            return
+
+        self._prune_disk()
+        save_json(path.join(self.cache_dir, 'index.json'), self._url_index)
+
+
+class ArtworkCache(DownloadCache):
+    def __init__(self, cache_dir=None, max_memory_items=64, max_disk_items=2000, max_workers=8, http_client=None):
+        """
+        Cache of the cover images written to the tags, see DownloadCache for the parameters.
+        """
+        super().__init__(cache_dir, max_memory_items, max_disk_items, max_workers, extension='jpg', name='artwork',
+                         http_client=http_client)
+
+
+class PreviewCache(DownloadCache):
+    def __init__(self, cache_dir=None, max_memory_items=8, max_disk_items=200, max_workers=2, http_client=None):
+        """
+        Cache of the preview audio played in the manual review window, see DownloadCache for the parameters.
+        """
+        super().__init__(cache_dir, max_memory_items, max_disk_items, max_workers, extension='mp3', name='preview',
+                         http_client=http_client)
@@ -1,53 +1,98 @@
-from os import path
-import json
+from os import environ
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import tkinter
-import tkinter.messagebox
+import webbrowser
 import customtkinter
-from tkhtmlview import HTMLLabel
+from .download_cache import PreviewCache
+from .genre_model import load_custom_genres
 
 # GUI based on: https://github.com/TomSchimansky/CustomTkinter
 
-abs_path = path.abspath(path.dirname(__file__))
-with open(path.join(abs_path, f'../data/custom_genres.json')) as json_file:
-    CUSTOM_GENRES = json.load(json_file)
-
 customtkinter.set_appearance_mode("System")  # Modes: "System" (standard), "Dark", "Light"
 customtkinter.set_default_color_theme("blue")  # Themes: "blue" (standard), "green", "dark-blue"
 
+# Keyboard shortcuts of the genre buttons, in the order of custom_genres.json
+GENRE_KEYS = '1234567890qwertyuiopasdfghjklzxcvbnm'
+
+
+class PreviewPlayer:
+    def __init__(self):
+        """
+        Plays preview audio in the app with pygame (optional, pip install TagMate[playback]). Without pygame or an
+        audio device, available is False and previews are opened in the browser instead.
+        """
+        self.available = False
+        try:
+            environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+            import pygame
+
+            pygame.mixer.init()
+            self._mixer = pygame.mixer
+            self.available = True
+        except Exception:
+            pass
+
+    def play(self, data):
+        """
+        :param data: MP3 audio bytes
+        """
+        self._mixer.music.load(BytesIO(data), 'mp3')
+        self._mixer.music.play()
+
+    def is_playing(self):
+        return self.available and self._mixer.music.get_busy()
+
+    def stop(self):
+        if self.available:
+            self._mixer.music.stop()
+
+    def close(self):
+        if self.available:
+            self._mixer.quit()
+
 
-class GenreSelectionGUI(customtkinter.CTk):
+class ReviewQueueGUI(customtkinter.CTk):
     WIDTH = 1000
     HEIGHT = 500
+    PREFETCH_TRACKS = 3  # Number of upcoming previews downloaded in the background
 
     def on_closing(self, event=0):
+        self.player.close()
+        self._preview_loader.shutdown(wait=False, cancel_futures=True)
+        if self._own_preview_cache:
+            self.preview_cache.close()
         self.destroy()
 
-    def __init__(self, track, preview_url, library):
+    def __init__(self, queue, library, preview_cache=None, custom_genres_path=None):
+        """
+        Single review window working through a queue of tracks. Genres are picked with the buttons or their keyboard
+        shortcuts, the preview of the current track plays in the app while the next previews are prefetched.
+        Decisions are kept in self.decisions until the window is closed, so they can be changed (Back) and are
+        committed by the caller in one batch. Tracks without a decision (Skip, or window closed early) are left out.
+        :param queue: list of (track name, preview URL or None, suggested genres) tuples, suggestions are (genre,
+        probability) tuples ranked by probability, Enter picks the first one
+        :param library: library name, selects the genre list in custom_genres.json
+        :param preview_cache: PreviewCache for the preview audio, None keeps previews in memory only
+        :param custom_genres_path: path of the genre list file, None uses the list installed with TagMate
+        """
         super().__init__()
 
         self.title("")
-        self.geometry(f"{GenreSelectionGUI.WIDTH}x{GenreSelectionGUI.HEIGHT}")
+        self.geometry(f"{ReviewQueueGUI.WIDTH}x{ReviewQueueGUI.HEIGHT}")
         self.protocol("WM_DELETE_WINDOW", self.on_closing)  # call .on_closing() when app gets closed
         self.wm_attributes("-topmost", "True")
         self.wm_attributes("-toolwindow", "True")
-        self.track = track
+        self.queue = queue
         self.library = library
-        self.picked_genre = ""
-        self.preview_url = ""
-
-        if preview_url:
-            self.preview_url = preview_url
-            preview = "Preview"
-        else:
-            preview = "No preview"
-
-        def button_clicked(i):
-            self.picked_genre = i
-            self.on_closing()
-
-        def button_clicked_entry():
-            self.picked_genre = self.entry.get()
-            self.on_closing()
+        self.preview_cache = preview_cache if preview_cache is not None else PreviewCache()
+        self._own_preview_cache = preview_cache is None  # A shared cache is closed by its owner
+        self.decisions = {}  # Track name as key, picked genre as value
+        self.position = 0
+        self.player = PreviewPlayer()
+        self._preview_loader = ThreadPoolExecutor(max_workers=1)
+        self._preview_future = None
+        self._genre_keys = {}  # Keyboard shortcut as key, genre as value
 
         # ------ create two frames ------
 
@@ -73,63 +118,171 @@ class GenreSelectionGUI(customtkinter.CTk):
                                               font=("Roboto Medium", -16))  # font name and size in px
         self.label_1.grid(row=1, column=1, pady=10, padx=10)
 
-        for lib in CUSTOM_GENRES:
-            if lib == self.library:
-                column_grid_n = 0
-                for i in CUSTOM_GENRES[lib]:
-                    custom_genre_list = CUSTOM_GENRES[lib][i]
-                    column_grid_n += 1
-
-                    row_grid_n = 2
-                    button_list = []
-                    for genre in custom_genre_list:
-                        button = customtkinter.CTkButton(master=self.frame_left,
-                                                         text=f"{genre}", width=15,
-                                                         command=lambda x=genre: button_clicked(x))
-                        button.grid(row=row_grid_n, column=column_grid_n, pady=10, padx=20)
-                        row_grid_n += 1
-                        button_list.append(button)
+        custom_genres = load_custom_genres(custom_genres_path)
+        shortcuts = iter(GENRE_KEYS)
+        for column_grid_n, custom_genre_list in enumerate(custom_genres.get(self.library, {}).values(), start=1):
+            for row_grid_n, genre in enumerate(custom_genre_list, start=2):
+                key = next(shortcuts, None)
+                if key is not None:
+                    self._genre_keys[key] = genre
+                button = customtkinter.CTkButton(master=self.frame_left,
+                                                 text=f"{genre} [{key}]" if key else f"{genre}", width=15,
+                                                 command=lambda x=genre: self._pick(x))
+                button.grid(row=row_grid_n, column=column_grid_n, pady=10, padx=20)
 
         # ------ frame right ------
 
-        # configure grid layout (3x7)
+        # configure grid layout (3x9)
         self.frame_right.rowconfigure((0, 1, 2, 3), weight=1)
         self.frame_right.rowconfigure(7, weight=10)
-        self.frame_right.columnconfigure((0, 1), weight=1)
-        self.frame_right.columnconfigure(2, weight=0)
+        self.frame_right.columnconfigure((0, 1, 2), weight=1)
 
         self.frame_info = customtkinter.CTkFrame(master=self.frame_right)
-        self.frame_info.grid(row=0, column=0, columnspan=2, rowspan=4, pady=20, padx=20, sticky="nsew")
+        self.frame_info.grid(row=0, column=0, columnspan=3, rowspan=4, pady=20, padx=20, sticky="nsew")
+
+        self.button_play = customtkinter.CTkButton(master=self.frame_right,
+                                                   text="Play / Stop [Space]",
+                                                   command=self._toggle_preview)
+        self.button_play.grid(row=5, column=0, pady=10, padx=20, sticky="we")
+
+        self.button_back = customtkinter.CTkButton(master=self.frame_right,
+                                                   text="Back [Left]",
+                                                   command=lambda: self._advance(-1))
+        self.button_back.grid(row=5, column=1, pady=10, padx=20, sticky="we")
+
+        self.button_skip = customtkinter.CTkButton(master=self.frame_right,
+                                                   text="Skip [Right]",
+                                                   command=lambda: self._advance(1))
+        self.button_skip.grid(row=5, column=2, pady=10, padx=20, sticky="we")
 
         self.entry = customtkinter.CTkEntry(master=self.frame_right,
                                             width=120,
                                             placeholder_text="Pick a genre")
-        self.entry.grid(row=8, column=0, columnspan=1, pady=20, padx=20, sticky="we")
+        self.entry.grid(row=8, column=0, columnspan=2, pady=20, padx=20, sticky="we")
+        self.entry.bind('<Return>', lambda event: self._pick(self.entry.get()))
 
         self.button_5 = customtkinter.CTkButton(master=self.frame_right,
-                                                text="Add genre",
+                                                text="Add genre [Enter]",
                                                 border_width=2,  # <- custom border_width
                                                 fg_color=None,  # <- no fg_color
-                                                command=button_clicked_entry)
-        self.button_5.grid(row=8, column=1, columnspan=1, pady=20, padx=20, sticky="we")
+                                                command=lambda: self._pick(self.entry.get()))
+        self.button_5.grid(row=8, column=2, columnspan=1, pady=20, padx=20, sticky="we")
 
         # ------ frame info ------
 
-        # configure grid layout (1x1)
+        # configure grid layout (1x3)
         self.frame_info.rowconfigure(0, weight=1)
         self.frame_info.columnconfigure(0, weight=1)
 
         self.label_info_1 = customtkinter.CTkLabel(master=self.frame_info,
-                                                   text=f"{self.track}",
+                                                   text="",
                                                    height=100,
                                                    corner_radius=6,  # <- custom corner radius
                                                    fg_color=("white", "gray38"),  # <- custom tuple-color
                                                    justify=tkinter.LEFT)
         self.label_info_1.grid(column=0, row=0, sticky="nwe", padx=15, pady=15)
 
-        self.label_info_2 = HTMLLabel(master=self.frame_info,
-                                      html=f'<a style="color:white; font-family: courier ; font-size: 80%" href="{self.preview_url}"> {preview} </a>',
-                                      height=5, background="gray38")
-        self.label_info_2.grid(column=0, row=1, sticky="nwe", padx=15, pady=15)
+        self.label_info_2 = customtkinter.CTkLabel(master=self.frame_info, text="")
+        self.label_info_2.grid(column=0, row=1, sticky="nwe", padx=15, pady=5)
+
+        self.label_info_3 = customtkinter.CTkLabel(master=self.frame_info, text="")
+        self.label_info_3.grid(column=0, row=2, sticky="nwe", padx=15, pady=5)
+
+        self.label_info_4 = customtkinter.CTkLabel(master=self.frame_info, text="")
+        self.label_info_4.grid(column=0, row=3, sticky="nwe", padx=15, pady=5)
+
+        self.bind('<Key>', self._on_key)
+
+        if self.queue:
+            self._show_track()
+            self.mainloop()
+        else:
+            self.on_closing()
+
+    def _on_key(self, event):
+        if isinstance(self.focus_get(), tkinter.Entry):
+            return  # Typing a custom genre
+        if event.keysym == 'space':
+            self._toggle_preview()
+        elif event.keysym == 'Left':
+            self._advance(-1)
+        elif event.keysym == 'Right':
+            self._advance(1)
+        elif event.keysym == 'Escape':
+            self.on_closing()
+        elif event.keysym == 'Return' and self.queue[self.position][2]:
+            self._pick(self.queue[self.position][2][0][0])
+        elif event.char in self._genre_keys:
+            self._pick(self._genre_keys[event.char])
+
+    def _pick(self, genre):
+        """
+        :param genre: picked genre of the current track, empty input is ignored
+        """
+        if genre:
+            self.decisions[self.queue[self.position][0]] = genre
+            self._advance(1)
+
+    def _advance(self, step):
+        """
+        :param step: 1 for the next track, -1 for the previous track
+        """
+        self.position = max(0, self.position + step)
+        if self.position >= len(self.queue):
+            self.on_closing()
+        else:
+            self._show_track()
+
+    def _show_track(self):
+        track, preview_url, suggestions = self.queue[self.position]
+        self.label_info_1.configure(text=f"{track}")
+        self.label_info_4.configure(text="Suggested [Enter]: " + ", ".join(f"{genre} ({probability:.0%})"
+                                                                         for genre, probability in suggestions[:3])
+                                    if suggestions else "No suggestion")
+        self.label_info_2.configure(text=f"Track {self.position + 1} of {len(self.queue)}"
+                                         + (f" - picked: {self.decisions[track]}" if track in self.decisions else ""))
+        self.entry.delete(0, tkinter.END)
+        self.focus_set()
+
+        # Download the preview of this track and the next tracks in the background
+        upcoming = self.queue[self.position:self.position + self.PREFETCH_TRACKS + 1]
+        self.preview_cache.prefetch([url for _, url, _ in upcoming if url])
+
+        self.player.stop()
+        self._preview_future = None
+        if not preview_url:
+            self.label_info_3.configure(text="No preview")
+        elif not self.player.available:
+            self.label_info_3.configure(text="Preview: press Space to open in browser")
+        else:
+            self.label_info_3.configure(text="Loading preview...")
+            self._preview_future = self._preview_loader.submit(self.preview_cache.get, preview_url)
+            self.after(50, self._poll_preview, self.position)
+
+    def _poll_preview(self, position):
+        """
+        Start playing the preview once it is downloaded, unless another track is shown by then.
+        """
+        if position != self.position or self._preview_future is None:
+            return
+        if not self._preview_future.done():
+            self.after(50, self._poll_preview, position)
+            return
+
+        try:
+            self.player.play(self._preview_future.result())
+            self.label_info_3.configure(text="Playing preview")
+        except Exception as e:
+            self.label_info_3.configure(text=f"Preview unavailable ({e})")
 
-        self.mainloop()
+    def _toggle_preview(self):
+        preview_url = self.queue[self.position][1]
+        if not preview_url:
+            return
+        if not self.player.available:
+            webbrowser.open(preview_url)
+        elif self.player.is_playing():
+            self.player.stop()
+            self.label_info_3.configure(text="Preview stopped")
+        elif self._preview_future is not None and self._preview_future.done():
+            self._poll_preview(self.position)
@@ -0,0 +1,214 @@
+from os import path, stat
+from concurrent.futures import ProcessPoolExecutor
+from music_tag import load_file
+from .json_file import save_json
+from .normalize import normalize_track_name, title_without_version
+import numpy as np
+import json
+
+CUSTOM_GENRES_PATH = path.join(path.abspath(path.dirname(__file__)), 'data', 'custom_genres.json')
+CONDITIONS = ('Primary', 'Substitute', 'NA')
+VERSION_WORDS = {'original', 'extended', 'mix', 'remix', 'edit', 'radio', 'club', 'dub', 'version', 'remaster',
+                 'remastered'}  # Say nothing about the genre, left out of the title features
+IDENTITY_FEATURES = ('artist:', 'label:', 'beatport:')  # A suggestion is only applied if one of these was trained
+
+
+def load_custom_genres(custom_genres_path=None):
+    """
+    :param custom_genres_path: path of a genre list file, None uses the list installed with TagMate (CUSTOM_GENRES_PATH)
+    :return: dictionary with library name as key and dictionary of genre lists (columns in the review window) as value
+    """
+    with open(custom_genres_path if custom_genres_path is not None else CUSTOM_GENRES_PATH) as json_file:
+        return json.load(json_file)
+
+
+def label_from_comment(comment):
+    """
+    :param comment: TagMate comment, e.g. '/* LIBRARY_NAME / Primary / Record label name */'
+    :return: record label name, or None if the comment has no label
+    """
+    comment_parts = [s.strip("/* ").strip(" */") for s in comment.split(' / ')]
+    labels = [part for part in comment_parts[1:] if part and part not in CONDITIONS]
+    return labels[-1] if labels else None
+
+
+def track_features(artists, title, label=None, beatport_genre=None):
+    """
+    :param artists: comma separated artist names
+    :param title: track title, including version type (not used as feature)
+    :param label: record label name
+    :param beatport_genre: genre of the track on Beatport
+    :return: list of feature strings of a track
+    """
+    features = [f"artist:{artist}" for artist in map(normalize_track_name, artists.split(',')) if artist]
+    features += [f"title:{token}" for token in set(normalize_track_name(title_without_version(title)).split())
+                 if len(token) > 2 and token not in VERSION_WORDS]
+    if label:
+        features.append(f"label:{normalize_track_name(label)}")
+    if beatport_genre:
+        features.append(f"beatport:{beatport_genre.lower()}")
+    return features
+
+
+def read_track_tags(file_path):
+    """
+    Read the tags used as features of a collection file. Runs in a reader process.
+    :param file_path: path of music file
+    :return: tuple of file_path and dictionary of artist, title, label and genre, or None if the file can't be read
+    """
+    try:
+        id3_object = load_file(file_path)
+    except Exception:
+        return file_path, None
+    return file_path, {
+        'artist': str(id3_object['artist']),
+        'title': str(id3_object['tracktitle']),
+        'label': label_from_comment(str(id3_object['comment'])),
+        'genre': str(id3_object['genre']),
+    }
+
+
+class GenreModel:
+    def __init__(self, genres, smoothing=1.0):
+        """
+        Multinomial naive Bayes genre classifier over artist, label, Beatport genre and title token features.
+        :param genres: genres the model can predict (custom genre list of a library)
+        :param smoothing: additive (Laplace) smoothing of the feature counts
+        """
+        self.genres = list(dict.fromkeys(genres))
+        self.smoothing = smoothing
+        self._genre_index = {genre.lower(): n for n, genre in enumerate(self.genres)}
+        self._feature_index = {}  # Feature as key, column in the count matrix as value
+        self._log_prior = None
+        self._log_likelihood = None
+        self.n_samples = 0
+
+    def fit(self, samples):
+        """
+        :param samples: list of (features, genre) tuples, samples with a genre outside self.genres are ignored
+        :return: self
+        """
+        rows, columns = [], []
+        for features, genre in samples:
+            genre_n = self._genre_index.get(genre.lower())
+            if genre_n is None:
+                continue
+            for feature in features:
+                rows.append(genre_n)
+                columns.append(self._feature_index.setdefault(feature, len(self._feature_index)))
+            rows.append(genre_n)
+            columns.append(-1)  # Sample count, stored in the last column
+
+        counts = np.zeros((len(self.genres), len(self._feature_index) + 1))
+        np.add.at(counts, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), 1)
+        genre_counts = counts[:, -1]
+        counts = counts[:, :-1]
+        self.n_samples = int(genre_counts.sum())
+
+        self._log_prior = np.log((genre_counts + self.smoothing) / (self.n_samples + self.smoothing * len(self.genres)))
+        self._log_likelihood = np.log((counts + self.smoothing) / (counts.sum(axis=1, keepdims=True)
+                                                                  + self.smoothing * len(self._feature_index)))
+        return self
+
+    def predict(self, features):
+        """
+        :param features: list of feature strings of a track
+        :return: list of (genre, probability) tuples ranked by probability, empty if none of the features was seen in
+        training
+        """
+        columns = [self._feature_index[feature] for feature in features if feature in self._feature_index]
+        if not self.n_samples or not columns:
+            return []
+
+        scores = self._log_prior + self._log_likelihood[:, columns].sum(axis=1)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        return [(self.genres[n], float(probabilities[n])) for n in np.argsort(-probabilities)]
+
+    def auto_genre(self, features, threshold):
+        """
+        The probabilities are not calibrated, title words alone easily give a high probability to the most common
+        genre. A suggestion is only applied without review if an artist, label or Beatport genre of the track was seen
+        in training.
+        :param features: list of feature strings of a track
+        :param threshold: minimum probability of the top genre
+        :return: genre to apply without review, or None if the track should be reviewed
+        """
+        if not any(feature.startswith(IDENTITY_FEATURES) and feature in self._feature_index for feature in features):
+            return None
+        ranked = self.predict(features)
+        return ranked[0][0] if ranked and ranked[0][1] >= threshold else None
+
+
+class CollectionFeatures:
+    def __init__(self, cache_path=None, beatport_cache=None, max_workers=4):
+        """
+        Training samples from the tags of the collection files. The tags are cached per file (by size and mtime), so
+        only new and changed files are read again.
+        :param cache_path: path of the JSON feature cache, None disables caching
+        :param beatport_cache: optional BeatportCache, adds the cached Beatport genre as a feature (never scrapes)
+        :param max_workers: number of processes reading tags (1 reads in this process)
+        """
+        self.cache_path = cache_path
+        self.beatport_cache = beatport_cache
+        self.max_workers = max_workers
+        self._cache = {}  # File path as key, size, mtime and tags as value
+
+        if self.cache_path is not None and path.exists(self.cache_path):
+            with open(self.cache_path, encoding='utf-8') as cache_file:
+                self._cache = json.load(cache_file)
+
+    def beatport_genre(self, track_name):
+        """
+        :param track_name: Full track name, including artists, title, and version type
+        :return: cached Beatport genre of the track, or None
+        """
+        if self.beatport_cache is None or ' - ' not in track_name:
+            return None
+        from .beatport_data import BeatportScraper
+
+        result = BeatportScraper.cached_track_data(track_name, self.beatport_cache)
+        return result['track_metadata']['query_genre_name'] if result is not None else None
+
+    def _read_tags(self, file_paths):
+        """
+        :param file_paths: paths of the collection files
+        :return: dictionary with file path as key and tags as value, for all readable files
+        """
+        cache = {}
+        to_read = []
+        for file_path in file_paths:
+            file_stat = stat(file_path)
+            entry = self._cache.get(file_path)
+            if entry is not None and entry['size'] == file_stat.st_size and entry['mtime'] == file_stat.st_mtime_ns:
+                cache[file_path] = entry
+            else:
+                cache[file_path] = {'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns, 'tags': None}
+                to_read.append(file_path)
+
+        if self.max_workers > 1 and len(to_read) > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(read_track_tags, to_read, chunksize=64))
+        else:
+            results = [read_track_tags(file_path) for file_path in to_read]
+        for file_path, tags in results:
+            cache[file_path]['tags'] = tags
+
+        self._cache = cache
+        if self.cache_path is not None and to_read:
+            save_json(self.cache_path, self._cache)
+        return {file_path: entry['tags'] for file_path, entry in cache.items() if entry['tags'] is not None}
+
+    def samples(self, file_paths):
+        """
+        :param file_paths: paths of the collection files, versions of the same track count once
+        :return: list of (features, genre) tuples of all tagged files
+        """
+        tracks = {}
+        for file_path, tags in self._read_tags(sorted(file_paths)).items():
+            track_name = path.basename(file_path).rpartition('.')[0]
+            if tags['genre'] and track_name not in tracks:
+                features = track_features(tags['artist'], tags['title'], label=tags['label'],
+                                          beatport_genre=self.beatport_genre(track_name))
+                tracks[track_name] = (features, tags['genre'])
+        return list(tracks.values())
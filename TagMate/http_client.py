@@ -0,0 +1,61 @@
+from threading import Lock
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = 'Mozilla/5.0'
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    def __init__(self, connect_timeout=5, read_timeout=30, retries=3, backoff_factor=0.5, max_connections=16):
+        """
+        HTTP client shared by the Beatport lookups and the artwork and preview downloads. Connections are pooled and
+        kept alive per host, compressed responses are decoded and failed requests (connection errors, 429 and 5xx
+        responses) are retried with exponential backoff, honoring the Retry-After header. Retries happen inside get()
+        and are not counted by the RateLimiter of the Beatport lookups.
+        :param connect_timeout: seconds to wait for a connection
+        :param read_timeout: seconds to wait for the server to send data
+        :param retries: number of retries of a failed request (0 disables retrying)
+        :param backoff_factor: the n-th retry waits backoff_factor * 2 ** (n - 1) seconds
+        :param max_connections: number of kept-alive connections per host, at least the number of lookup threads
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=['GET'],
+                      respect_retry_after_header=True,
+                      raise_on_status=False)  # Return the last response, raised by raise_for_status in get()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+        self.session = Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url):
+        """
+        :param url: URL to download
+        :return: response body (bytes, decompressed)
+        """
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = Lock()
+
+
+def default_client():
+    """
+    :return: HttpClient with the default settings, shared by all users that were not given a client
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from time import perf_counter
+from .json_file import save_json
+
+# Upper bounds (milliseconds) of the HTTP latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RunMetrics:
+    def __init__(self):
+        """
+        Collects stage wall times, HTTP latencies, cache hits and misses and counters of a run. Thread safe, shared by
+        all libraries and lookup threads of the process through the module level `metrics` instance.
+        """
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._start = perf_counter()
+            self._stages = {}  # Stage name as key, dictionary of calls and seconds as value
+            self._latencies = {}  # Service name as key, list of request durations in seconds as value
+            self._http_errors = {}  # Service name as key, number of failed requests as value
+            self._caches = {}  # Cache name as key, dictionary of hits and misses as value
+            self._counters = {}  # Counter name as key, value as value
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block, nested and repeated stages are reported by name.
+        :param name: stage name, e.g. 'BRNC/tag'
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            with self._lock:
+                stage = self._stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                stage['calls'] += 1
+                stage['seconds'] += seconds
+
+    @contextmanager
+    def http(self, service):
+        """
+        Time an HTTP request, failed requests are counted separately.
+        :param service: name of the remote service, e.g. 'beatport'
+        """
+        start = perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self._http_errors[service] = self._http_errors.get(service, 0) + 1
+            raise
+        else:
+            seconds = perf_counter() - start
+            with self._lock:
+                self._latencies.setdefault(service, []).append(seconds)
+
+    def cache(self, name, hit):
+        """
+        :param name: cache name, e.g. 'artwork'
+        :param hit: True if the value was found in the cache
+        """
+        with self._lock:
+            cache = self._caches.setdefault(name, {'hits': 0, 'misses': 0})
+            cache['hits' if hit else 'misses'] += 1
+
+    def count(self, name, value=1):
+        """
+        :param name: counter name, e.g. 'files_saved'
+        :param value: amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @staticmethod
+    def _latency_summary(latencies):
+        latencies_ms = sorted(seconds * 1000 for seconds in latencies)
+        histogram = {f"<={bound}ms": 0 for bound in LATENCY_BUCKETS_MS}
+        histogram[f">{LATENCY_BUCKETS_MS[-1]}ms"] = 0
+        for latency in latencies_ms:
+            bucket = next((f"<={bound}ms" for bound in LATENCY_BUCKETS_MS if latency <= bound),
+                          f">{LATENCY_BUCKETS_MS[-1]}ms")
+            histogram[bucket] += 1
+        return {
+            'requests': len(latencies_ms),
+            'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 2),
+            'p50_ms': round(latencies_ms[len(latencies_ms) // 2], 2),
+            'p95_ms': round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))], 2),
+            'max_ms': round(latencies_ms[-1], 2),
+            'histogram': histogram,
+        }
+
+    def to_dict(self):
+        """
+        :return: JSON serializable run report
+        """
+        with self._lock:
+            http = {service: self._latency_summary(latencies) for service, latencies in self._latencies.items()}
+            for service, errors in self._http_errors.items():
+                http.setdefault(service, {'requests': 0})['errors'] = errors
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'seconds': round(perf_counter() - self._start, 3),
+                'stages': {name: {'calls': stage['calls'], 'seconds': round(stage['seconds'], 3)}
+                           for name, stage in self._stages.items()},
+                'http': http,
+                'caches': {name: dict(cache, hit_rate=round(cache['hits'] / (cache['hits'] + cache['misses']), 3))
+                           for name, cache in self._caches.items()},
+                'counters': dict(self._counters),
+            }
+
+    def save(self, report_path, **run_info):
+        """
+        Write the run report as JSON.
+        :param report_path: path of the JSON report
+        :param run_info: additional fields, e.g. the command and libraries of the run
+        """
+        report = dict(run_info, **self.to_dict())
+        save_json(report_path, report, indent=2)
+
+
+metrics = RunMetrics()
+
+
+def timed_stage(name):
+    """
+    Decorator timing a MusicTagger stage as '{LIBRARY_NAME}/{name}'.
+    :param name: stage name
+    """
+    def decorator(method):
+        def wrapper(self, *args, **kwargs):
+            with metrics.stage(f"{self.LIBRARY_NAME}/{name}"):
+                return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorator
@@ -0,0 +1,38 @@
+from os import path, remove
+import json
+from .json_file import save_json
+
+
+class Journal:
+    def __init__(self, journal_path=None):
+        """
+        Write-ahead journal of planned tag edits. The plan is written before any file is saved and cleared once all
+        files are saved, so an interrupted run can be resumed or rolled back.
+        :param journal_path: path of the JSON journal, None keeps the journal in memory only
+        """
+        self.journal_path = journal_path
+        self._entries = []
+
+    def write(self, entries):
+        """
+        :param entries: list of JSON serializable dictionaries, one per planned file edit
+        """
+        self._entries = entries
+        if self.journal_path is None:
+            return
+
+        save_json(self.journal_path, entries, indent=2)
+
+    def load(self):
+        """
+        :return: list of planned file edits of an unfinished run (empty if the last run finished)
+        """
+        if self.journal_path is not None and path.exists(self.journal_path):
+            with open(self.journal_path, encoding='utf-8') as journal_file:
+                return json.load(journal_file)
+        return list(self._entries)
+
+    def clear(self):
+        self._entries = []
+        if self.journal_path is not None and path.exists(self.journal_path):
+            remove(self.journal_path)
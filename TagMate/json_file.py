@@ -0,0 +1,16 @@
+from os import replace
+import json
+
+
+def save_json(file_path, data, **dump_kwargs):
+    """
+    Write data to a temporary file and replace file_path with it, so an interrupted save leaves the previous file
+    intact.
+    :param file_path: path of the JSON file
+    :param data: JSON serializable data
+    :param dump_kwargs: keyword arguments of json.dump, e.g. indent
+    """
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, **dump_kwargs)
+    replace(temp_path, file_path)
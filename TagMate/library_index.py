@@ -0,0 +1,237 @@
+from music_tag import load_file
+from os import scandir, path
+from shutil import move
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from hashlib import sha1
+from collections import namedtuple
+from .instrumentation import metrics
+
+MUSIC_EXTENSIONS = ('mp3', 'aif', 'wav')
+
+# Artwork to copy from another music file when the edits are saved, so the image is not held in memory until then
+ArtworkSource = namedtuple('ArtworkSource', ['file_path'])
+
+
+def _raw_artwork(artwork):
+    """
+    :param artwork: raw image bytes, ArtworkSource or music_tag artwork item
+    :return: raw image bytes, or None if there is no artwork
+    """
+    if isinstance(artwork, ArtworkSource):
+        artwork = load_file(artwork.file_path)['artwork']
+    if isinstance(artwork, bytes):
+        return artwork
+    return artwork.first.raw if artwork.values else None
+
+
+def _artwork_hash(artwork):
+    """
+    :param artwork: raw image bytes or music_tag artwork item
+    :return: content hash of the image, or None if there is no artwork
+    """
+    artwork = _raw_artwork(artwork)
+    return sha1(artwork).hexdigest() if artwork else None
+
+
+def diff_tags(id3_object, edits):
+    """
+    :param id3_object: music_tag object
+    :param edits: dictionary of tag names and intended values
+    :return: dictionary of the edits that differ from the tags currently stored in the file
+    """
+    changed = {}
+    for tag, value in edits.items():
+        if tag == 'artwork':
+            if _artwork_hash(value) != _artwork_hash(id3_object[tag]):
+                changed[tag] = value
+        elif str(value) != str(id3_object[tag]):
+            changed[tag] = value
+    return changed
+
+
+def save_tags(file_path, edits):
+    """
+    Load a music file, apply the tag edits and save it, unless the file already has the intended tags.
+    Runs in a tag writer process.
+    :param file_path: path of music file
+    :param edits: dictionary of tag names and values (str or artwork bytes)
+    :return: tuple of file_path, whether the file was saved, and None or the error message if saving failed
+    """
+    try:
+        if isinstance(edits.get('artwork'), ArtworkSource):
+            edits = dict(edits, artwork=_raw_artwork(edits['artwork']))
+        id3_object = load_file(file_path)
+        changed = diff_tags(id3_object, edits)
+        if not changed:
+            return file_path, False, None
+        for tag, value in changed.items():
+            id3_object[tag] = value
+        id3_object.save()
+        return file_path, True, None
+    except Exception as e:
+        return file_path, False, f"{type(e).__name__}: {e}"
+
+
+class LibraryIndex:
+    def __init__(self, directory, extensions=MUSIC_EXTENSIONS, max_workers=4):
+        """
+        Scans a music directory once and groups the music files by track name (file name without extension).
+        Each file is loaded at most once, tag edits are kept pending and every file is saved once by flush().
+        :param directory: path of the music directory
+        :param extensions: music file extensions to index
+        :param max_workers: number of tag writer processes used by flush() (1 saves in this process)
+        """
+        self.directory = directory
+        self.max_workers = max_workers
+        self.errors = {}  # File path as key, error message of the last failed save as value
+        self.tracks = {}  # Track name as key, dictionary of extensions and file paths as value
+        self._loaded = {}  # File path as key, music_tag object as value
+        self._pending = {}  # File path as key, dictionary of pending tag edits as value
+        self._moves = {}  # File path as key, destination directory as value
+        self._artwork = {}  # Content hash as key, image bytes as value; identical pending covers share one object
+
+        with scandir(self.directory) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                stem, _, extension = entry.name.rpartition('.')
+                if entry.is_file() and extension in extensions:
+                    self.tracks.setdefault(stem, {})[extension] = entry.path
+
+    def files(self, extensions=MUSIC_EXTENSIONS):
+        """
+        :param extensions: extensions to include
+        :return: list of (track name, file path) tuples of all indexed files with one of the given extensions
+        """
+        return [(track_name, file_path) for track_name, files in self.tracks.items()
+                for extension, file_path in files.items() if extension in extensions]
+
+    def load(self, file_path):
+        """
+        :param file_path: path of an indexed music file
+        :return: music_tag object, loaded on first access
+        """
+        if file_path not in self._loaded:
+            self._loaded[file_path] = load_file(file_path)
+            metrics.count('files_loaded')
+        return self._loaded[file_path]
+
+    def get(self, file_path, tag):
+        """
+        :param file_path: path of an indexed music file
+        :param tag: music_tag tag name
+        :return: pending value of the tag, or the value stored in the file
+        """
+        pending = self._pending.get(file_path, {})
+        if tag in pending:
+            return pending[tag]
+        return self.load(file_path)[tag]
+
+    def get_artwork(self, file_path):
+        """
+        :param file_path: path of an indexed music file
+        :return: pending image bytes, an ArtworkSource if the artwork is stored in the file, or None if the file has
+        no artwork
+        """
+        artwork = self.get(file_path, 'artwork')
+        if isinstance(artwork, (bytes, ArtworkSource)):
+            return artwork
+        return ArtworkSource(file_path) if artwork.values else None
+
+    def set(self, file_path, tag, value):
+        """
+        Stage a tag edit, which is written by flush().
+        :param file_path: path of an indexed music file
+        :param tag: music_tag tag name
+        :param value: new tag value (artwork as image bytes or ArtworkSource)
+        """
+        if tag == 'artwork' and isinstance(value, bytes):
+            value = self._artwork.setdefault(sha1(value).hexdigest(), value)
+        self._pending.setdefault(file_path, {})[tag] = value
+
+    def release(self, file_path):
+        """
+        Drop the loaded music_tag object of a file, to keep memory flat while streaming over the library.
+        Pending edits are kept.
+        :param file_path: path of an indexed music file
+        """
+        self._loaded.pop(file_path, None)
+
+    def discard(self, file_path):
+        """
+        Drop the pending tag edits of a file (e.g. after tagging it failed halfway), the file is not saved.
+        :param file_path: path of an indexed music file
+        """
+        self._pending.pop(file_path, None)
+        self._loaded.pop(file_path, None)
+
+    def is_dirty(self, file_path):
+        """
+        :param file_path: path of an indexed music file
+        :return: True if the file has pending tag edits
+        """
+        return file_path in self._pending
+
+    def move(self, track_name, destination_dir):
+        """
+        Remove all versions of a track from the index. The files are moved to destination_dir by flush(), after
+        their pending tag edits are saved.
+        :param track_name: file name without extension
+        :param destination_dir: directory to move the files to
+        """
+        for file_path in self.tracks.pop(track_name, {}).values():
+            self._moves[file_path] = destination_dir
+
+    def flush(self):
+        """
+        Save every file with pending tag edits once, fanned out over a pool of tag writer processes, then move files
+        queued by move(). Files that already have the intended tags are not rewritten. Files that fail to save are
+        reported in self.errors and do not stop the other files. Files copying artwork from another file are saved
+        after all other files, so they read the final artwork of their source.
+        :return: list of paths of saved files (before moving)
+        """
+        pending = list(self._pending.items())
+        self._pending.clear()
+        self._loaded.clear()  # Workers load the files themselves, release them here
+        self._artwork.clear()
+
+        waves = [[(file_path, edits) for file_path, edits in pending
+                  if not isinstance(edits.get('artwork'), ArtworkSource)],
+                 [(file_path, edits) for file_path, edits in pending
+                  if isinstance(edits.get('artwork'), ArtworkSource)]]
+
+        saved_files = []
+        self.errors = {}
+        with tqdm(total=len(pending), desc="Saving tags", disable=not pending) as progress_bar:
+            if self.max_workers > 1 and len(pending) > 1:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    for wave in waves:
+                        futures = [executor.submit(save_tags, file_path, edits) for file_path, edits in wave]
+                        results = (future.result() for future in as_completed(futures))
+                        for file_path, saved, error in results:
+                            self._collect_result(file_path, saved, error, saved_files)
+                            progress_bar.update()
+            else:
+                for wave in waves:
+                    for file_path, edits in wave:
+                        self._collect_result(*save_tags(file_path, edits), saved_files)
+                        progress_bar.update()
+
+        if pending:
+            print(f"Saved tags of {len(saved_files)} files, {len(pending) - len(saved_files) - len(self.errors)} "
+                  f"files were already up to date.")
+
+        for file_path, destination_dir in self._moves.items():
+            if path.exists(file_path):
+                move(file_path, destination_dir)
+        self._moves.clear()
+        return saved_files
+
+    def _collect_result(self, file_path, saved, error, saved_files):
+        if saved:
+            saved_files.append(file_path)
+            metrics.count('files_saved')
+            metrics.count('bytes_rewritten', path.getsize(file_path))  # Saving rewrites the complete file
+        elif error is not None:
+            self.errors[file_path] = error
+            metrics.count('files_failed')
+            print(f"Warning: could not save tags of '{file_path}': {error}")
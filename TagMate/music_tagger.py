@@ -1,53 +1,164 @@
 from pathlib import Path
-from music_tag import load_file
-from urllib.request import urlretrieve
-from os import listdir, remove, path
-from genre_gui import GenreSelectionGUI
-from beatport_data import BeatportScraper
-import pandas as pd
-from shutil import move
-import tempfile
+from os import path, remove
+from .download_cache import ArtworkCache
+from .tag_state import TagState
+from .library_index import LibraryIndex
+from .journal import Journal
+from .tag_checkpoint import TagCheckpoint
+from .collection_index import CollectionIndex, track_identity, comment_condition, best_conditions
+from .instrumentation import metrics, timed_stage
+from .track_table import TrackRecord, write_tsv
+from .normalize import split_track_name
 
 
 class MusicTagger:
-    def __init__(self, local_dir, possible_mismatch_dir, collection_dir, library_name, mode):
+    def __init__(self, local_dir, possible_mismatch_dir, collection_dir, library_name, mode,
+                 beatport_workers=8, beatport_rate_limit=4, beatport_cache=None, artwork_cache=None,
+                 tag_state=None, primary_journal=None, tag_workers=4, match_threshold=90,
+                 collection_scan_cache=None, beatport_lookup=None, output_dir='../output', preview_cache=None,
+                 genre_feature_cache=None, genre_auto_apply_threshold=0.9, checkpoint=None, checkpoint_interval=200,
+                 collection_index=None, custom_genres_path=None):
         self.LOCAL_DIR = local_dir
         self.POSSIBLE_MISMATCH_DIR = possible_mismatch_dir
         self.COLLECTION_DIR = collection_dir
         self.LIBRARY_NAME = library_name
         self.MODE = mode
+        self.beatport_cache = beatport_cache
+        self.beatport_workers = beatport_workers
+        self.beatport_rate_limit = beatport_rate_limit
+        self.beatport_lookup = beatport_lookup  # Concurrent libraries share one lookup and its rate limiter
+        self.artwork_cache = artwork_cache if artwork_cache is not None else ArtworkCache()
+        self._own_artwork_cache = artwork_cache is None  # A shared cache is closed by its owner
+        self.preview_cache = preview_cache
+        self.genre_feature_cache = genre_feature_cache
+        self.genre_auto_apply_threshold = genre_auto_apply_threshold
+        self.custom_genres_path = custom_genres_path  # None uses the genre list installed with TagMate
+        self.tag_state = tag_state if tag_state is not None else TagState()
+        self.primary_journal = primary_journal if primary_journal is not None else Journal()
+        self.checkpoint = checkpoint if checkpoint is not None else TagCheckpoint()
+        self.checkpoint_interval = checkpoint_interval  # Tagged files between saves during the tag stage, 0 disables
+        self.tag_workers = tag_workers
+        self.match_threshold = match_threshold
+        self.collection_scan_cache = collection_scan_cache
+        self.collection_index = collection_index if collection_index is not None else CollectionIndex()
+        self.OUTPUT_DIR = output_dir
+        self.library_index = None
+        self.collection_reconciler = None
+        self._journal_written = False  # The primary journal is only cleared by a run that planned or rolled it back
+        self._stage_records = {}  # (file path, stage) as key, (key, tags) as value; recorded in tag_state by flush()
+        self._checkpoint_started = False  # The checkpoint run is only finished by a run that started it
+        self._tagged = []  # (track name, file path) of the files tagged since the last save, completed when saved
+        self._collection_edits = {}  # Collection file path as key, condition as value; set in the index by flush()
+        self._collection_index_updated = False
+
+    def _beatport_lookup(self):
+        """
+        :return: BeatportLookup shared by all batches, created on first use
+        """
+        if self.beatport_lookup is None:
+            from .beatport_lookup import BeatportLookup
+
+            self.beatport_lookup = BeatportLookup(max_workers=self.beatport_workers,
+                                                  requests_per_second=self.beatport_rate_limit,
+                                                  cache=self.beatport_cache)
+        return self.beatport_lookup
+
+    def _library(self):
+        """
+        :return: LibraryIndex of LOCAL_DIR shared by all stages, scanned on first use after each flush()
+        """
+        if self.library_index is None:
+            self.library_index = LibraryIndex(self.LOCAL_DIR, max_workers=self.tag_workers)
+            self.collection_reconciler = None  # A new batch sees the collection as it is now
+        return self.library_index
+
+    def _reconciler(self):
+        """
+        :return: CollectionReconciler shared by the genre model, the collection index and the reconcile stage, so the
+        collection is scanned once per batch
+        """
+        if self.collection_reconciler is None:
+            from .reconcile import CollectionReconciler
+
+            self.collection_reconciler = CollectionReconciler(self.COLLECTION_DIR,
+                                                              cache_path=self.collection_scan_cache,
+                                                              match_threshold=self.match_threshold)
+        return self.collection_reconciler
+
+    def _text_tags(self, path_to_file):
+        """
+        :param path_to_file: path of an indexed music file
+        :return: dictionary of the text tags handled by TagMate, including pending edits
+        """
+        library = self._library()
+        return {tag: str(library.get(path_to_file, tag)) for tag in ('tracktitle', 'artist', 'genre', 'comment')}
+
+    def _is_done(self, path_to_file, stage, key):
+        """
+        :return: True if the stage already ran on this file in an earlier run and no stage has edited it since
+        """
+        return not self._library().is_dirty(path_to_file) and self.tag_state.is_done(path_to_file, stage, key=key)
+
+    def _record(self, path_to_file, stage, key):
+        """
+        Remember which stage was applied to a file, it is written to the tag state after the file is saved.
+        """
+        self._stage_records[(path_to_file, stage)] = (key, self._text_tags(path_to_file))
+
+    def _stage_tags(self, path_to_file, stage):
+        """
+        :return: tag set applied by the stage, in this run or in an earlier run
+        """
+        if (path_to_file, stage) in self._stage_records:
+            return self._stage_records[(path_to_file, stage)][1]
+        return self.tag_state.stage_tags(path_to_file, stage)
+
+    def _tag_key(self, track_info):
+        """
+        The ISRC only selects how Beatport is searched, so it is left out: files tagged before it was added to the
+        Spotify data are not tagged (and reviewed) again.
+        :param track_info: Spotify data (TrackRecord) of the track, or None if the track is not in the playlist
+        :return: tag state key of the tag stage
+        """
+        if track_info is not None:
+            track_info = {field: track_info[field] for field in TrackRecord.FIELDS if field != 'isrc'}
+        return {'mode': self.MODE, 'spotify': track_info}
 
-    def _add_metadata_to_track(self, spotify_data, track_name, id3_tags):
+    def _add_metadata_to_track(self, spotify_data, track_name, path_to_file, beatport_info=None, genre=None):
         """
         Add metadata to an MP3 track.
 
         :param spotify_data: Dictionary containing Spotify music data
         :param track_name: Music file name, without extension
-        :param id3_tags: id3_object for editing tags
+        :param path_to_file: path of the MP3 file in the library index
+        :param beatport_info: Beatport result (or exception) resolved by the batch lookup stage, automatic mode only
+        :param genre: genre picked in the review queue, manual mode only
         """
         # Extract track information from Spotify data dictionary
         track_info = spotify_data[track_name]
+        library = self._library()
 
         # Add title & artist tags
-        id3_tags['tracktitle'] = track_info['tracktitle']
-        id3_tags['artist'] = track_info['artists']
-
-        # Add filler tags
-        id3_tags['genre'] = 'NA'
-        id3_tags['comment'] = ''
+        library.set(path_to_file, 'tracktitle', track_info['tracktitle'])
+        library.set(path_to_file, 'artist', track_info['artists'])
 
         # Genre
         move_file = False
         if self.MODE == 'manual':
-            manual_genre_selection = GenreSelectionGUI(track=track_name,
-                                                       preview_url=track_info['preview_url'],
-                                                       library=self.LIBRARY_NAME)
-            id3_tags['genre'] = manual_genre_selection.picked_genre
-            id3_tags['comment'] = f"/* {self.LIBRARY_NAME} */"
+            library.set(path_to_file, 'genre', genre)
+            library.set(path_to_file, 'comment', f"/* {self.LIBRARY_NAME} */")
         else:
             # Automatically add Beatport data (genre & label)
+            from .beatport_data import BeatportScraper, MIN_SIMILARITY_RATIO_ARTISTS, MIN_SIMILARITY_RATIO_TITLE, \
+                MIN_SIMILARITY_RATIO_MIX
+
             try:
-                beatport_info = BeatportScraper(track_name=track_name).scrape_track_data()
+                if beatport_info is None:
+                    beatport_info = BeatportScraper(track_name=track_name,
+                                                    cache=self.beatport_cache,
+                                                    isrc=track_info.get('isrc')).scrape_track_data()
+                elif isinstance(beatport_info, Exception):
+                    raise beatport_info
 
                 # Load string (scrape query) similarity ratios
                 similarity_ratio_artists = beatport_info['similarity_ratios']['similarity_ratio_artists']
@@ -55,229 +166,559 @@ class MusicTagger:
                 similarity_ratio_mix = beatport_info['similarity_ratios']['similarity_ratio_mix']
 
                 # Load genre and label name
-                id3_tags['genre'] = beatport_info['track_metadata']['query_genre_name']
+                library.set(path_to_file, 'genre', beatport_info['track_metadata']['query_genre_name'])
                 query_label_name = beatport_info['track_metadata']['query_label_name']
 
                 # Add comments
-                id3_tags['comment'] = f"/* {self.LIBRARY_NAME} / {query_label_name} */"
+                library.set(path_to_file, 'comment', f"/* {self.LIBRARY_NAME} / {query_label_name} */")
 
                 # Filter query tracks based on similarity ratios (confidence threshold)
-                if similarity_ratio_artists < 90 or similarity_ratio_mix < 70 or similarity_ratio_title < 70:
+                if (similarity_ratio_artists < MIN_SIMILARITY_RATIO_ARTISTS
+                        or similarity_ratio_mix < MIN_SIMILARITY_RATIO_MIX
+                        or similarity_ratio_title < MIN_SIMILARITY_RATIO_TITLE):
                     move_file = True
             except Exception as e:
                 raise Exception(f"Error getting Beatport data: {e}")
 
         # Add artwork (only works on .mp3 and .aif files)
-        artwork_url = track_info['img_url']
-        save_name = "./artwork_image.jfif"
-        urlretrieve(artwork_url, save_name)
+        library.set(path_to_file, 'artwork', self.artwork_cache.get(track_info['img_url']))
+
+        if move_file:
+            # Move all versions (mp3, aif, wav) of the track once the tags are saved
+            for music_file in library.tracks[track_name].values():
+                self.tag_state.forget(music_file)
+            library.move(track_name, self.POSSIBLE_MISMATCH_DIR)
+        else:
+            self._record(path_to_file, 'tag', key=self._tag_key(track_info))
 
-        with open(save_name, 'rb') as img_in:
-            id3_tags['artwork'] = img_in.read()
+    def _match_spotify_tracks(self, spotify_data):
+        """
+        Resolve MP3 files of which the name does not exactly match a Spotify track name with the fuzzy TrackMatcher.
+        :param spotify_data: dictionary generated by spotify_data.py
+        :return: Spotify data extended with the file names of fuzzy matched tracks as keys
+        """
+        unmatched = [track_name for track_name, _ in self._library().files(('mp3',)) if track_name not in spotify_data]
+        if not unmatched:
+            return spotify_data
 
-        art = id3_tags['artwork']
-        art.first.thumbnail([64, 64])
-        id3_tags.save()
-        remove(save_name)
+        from .track_matcher import TrackMatcher
 
-        if move_file:
-            # List of file extensions to check
-            extension_list = ['mp3', 'aif', 'wav']
+        matches = TrackMatcher(spotify_data.keys()).match(unmatched, threshold=self.match_threshold)
+        if matches:
+            write_tsv(f'{self.OUTPUT_DIR}/Fuzzy_matched_tracks.txt',
+                      ((track_name, spotify_track_name, round(score, 1))
+                       for track_name, (spotify_track_name, score) in matches.items()))
 
-            # Iterate over each extension and move the file if it exists
-            for extension in extension_list:
-                music_file = f"{self.LOCAL_DIR}/{track_name}.{extension}"
-                if move_file and path.exists(music_file):
-                    move(music_file, self.POSSIBLE_MISMATCH_DIR)
+        matched_spotify_data = dict(spotify_data)
+        for track_name, (spotify_track_name, score) in matches.items():
+            matched_spotify_data[track_name] = spotify_data[spotify_track_name]
+        return matched_spotify_data
 
-    def tag_music(self, spotify_data):
+    def _suggest_genres(self, spotify_data, mp3_files):
+        """
+        Rank the custom genres of the library for each track, with a model trained on the tags of the collection.
+        :param spotify_data: dictionary generated by spotify_data.py
+        :param mp3_files: list of (track name, file path) tuples
+        :return: tuple of dictionary with track name as key and list of (genre, probability) tuples as value, and
+        dictionary with track name as key and genre as value of the confident suggestions to apply without review
+        """
+        from .genre_model import GenreModel, CollectionFeatures, load_custom_genres, track_features
+
+        genre_lists = load_custom_genres(self.custom_genres_path).get(str(self.LIBRARY_NAME), {})
+        genres = [genre for genre_list in genre_lists.values() for genre in genre_list]
+        collection = CollectionFeatures(cache_path=self.genre_feature_cache,
+                                        beatport_cache=self.beatport_cache,
+                                        max_workers=self.tag_workers)
+        model = GenreModel(genres).fit(collection.samples(self._reconciler().scan_files()))
+
+        suggestions = {}
+        applied = {}
+        for track_name, _ in mp3_files:
+            if track_name in spotify_data:
+                artists, title = spotify_data[track_name]['artists'], spotify_data[track_name]['tracktitle']
+            else:
+                artists, _, title = track_name.partition(' - ')
+            features = track_features(artists, title, beatport_genre=collection.beatport_genre(track_name))
+            suggestions[track_name] = model.predict(features)
+            if self.genre_auto_apply_threshold:
+                genre = model.auto_genre(features, self.genre_auto_apply_threshold)
+                if genre is not None:
+                    applied[track_name] = genre
+        return suggestions, applied
+
+    def _review_genres(self, spotify_data, mp3_files, suggestions):
+        """
+        Pick the genres of all tracks in a single review window (manual mode).
+        :param spotify_data: dictionary generated by spotify_data.py
+        :param mp3_files: list of (track name, file path) tuples to review
+        :param suggestions: dictionary with track name as key and ranked (genre, probability) tuples as value
+        :return: dictionary with track name as key and picked genre as value, skipped tracks are left out
+        """
+        from .genre_gui import ReviewQueueGUI  # Imports tkinter, manual mode only
+
+        queue = [(track_name, spotify_data[track_name]['preview_url'] if track_name in spotify_data else None,
+                  suggestions.get(track_name, [])) for track_name, _ in mp3_files]
+        if not queue:
+            return {}
+        return ReviewQueueGUI(queue, library=str(self.LIBRARY_NAME), preview_cache=self.preview_cache,
+                              custom_genres_path=self.custom_genres_path).decisions
+
+    def _select_files(self, mp3_files, resume, retry_failed):
+        """
+        :param mp3_files: list of (track name, file path) tuples of the files that are not tagged yet
+        :param resume: only select the files of the interrupted run that were not completed
+        :param retry_failed: only select the files that failed in an earlier run
+        :return: list of selected (track name, file path) tuples, and dictionary with track name as key and the genre
+        picked in the interrupted run as value (resume only)
+        """
+        if resume:
+            unfinished = self.checkpoint.unfinished()
+            if not unfinished:
+                print("No interrupted tag run to resume.")
+            selected = [(track_name, path_to_file) for track_name, path_to_file in mp3_files
+                        if path.abspath(path_to_file) in unfinished]
+            return selected, {unfinished[path.abspath(path_to_file)]['track_name']:
+                              unfinished[path.abspath(path_to_file)]['genre'] for _, path_to_file in selected}
+
+        failed = self.checkpoint.failed()
+        if retry_failed:
+            if not failed:
+                print("No failed files to retry.")
+            return [(track_name, path_to_file) for track_name, path_to_file in mp3_files
+                    if path.abspath(path_to_file) in failed], {}
+
+        if self.checkpoint.unfinished():
+            print("Warning: the previous tag run was interrupted, its saved files are kept. Run with --resume to "
+                  "continue it with the genres picked in that run.")
+        if self.tag_state.force:
+            return mp3_files, {}
+        selected = [(track_name, path_to_file) for track_name, path_to_file in mp3_files
+                    if not self.checkpoint.is_failed(path_to_file)]
+        if len(selected) < len(mp3_files):
+            print(f"Skipped {len(mp3_files) - len(selected)} files that failed in an earlier run (see "
+                  f"Failed_tracks.txt), run with --retry-failed to tag them again.")
+        return selected, {}
+
+    @timed_stage('tag')
+    def tag_music(self, spotify_data, resume=False, retry_failed=False):
         """
         Add ID3 tags (Spotify and/or Beatport metadata) to the local music library files.
 
-        IMPORTANT: Filenames need to match 100% with the corresponding track name in your Spotify playlist.
+        Filenames should match the corresponding track name in your Spotify playlist. Filenames that do not match
+        exactly are matched fuzzily; matches above the confidence threshold are used and listed in
+        Fuzzy_matched_tracks.txt for review. Files tagged by an earlier run (unchanged file, same Spotify data) are
+        skipped.
+        A file that fails (e.g. no Beatport data or artwork) is left untagged and added to the dead-letter list of the
+        checkpoint, the other files are tagged. Tagged files are saved every checkpoint_interval files, so an
+        interrupted run keeps its progress. Unchanged files that failed before are skipped, unless retry_failed.
         :param spotify_data: dictionary generated by spotify_data.py
+        :param resume: only tag the remaining files of the interrupted run, with the genres picked in that run
+        :param retry_failed: only tag the files that failed in an earlier run
         """
-        mp3_files = [file for file in listdir(self.LOCAL_DIR) if file.endswith('.mp3')]
-
+        library = self._library()
+        spotify_data = self._match_spotify_tracks(spotify_data)
         not_on_spotify_list = []
-        for file in mp3_files:
-            path_to_file = path.join(self.LOCAL_DIR, file)
-            id3_object = load_file(path_to_file)  # music_tag object
-            track_name = Path(path_to_file).stem
-
-            # Add metadata to tracks
-            if track_name in spotify_data:
-                self._add_metadata_to_track(spotify_data=spotify_data,
-                                            track_name=track_name,
-                                            id3_tags=id3_object)
-            else:
-                # add metadata and export track names that are missing in Spotify playlist
-                id3_object['artist'] = track_name.split(' - ')[0]
-                id3_object['tracktitle'] = track_name.split(' - ')[1]
-                id3_object['comment'] = ''
-
-                if self.MODE == 'manual':
-                    preview_and_choose = GenreSelectionGUI(track=track_name,
-                                                           preview_url='None',
-                                                           library=str(self.LIBRARY_NAME))
-                    id3_object['genre'] = preview_and_choose.picked_genre
-                    id3_object['comment'] = f"/* {str(self.LIBRARY_NAME)} */"
+        mp3_files = []
+        for track_name, path_to_file in library.files(('mp3',)):
+            key = self._tag_key(spotify_data.get(track_name))
+            if self._is_done(path_to_file, 'tag', key=key):
+                if track_name not in spotify_data:
+                    not_on_spotify_list.append(track_name)
+                continue
+            mp3_files.append((track_name, path_to_file))
+        mp3_files, resumed_genres = self._select_files(mp3_files, resume, retry_failed)
+
+        # Download all artwork in the background while tracks are looked up and tagged
+        self.artwork_cache.prefetch([spotify_data[track_name]['img_url'] for track_name, _ in mp3_files
+                                     if track_name in spotify_data])
+
+        # Resolve Beatport metadata for all tracks on Spotify before any tags are written
+        beatport_results = {}
+        if self.MODE != 'manual':
+            track_names = [track_name for track_name, _ in mp3_files if track_name in spotify_data]
+            with metrics.stage(f"{self.LIBRARY_NAME}/tag/beatport"):
+                isrcs = [spotify_data[track_name].get('isrc') for track_name in track_names]
+                beatport_results = dict(zip(track_names, self._beatport_lookup().resolve(track_names, isrcs)))
+
+        # Pick all genres first, the decisions are committed together below. Confident suggestions are applied
+        # directly, only the other tracks are reviewed. A resumed run keeps the genres picked before it was interrupted
+        genre_decisions = {}
+        if self.MODE == 'manual' and resume:
+            genre_decisions = {track_name: genre for track_name, genre in resumed_genres.items() if genre is not None}
+        elif self.MODE == 'manual' and mp3_files:
+            with metrics.stage(f"{self.LIBRARY_NAME}/tag/suggest"):
+                suggestions, applied = self._suggest_genres(spotify_data, mp3_files)
+            to_review = [(track_name, path_to_file) for track_name, path_to_file in mp3_files
+                         if track_name not in applied]
+            print(f"Applied suggested genre to {len(applied)} tracks, {len(to_review)} tracks to review.")
+            with metrics.stage(f"{self.LIBRARY_NAME}/tag/review"):
+                genre_decisions = {**applied, **self._review_genres(spotify_data, to_review, suggestions)}
+
+            # Suggestion, probability and outcome per track: applied, accepted (in review), corrected or skipped
+            suggestion_report = []
+            for track_name, ranked in suggestions.items():
+                if not ranked:
+                    continue
+                if track_name in applied:
+                    outcome = 'applied'
+                elif track_name not in genre_decisions:
+                    outcome = 'skipped'
+                else:
+                    outcome = 'accepted' if genre_decisions[track_name] == ranked[0][0] else 'corrected'
+                suggestion_report.append((track_name, ranked[0][0], round(ranked[0][1], 3), outcome))
+            if suggestion_report:
+                write_tsv(f'{self.OUTPUT_DIR}/Genre_suggestions.txt', suggestion_report)
+
+        for track_name, path_to_file in mp3_files:
+            if self.MODE == 'manual' and track_name not in genre_decisions:
+                print(f"Warning: no genre picked for '{track_name}', it is left untagged until the next run.")
+        mp3_files = [(track_name, path_to_file) for track_name, path_to_file in mp3_files
+                     if self.MODE != 'manual' or track_name in genre_decisions]
+
+        # The plan of the run, an interrupted run is resumed from it
+        self.checkpoint.start({path_to_file: {'track_name': track_name, 'genre': genre_decisions.get(track_name)}
+                               for track_name, path_to_file in mp3_files})
+        self._checkpoint_started = True
+
+        for track_name, path_to_file in mp3_files:
+            try:
+                # Add metadata to tracks
+                if track_name in spotify_data:
+                    self._add_metadata_to_track(spotify_data=spotify_data,
+                                                track_name=track_name,
+                                                path_to_file=path_to_file,
+                                                beatport_info=beatport_results.get(track_name),
+                                                genre=genre_decisions.get(track_name))
                 else:
-                    id3_object['comment'] = f"/* {str(self.LIBRARY_NAME)} / NA */"
+                    # add metadata and export track names that are missing in Spotify playlist
+                    artists, title = split_track_name(track_name)
+                    library.set(path_to_file, 'artist', artists)
+                    library.set(path_to_file, 'tracktitle', title)
+
+                    if self.MODE == 'manual':
+                        library.set(path_to_file, 'genre', genre_decisions[track_name])
+                        library.set(path_to_file, 'comment', f"/* {str(self.LIBRARY_NAME)} */")
+                    else:
+                        library.set(path_to_file, 'comment', f"/* {str(self.LIBRARY_NAME)} / NA */")
+
+                    self._record(path_to_file, 'tag', key=self._tag_key(None))
+                    print(f"Warning: '{track_name}' not found in Spotify playlist.")
+                    not_on_spotify_list.append(track_name)
+            except Exception as e:
+                # Leave this file untagged, the other files of the batch are tagged
+                library.discard(path_to_file)
+                self._stage_records.pop((path_to_file, 'tag'), None)
+                self.checkpoint.fail(path_to_file, track_name, 'tag', str(e))
+                print(f"Warning: could not tag '{track_name}': {e}")
+                continue
 
-                id3_object.save()
-                print(f"Warning: '{track_name}' not found in Spotify playlist.")
-                not_on_spotify_list.append(track_name)
+            self._tagged.append((track_name, path_to_file))
+            if self.checkpoint_interval and len(self._tagged) >= self.checkpoint_interval:
+                self._save_checkpoint(self._save())
 
-            if len(not_on_spotify_list) > 0:
-                pd.DataFrame(not_on_spotify_list).to_csv('../output/Tagged_tracks_not_in_Spotify_playlist.txt',
-                                                         sep='\t', header=False)
+        if len(not_on_spotify_list) > 0:
+            write_tsv(f'{self.OUTPUT_DIR}/Tagged_tracks_not_in_Spotify_playlist.txt', not_on_spotify_list)
 
-    def _extract_mp3_info(self):
+    def _update_collection_index(self):
         """
-        Stores ID3 tags from MP3 files into dictionary.
-        :return: dictionary storing MP3 track metadata
+        Add the files that are new in the collection directory to the collection index, once per flush.
         """
-        mp3_info = {}
-
-        mp3_files = [file for file in listdir(self.LOCAL_DIR) if file.endswith('.mp3')]
-        for file in mp3_files:
-            path_to_file = path.join(self.LOCAL_DIR, file)
-            id3_object = load_file(path_to_file)
-            track_name = Path(path_to_file).stem
+        if self._collection_index_updated:
+            return
 
-            mp3_info[track_name] = {
-                'tracktitle': str(id3_object['tracktitle']),
-                'artist': str(id3_object['artist']),
-                'genre': str(id3_object['genre']),
-                'comment': str(id3_object['comment']),
-                'artwork': id3_object['artwork'],
-            }
-        return mp3_info
+        self.collection_index.update(self._reconciler().scan_folders())
+        self._collection_index_updated = True
 
-    def _transfer_tags_to_wav_and_aif(self, mp3_info):
+    def _collection_mp3(self, path_to_file):
+        """
+        :param path_to_file: path of a local AIF or WAV file
+        :return: path of an MP3 version of the same track in the collection directory, or None
         """
-        Transfer tags from MP3 files to AIF and/or WAV files.
+        self._update_collection_index()
+        mp3_paths = [mp3_path for mp3_path, entry in self.collection_index.files(track_identity(path_to_file)).items()
+                     if entry['format'] == 'mp3']
+        return min(mp3_paths) if mp3_paths else None
 
-        :param mp3_info: dictionary storing MP3 track metadata
+    def _transfer_key(self, mp3_path):
         """
-        wav_and_aif_files = [file for file in listdir(self.LOCAL_DIR) if file.endswith(('.aif', '.wav'))]
-        for file in wav_and_aif_files:
-            path_to_file = path.join(self.LOCAL_DIR, file)
-            id3_object = load_file(path_to_file)
-            track_name = Path(path_to_file).stem
+        :param mp3_path: path of the source MP3 file
+        :return: tag set the tag stage applied to the MP3, or its content hash if it was tagged outside TagMate
+        """
+        return self._stage_tags(mp3_path, 'tag') or self.tag_state.current_hash(mp3_path)
 
-            if track_name in mp3_info:
-                id3_object['tracktitle'] = mp3_info[track_name]['tracktitle']
-                id3_object['artist'] = mp3_info[track_name]['artist']
-                id3_object['genre'] = mp3_info[track_name]['genre']
-                id3_object['comment'] = mp3_info[track_name]['comment']
-                id3_object['artwork'] = mp3_info[track_name]['artwork']
-                id3_object.save()
+    def _transfer_tags_to_wav_and_aif(self, mp3_path, target_paths):
+        """
+        Transfer tags from an MP3 file to its AIF and/or WAV versions. The MP3 is released after reading, and artwork
+        stored in the MP3 is copied by reference when the tags are saved, so memory does not grow with the batch.
 
+        :param mp3_path: path of the source MP3 file
+        :param target_paths: paths of the AIF and/or WAV versions of the same track
+        """
+        library = self._library()
+        transfer_key = self._transfer_key(mp3_path)
+        for path_to_file in target_paths:
+            if self._is_done(path_to_file, 'transfer', key=transfer_key):
+                continue
+            library.set(path_to_file, 'tracktitle', str(library.get(mp3_path, 'tracktitle')))
+            library.set(path_to_file, 'artist', str(library.get(mp3_path, 'artist')))
+            library.set(path_to_file, 'genre', str(library.get(mp3_path, 'genre')))
+            library.set(path_to_file, 'comment', str(library.get(mp3_path, 'comment')))
+            artwork = library.get_artwork(mp3_path)
+            if artwork is not None:
+                library.set(path_to_file, 'artwork', artwork)
+            self._record(path_to_file, 'transfer', key=transfer_key)
+        library.release(mp3_path)
+
+    @timed_stage('transfer')
     def transfer_tags(self):
         """
         The MP3 is the most common audio file available and MP3 files have a standardized and embedded way of
         storing metadata through ID3 tags. I typically store two versions of a track in my music library: MP3 and AIF.
         To circumvent redundant tagging of these versions, I first tag the MP3 files and then transfer the tags to AIF
         or WAV files. I use AIF because WAV does not allow artwork images to be stored.
+        Tags are transferred one MP3 and AIF/WAV pair at a time. An AIF/WAV file without a local MP3 gets the tags of
+        the MP3 version in the collection directory, if there is one.
         """
-        mp3_info = self._extract_mp3_info()
-        self._transfer_tags_to_wav_and_aif(mp3_info)
-
-    def reveal_missing_local_tracks(self, spotify_data):
+        for track_name, files in self._library().tracks.items():
+            target_paths = [files[extension] for extension in ('aif', 'wav') if extension in files]
+            if not target_paths:
+                continue
+            mp3_path = files['mp3'] if 'mp3' in files else self._collection_mp3(target_paths[0])
+            if mp3_path is not None:
+                self._transfer_tags_to_wav_and_aif(mp3_path, target_paths)
+
+    @timed_stage('reconcile')
+    def reconcile_collection(self, spotify_data):
         """
-        Compare music playlist from Spotify with the local directory to reveal missing tracks in the local directory.
+        Compare the music playlist from Spotify with the collection directory (including subfolders) to reveal tracks
+        missing in the collection, tracks missing in the Spotify playlist, and pairs of those that are probably the
+        same track under a different name. Writes Collection_reconciliation.json and Collection_reconciliation.txt.
 
         :param spotify_data: Dictionary of Spotify music data.
+        :return: reconciliation report dictionary
         """
-        local_tracks = {Path(file).stem for file in Path(self.COLLECTION_DIR).iterdir() if file.is_file()}
-        missing_tracks = [track for track in spotify_data.keys() if track not in local_tracks]
-
-        if missing_tracks:
-            pd.DataFrame(missing_tracks).to_csv('../output/Missing_tracks_in_local_collection.txt', sep='\t',
-                                                header=False)
+        reconciler = self._reconciler()
+        report = reconciler.reconcile(spotify_data)
+        reconciler.write_report(report, f'{self.OUTPUT_DIR}/Collection_reconciliation')
+        return report
 
-    def reveal_missing_spotify_tracks(self, spotify_data):
+    def _primary_or_substitute_comment(self, comment, condition):
         """
-        Compare local tracks with the music playlist from Spotify to reveal missing tracks in the Spotify dictionary.
-
-        :param spotify_data: Dictionary of Spotify music data.
+        :param comment: current comment of the music file
+        :param condition: 'Primary' or 'Substitute' tag
+        :return: comment including the condition
         """
-        local_tracks = {Path(file).stem for file in Path(self.COLLECTION_DIR).iterdir() if file.is_file()}
-        missing_tracks = [track for track in local_tracks if track not in spotify_data.keys()]
-
-        if missing_tracks:
-            pd.DataFrame(missing_tracks).to_csv('../output/Missing_tracks_in_Spotify_playlist.txt', sep='\t',
-                                                header=False)
+        # Extract relevant information from the comment, dropping a condition set by an earlier run
+        comment_parts = [s.strip("/* ").strip(" */") for s in comment.split(' / ')]
+        if len(comment_parts) >= 2 and comment_parts[1] in ("Primary", "Substitute"):
+            del comment_parts[1]
+
+        # Tag comment according to the presence of record label information
+        if comment_parts[0] == self.LIBRARY_NAME and len(comment_parts) == 2:
+            # Comment = /* LIBRARY_NAME / Primary or Substitute / Record label name */
+            return f"/* {comment_parts[0]} / {condition} / {comment_parts[1]} */"
+        elif comment_parts[0] == self.LIBRARY_NAME and len(comment_parts) == 1:
+            # Comment = /* LIBRARY_NAME / Primary or Substitute */
+            return f"/* {comment_parts[0]} / {condition} */"
+        else:
+            raise ValueError(f"Unexpected comment '{comment}', expected '/* {self.LIBRARY_NAME} [/ label] */'")
 
-    def _tag_primary_or_substitute_tracks(self, local_directory, condition):
+    def _plan_primary_or_substitute_tracks(self):
         """
         MP3 files use lossy compression, sacrificing some audio quality for reduced file size,
         while AIFF/WAV files are uncompressed, preserving higher sound quality but resulting in larger file sizes.
         If both MP3 and AIF/WAV versions exist, mark the AIF/WAV file as 'Primary' for higher sound quality. Otherwise,
         if only the MP3 file exists tag this MP3 file as 'Primary'.
+        Versions already in the collection directory count as well: the tracks of the local files, and the tracks of
+        which versions were added to or removed from the collection since the last run, are evaluated over the local
+        and collection versions together, and collection files with an outdated condition are corrected.
 
-        :param local_directory: path of directory of tracks that requires tagging
-        :param condition: 'Primary' or 'Substitute' tag
+        :return: list of planned comment edits (path, condition, old_comment, new_comment, collection), for files
+        that require tagging
         """
-        files = [file for file in listdir(local_directory) if file.endswith(('.mp3', '.aif', '.wav'))]
-
-        for file in files:
-            path_to_file = path.join(local_directory, file)
-            id3_object = load_file(path_to_file)
-
-            # Extract relevant information from the comment
-            comment = str(id3_object['comment'])
-            comment_parts = [s.strip("/* ").strip(" */") for s in comment.split(' / ')]
-
-            # Tag comment according to the presence of record label information
-            if comment_parts[0] == self.LIBRARY_NAME and len(comment_parts) == 2:
-                # Comment = /* LIBRARY_NAME / Primary or Substitute / Record label name */
-                id3_object['comment'] = f"/* {comment_parts[0]} / {condition} / {comment_parts[1]} */"
-            elif comment_parts[0] == self.LIBRARY_NAME and len(comment_parts) == 1:
-                # Comment = /* LIBRARY_NAME / Primary or Substitute */
-                id3_object['comment'] = f"/* {comment_parts[0]} / {condition} */"
-            else:
-                raise ValueError
-
-            id3_object.save()
-
+        library = self._library()
+        self._update_collection_index()
+        changed_tracks = self.collection_index.take_changed()
+
+        local_tracks = {}  # Identity as key, dictionary of local file paths and extensions as value
+        for files in library.tracks.values():
+            for extension, path_to_file in files.items():
+                local_tracks.setdefault(track_identity(path_to_file), {})[path_to_file] = extension
+
+        plan = []
+        for identity in [*local_tracks, *sorted(changed_tracks - local_tracks.keys())]:
+            local_files = local_tracks.get(identity, {})
+            collection_files = self.collection_index.files(identity)
+            conditions = best_conditions({**local_files, **{path_to_file: entry['format']
+                                                            for path_to_file, entry in collection_files.items()}})
+
+            for path_to_file in local_files:
+                condition = conditions[path_to_file]
+                if self._is_done(path_to_file, 'primary', key=condition):
+                    continue
+                self._plan_condition(plan, path_to_file, condition)
+
+            for path_to_file, entry in collection_files.items():
+                condition = conditions[path_to_file]
+                if entry['condition'] == condition:
+                    continue
+                self._plan_condition(plan, path_to_file, condition, collection=True)
+        return plan
+
+    def _plan_condition(self, plan, path_to_file, condition, collection=False):
+        """
+        Add the comment edit marking a file as Primary or Substitute to the plan, unless its comment already has it.
+        :param plan: list of planned comment edits
+        :param path_to_file: path of a local or collection music file
+        :param condition: 'Primary' or 'Substitute'
+        :param collection: True if the file is in the collection directory (its condition is kept in the index)
+        """
+        library = self._library()
+        comment = str(library.get(path_to_file, 'comment'))
+        library.release(path_to_file)
+        if collection:
+            self.collection_index.set_condition(path_to_file, comment_condition(comment))
+            if comment_condition(comment) == condition:
+                return
+
+        try:
+            new_comment = self._primary_or_substitute_comment(comment, condition)
+        except ValueError as e:  # Not tagged yet, e.g. skipped in the review queue
+            print(f"Warning: '{path_to_file}' is not marked as {condition}: {e}")
+            return
+        plan.append({
+            'path': path_to_file,
+            'condition': condition,
+            'old_comment': comment,
+            'new_comment': new_comment,
+            'collection': collection,
+        })
+
+    def _journal_entries(self):
+        """
+        :return: planned comment edits of an interrupted run, of the files that still exist
+        """
+        library = self._library()
+        for entry in self.primary_journal.load():
+            if entry.get('collection'):
+                if path.exists(entry['path']):
+                    yield entry
+                continue
+            track_name = Path(entry['path']).stem
+            if entry['path'] in library.tracks.get(track_name, {}).values():
+                yield entry
+
+    def _resume_primary_or_substitute_journal(self):
+        """
+        Re-apply the planned comments of an interrupted run that were not saved yet.
+        """
+        library = self._library()
+        for entry in self._journal_entries():
+            if str(library.get(entry['path'], 'comment')) == entry['old_comment']:
+                library.set(entry['path'], 'comment', entry['new_comment'])
+                if entry.get('collection'):
+                    self._collection_edits[entry['path']] = entry['condition']
+
+    @timed_stage('rollback')
+    def rollback_primary_or_substitute_journal(self):
+        """
+        Restore the comments of an interrupted run to their value before process_primary_or_substitute_tracks.
+        """
+        library = self._library()
+        for entry in self._journal_entries():
+            if str(library.get(entry['path'], 'comment')) == entry['new_comment']:
+                library.set(entry['path'], 'comment', entry['old_comment'])
+                if entry.get('collection'):
+                    self._collection_edits[entry['path']] = None  # Read again on the next evaluation
+        self._journal_written = True
+        self.flush()
+
+    @timed_stage('primary')
     def process_primary_or_substitute_tracks(self):
         """
         If both MP3 and AIF/WAV versions exist, mark the AIF/WAV file as 'Primary' for higher sound quality. Otherwise,
         if only the MP3 file exists tag this MP3 file as 'Primary'. When both exist, tag the lower quality MP3 file
-        as 'Substitute'. This function sorts the files that need to be tagged accordingly.
+        as 'Substitute'. Versions in the collection directory are included (see the collection index), so an AIF
+        arriving for an MP3 already in the collection also marks that MP3 as 'Substitute'. The plan of conditions is
+        computed for all files first and written to a journal, then applied in place (saved by flush). Files that
+        already carry the right condition from an earlier run are skipped.
         """
-        with tempfile.TemporaryDirectory() as temp_dir:
-            track_extensions = {}  # Dictionary to store filenames without extensions as keys and extensions as values
-            files = [file for file in listdir(self.LOCAL_DIR) if file.endswith(('.mp3', '.aif', '.wav'))]
+        self._resume_primary_or_substitute_journal()
+        plan = self._plan_primary_or_substitute_tracks()
+        self.primary_journal.write(plan)
+        self._journal_written = True
+
+        library = self._library()
+        for entry in plan:
+            library.set(entry['path'], 'comment', entry['new_comment'])
+            if entry['collection']:
+                self._collection_edits[entry['path']] = entry['condition']
+            else:
+                self._record(entry['path'], 'primary', key=entry['condition'])
 
-            for file in files:
-                track_name = Path(file).stem
-                extension = file.split('.')[-1]
+    def _save(self):
+        """
+        Save all pending tag edits with a single save per file, move possible mismatches and update the tag state.
+        :return: dictionary with file path as key and error message as value, for the files that failed to save
+        """
+        self.library_index.flush()
+        errors = self.library_index.errors
+        for (path_to_file, stage), (key, tags) in self._stage_records.items():
+            if path.exists(path_to_file) and path_to_file not in errors:
+                self.tag_state.record(path_to_file, stage, key=key, tags=tags)
+        self._stage_records.clear()
+        self.tag_state.save()
+        return errors
+
+    def _save_checkpoint(self, errors):
+        """
+        Mark the files tagged since the last save as completed, or as failed if they could not be saved.
+        :param errors: dictionary with file path as key and error message as value, returned by _save()
+        """
+        for track_name, path_to_file in self._tagged:
+            if path_to_file in errors:
+                self.checkpoint.fail(path_to_file, track_name, 'save', errors[path_to_file])
+            else:
+                self.checkpoint.complete([path_to_file])
+        self._tagged.clear()
+        self.checkpoint.save()
 
-                if track_name in track_extensions:
-                    track_extensions[track_name].append(extension)
-                else:
-                    track_extensions[track_name] = [extension]
-
-            # Move substitute files to temporary directory
-            for track, extensions in track_extensions.items():
-                if len(extensions) >= 2 and "mp3" in extensions:
-                    file_name = f"{track}.mp3"
-                    source_path = path.join(self.LOCAL_DIR, file_name)
-                    destination_path = path.join(temp_dir, file_name)
-                    move(source_path, destination_path)
-
-            # Process files in the temporary directory
-            self._tag_primary_or_substitute_tracks(temp_dir, "Substitute")
-
-            # Process files in the local directory
-            self._tag_primary_or_substitute_tracks(self.LOCAL_DIR, "Primary")
-
-            # Move files back to the original directory
-            for file in listdir(temp_dir):
-                source_path = Path(temp_dir) / file
-                destination_path = Path(self.LOCAL_DIR) / file
-                move(source_path, destination_path)
+    @timed_stage('flush')
+    def flush(self):
+        """
+        Save all pending tag edits with a single save per file, move possible mismatches and update the tag state.
+        Finishes the checkpoint of the tag stage and writes Failed_tracks.txt if files failed, and saves the conditions
+        of edited collection files in the collection index.
+        """
+        if self.library_index is None:
+            return
+
+        errors = self._save()
+        if self._collection_index_updated or self._collection_edits:
+            for path_to_file, condition in self._collection_edits.items():
+                self.collection_index.set_condition(path_to_file, None if path_to_file in errors else condition)
+            self._collection_edits.clear()
+            self.collection_index.save()
+            self._collection_index_updated = False
+        if self._checkpoint_started:
+            self._save_checkpoint(errors)
+            self.checkpoint.finish()
+            self._checkpoint_started = False
+            failed_report = f'{self.OUTPUT_DIR}/Failed_tracks.txt'
+            if self.checkpoint.failed():
+                self.checkpoint.export_failed(failed_report)
+                print(f"{len(self.checkpoint.failed())} files could not be tagged, see Failed_tracks.txt.")
+            elif path.exists(failed_report):
+                remove(failed_report)  # All failures were resolved
+        if self._journal_written and not errors:
+            self.primary_journal.clear()  # Otherwise keep the plan, so the next run resumes the failed files
+            self._journal_written = False
+        self.library_index = None
+
+    def close(self):
+        """
+        Stop the downloads of the artwork cache created by this MusicTagger. A shared artwork cache is closed by its
+        owner (cli.Runner).
+        """
+        if self._own_artwork_cache:
+            self.artwork_cache.close()
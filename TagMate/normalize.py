@@ -0,0 +1,109 @@
+from collections import namedtuple
+from functools import lru_cache
+from re import compile, IGNORECASE
+from unidecode import unidecode
+
+# Track name rules shared by SpotifyData (file names), BeatportScraper (queries and matching), MusicTagger and
+# TrackMatcher. Patterns and translate tables are compiled once, results are memoized per string.
+MEMO_SIZE = 65536  # Maximum number of strings remembered per function
+
+ILLEGAL_CHARACTERS = '\\/:*?"<>|'  # Not allowed in file names
+ILLEGAL_CHARACTERS_TABLE = str.maketrans('', '', ILLEGAL_CHARACTERS)
+MULTIPLE_SPACES_PATTERN = compile(' +')
+WHITESPACE_PATTERN = compile(r'\s+')
+NON_ALPHABET_PATTERN = compile(r'[^a-zA-Z\s]')
+NON_ALPHANUMERIC_PATTERN = compile(r'[^a-z0-9]+')
+FEATURING_PATTERN = compile(r'\s*[(\[]\s*(feat|ft|featuring)\.?\s[^)\]]*[)\]]', IGNORECASE)
+VERSION_TYPE_PATTERN = compile(r'\((?!feat\.)[^)]*(Mix|Remix)[^)]*\)')  # Parenthesized "Mix" or "Remix", not "feat."
+MIX_PARENTHESES_PATTERN = compile(r'\([^)]*ix[^)]*\)\s*')
+EDIT_PARENTHESES_PATTERN = compile(r'\([^)]*edit[^)]*\)\s*')
+
+TrackNameParts = namedtuple('TrackNameParts', ['artists', 'title', 'version_type'])
+
+
+def split_track_name(track_name):
+    """
+    :param track_name: Full track name, 'Artists - Title (Version type)'
+    :return: tuple of artists and title (including version type), the title is empty if there is no ' - '
+    """
+    artists, _, title = track_name.partition(' - ')
+    return artists, title
+
+
+def spotify_title(title):
+    """
+    :param title: Spotify track title, e.g. 'Title - Artist Remix'
+    :return: title with the version type in parentheses, e.g. 'Title (Artist Remix)'
+    """
+    if " - " in title:  # reformat remix titles etc.
+        return title.replace("- ", "(") + ")"
+    return title
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def sanitize_file_name(name):
+    """
+    :param name: track name
+    :return: name without the characters that are illegal in file names and without double spaces
+    """
+    name = name.translate(ILLEGAL_CHARACTERS_TABLE)
+    return MULTIPLE_SPACES_PATTERN.sub(' ', name) if '  ' in name else name
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def transliterate(text):
+    """
+    :param text: any text, e.g. artist names of a Beatport search result
+    :return: lowercase ASCII transliteration of the text
+    """
+    return unidecode(text).lower()
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def format_query(track_name):
+    """
+    Step1: Remove non-alphabet characters (except spaces)
+    Step2: Replace one or more spaces with a single space
+    Step3: Replace single spaces with '+'
+    :param track_name: Full track name, including artists, title, and version type
+    :return: Beatport search query string (also the key of the Beatport cache)
+    """
+    return WHITESPACE_PATTERN.sub(' ', NON_ALPHABET_PATTERN.sub('', track_name)).replace(' ', '+')
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def title_without_version(title):
+    """
+    :param title: track title, including version type, e.g. 'Title (Extended Mix)'
+    :return: lowercase title without mix and edit parentheses, e.g. 'title'
+    """
+    return EDIT_PARENTHESES_PATTERN.sub('', MIX_PARENTHESES_PATTERN.sub('', title.lower())).rstrip()
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def parse_track_name(track_name):
+    """
+    Extract artists, title, and track version type (e.g. Original Mix or Remix) from track name, for comparison with
+    Beatport search results.
+    :param track_name: Full track name, including artists, title, and version type
+    :return: TrackNameParts: lowercase transliterated artists, lowercase title without mix and edit parentheses, and
+    version type without parentheses (or None)
+    """
+    artists, title = split_track_name(track_name)
+    title = title_without_version(title)
+    match = VERSION_TYPE_PATTERN.search(track_name)
+    version_type = match.group().replace('(', '').replace(')', '') if match else None
+    return TrackNameParts(transliterate(artists.lower()), title, version_type)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def normalize_track_name(track_name):
+    """
+    Normalize a track name for matching: transliterate accents, drop '(feat. ...)' parts, lowercase and replace
+    punctuation by single spaces. The characters that are illegal in file names are removed first, as in file names,
+    so a Spotify track name and its sanitized file name normalize to the same string (e.g. 'AC/DC' and 'ACDC').
+    :param track_name: Full track name, including artists, title, and version type
+    :return: normalized track name
+    """
+    track_name = FEATURING_PATTERN.sub('', unidecode(track_name).translate(ILLEGAL_CHARACTERS_TABLE))
+    return NON_ALPHANUMERIC_PATTERN.sub(' ', track_name.lower()).strip()
@@ -0,0 +1,127 @@
+from os import scandir, stat, path
+from .library_index import MUSIC_EXTENSIONS
+from .instrumentation import metrics
+from .json_file import save_json
+from .track_table import write_tsv
+import json
+
+SCAN_CACHE_VERSION = 2  # Scan caches of an older version are rescanned (version 2: listings include all files)
+
+
+class CollectionReconciler:
+    def __init__(self, collection_dir, cache_path=None, match_threshold=90):
+        """
+        Compares the music collection (including subfolders) with the Spotify playlist in a single scan.
+        The file listing of every folder is cached and only rescanned when the folder was modified. The collection is
+        scanned once per reconciler, create a new one to see later changes.
+        :param collection_dir: path of the collection directory
+        :param cache_path: path of the JSON scan cache, None disables caching
+        :param match_threshold: minimum similarity score (0-100) for the 'probably the same track' bucket
+        """
+        self.collection_dir = collection_dir
+        self.cache_path = cache_path
+        self.match_threshold = match_threshold
+        self._cache = {}  # Folder path as key, mtime, file names and subfolder names as value
+        self._scanned = None  # Listings of the scan of this reconciler, as self._cache
+
+        if self.cache_path is not None and path.exists(self.cache_path):
+            with open(self.cache_path, encoding='utf-8') as cache_file:
+                cache = json.load(cache_file)
+            if cache.get('version') == SCAN_CACHE_VERSION:
+                self._cache = cache['folders']
+
+    def _scan_folder(self, folder, scanned):
+        """
+        :param folder: path of folder to scan
+        :param scanned: dictionary collecting the listing of every scanned folder
+        :return: True if the folder or one of its subfolders was modified since it was cached
+        """
+        mtime = stat(folder).st_mtime_ns
+        listing = self._cache.get(folder)
+        modified = listing is None or listing['mtime'] != mtime
+        metrics.cache('collection_scan', hit=not modified)
+        if modified:
+            listing = {'mtime': mtime, 'files': [], 'folders': []}
+            with scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        listing['folders'].append(entry.name)
+                    elif entry.is_file():
+                        listing['files'].append(entry.name)
+
+        scanned[folder] = listing
+        for subfolder in listing['folders']:
+            modified |= self._scan_folder(path.join(folder, subfolder), scanned)
+        return modified
+
+    def scan_folders(self):
+        """
+        Scan the collection on first use, the cache is only saved when a folder was modified or removed.
+        :return: dictionary with the path of every folder in the collection as key and its listing (mtime, file
+        names and subfolder names) as value
+        """
+        if self._scanned is None:
+            scanned = {}
+            modified = self._scan_folder(self.collection_dir, scanned)
+            modified |= len(scanned) != len(self._cache)  # Removed folders
+            self._cache = self._scanned = scanned
+            if self.cache_path is not None and modified:
+                save_json(self.cache_path, {'version': SCAN_CACHE_VERSION, 'folders': self._cache})
+        return self._scanned
+
+    def scan(self):
+        """
+        :return: set of track names (file names without extension) of all files in the collection and its subfolders,
+        including formats TagMate does not tag (e.g. FLAC and M4A)
+        """
+        return {path.splitext(path.basename(file_path))[0] for file_path in self.scan_files(extensions=None)}
+
+    def scan_files(self, extensions=MUSIC_EXTENSIONS):
+        """
+        :param extensions: extensions of the files to include, None includes all files
+        :return: list of paths of the files in the collection and its subfolders
+        """
+        return [path.join(folder, file) for folder, listing in self.scan_folders().items() for file in listing['files']
+                if extensions is None or file.rpartition('.')[2] in extensions]
+
+    def reconcile(self, spotify_data):
+        """
+        :param spotify_data: Dictionary of Spotify music data.
+        :return: dictionary with the tracks missing in the local collection, the tracks missing in the Spotify
+        playlist and the pairs of those that are probably the same track
+        """
+        from .track_matcher import TrackMatcher
+
+        local_tracks = self.scan()
+        missing_local = [track for track in spotify_data.keys() if track not in local_tracks]
+        missing_spotify = sorted(track for track in local_tracks if track not in spotify_data)
+
+        probable_matches = []
+        if missing_local and missing_spotify:
+            matches = TrackMatcher(missing_local).match(missing_spotify, threshold=self.match_threshold)
+            probable_matches = [{'local': local_track, 'spotify': spotify_track, 'score': round(score, 1)}
+                                for local_track, (spotify_track, score) in matches.items()]
+
+        matched_local = {match['local'] for match in probable_matches}
+        matched_spotify = {match['spotify'] for match in probable_matches}
+        return {
+            'missing_in_local_collection': [track for track in missing_local if track not in matched_spotify],
+            'missing_in_spotify_playlist': [track for track in missing_spotify if track not in matched_local],
+            'probable_matches': probable_matches,
+        }
+
+    @staticmethod
+    def write_report(report, output_path):
+        """
+        Write the reconciliation report as JSON and as TSV (status, track, matched track, score).
+        :param report: dictionary returned by reconcile()
+        :param output_path: path of the report without extension
+        """
+        with open(f"{output_path}.json", 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+
+        rows = [('missing_in_local_collection', track, '', '') for track in report['missing_in_local_collection']]
+        rows += [('missing_in_spotify_playlist', track, '', '') for track in report['missing_in_spotify_playlist']]
+        rows += [('probable_match', match['local'], match['spotify'], match['score'])
+                 for match in report['probable_matches']]
+        write_tsv(f"{output_path}.txt", rows, header=('status', 'track', 'matched_track', 'score'), index=False)
@@ -1,91 +1,140 @@
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-from os import getenv
-from re import sub
-import pandas as pd
+from os import getenv, path, makedirs
+from concurrent.futures import ThreadPoolExecutor
+from .instrumentation import metrics
+from .track_table import TrackRecord, TrackTable, write_track_table, write_tsv
+from .normalize import spotify_title, sanitize_file_name
 
-# Load Spotify API credentials
-load_dotenv()
-REDIRECT_URI = getenv('REDIRECT_URI')
-CLIENT_ID = getenv('CLIENT_ID')
-CLIENT_SECRET = getenv('CLIENT_SECRET')
+
+def create_auth_manager():
+    """
+    :return: SpotifyOAuth using the API credentials from the environment (.env)
+    """
+    # Load Spotify API credentials
+    load_dotenv()
+    return SpotifyOAuth(
+        scope="user-library-read",
+        redirect_uri=getenv('REDIRECT_URI'),
+        client_id=getenv('CLIENT_ID'),
+        client_secret=getenv('CLIENT_SECRET'),
+        show_dialog=True
+    )
 
 
 class SpotifyData(Spotify):
-    def __init__(self, spotify_playlist):
+    PAGE_SIZE = 100  # Maximum number of playlist items per request
+    CACHE_VERSION = 3  # Cached playlists of an older version are downloaded again (version 3: columnar track table)
+
+    def __init__(self, spotify_playlist, cache_dir=None, max_workers=8, auth_manager=None, requests_session=True):
         """
-        Creates dictionary from Spotify playlist, which includes:
+        Creates dictionary from Spotify playlist, with track names as keys and TrackRecords as values, which include:
         - uri: Uniform Resource Indicator - unique ID for Spotify tracks
         - img_url: image URL of track artwork
         - preview_url: URL to a preview of the track
         - artists: string of artist names
         - tracktitle: string of track title
+        - isrc: International Standard Recording Code of the track, or None
+        Raw API pages are dropped once parsed. The tracks are cached per playlist in a columnar file (see
+        track_table.py) and only downloaded again when the playlist snapshot has changed; a cached playlist is memory
+        mapped (music_dict is a TrackTable then, close it before the playlist is loaded again).
         :param spotify_playlist: Spotify playlist URL
+        :param cache_dir: directory for the playlist cache, None disables caching
+        :param max_workers: number of playlist pages downloaded concurrently
+        :param auth_manager: SpotifyOAuth shared by several playlists, None creates one (see create_auth_manager)
+        :param requests_session: requests.Session shared by several playlists, True creates one
         """
-        super().__init__()
-
-        self.auth_manager = SpotifyOAuth(
-            scope="user-library-read",
-            redirect_uri=REDIRECT_URI,
-            client_id=CLIENT_ID,
-            client_secret=CLIENT_SECRET,
-            show_dialog=True
-        )
+        super().__init__(auth_manager=auth_manager if auth_manager is not None else create_auth_manager(),
+                         requests_session=requests_session)
 
         self.playlist_id = spotify_playlist  # Get Spotify playlists
-        self.playlist = self.playlist(playlist_id=self.playlist_id)
+        with metrics.http('spotify'):
+            self.playlist = self.playlist(playlist_id=self.playlist_id)
         self.playlist_total_items = self.playlist['tracks']['total']
+        self.snapshot_id = self.playlist['snapshot_id']
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
         self.music_dict = {}
 
-        # Spotify playlist tracks
-        offset = 0
-        limit = 100
-        iterations = int(self.playlist_total_items / limit)
-        self.playlist_music = []
-        for i in range(0, iterations + 1):  # Loop through entire Spotify library in bins of 100 tracks
-            subset_playlist_music = self.playlist_items(self.playlist_id,
-                                                        limit=limit,
-                                                        offset=offset,
-                                                        fields='items,name,uri',
-                                                        additional_types=['track'])
-            self.playlist_music.extend(subset_playlist_music['items'])
-            offset += limit
-
-        # Create dictionary containing track names as keys and Spotify data as items
-        for n in range(0, len(self.playlist_music)):
-            uri = self.playlist_music[n]['track']['uri']
-
-            track_title = self.playlist_music[n]['track']['name']
-            if " - " in track_title:  # reformat remix titles etc.
-                track_title = track_title.replace("- ", "(") + ")"
-
-            n_contributing_artists = len(self.playlist_music[n]['track']['artists'])
-            contributing_artists = [self.playlist_music[n]['track']['artists'][x]['name'] for x in
-                                    range(0, n_contributing_artists)]
+        cached_tracks = self._load_cache()
+        metrics.cache('playlist', hit=cached_tracks is not None)
+        if cached_tracks is not None:
+            self.music_dict = cached_tracks
+            return
+
+        self._fetch_tracks()
+        self._save_cache()
+
+    def _cache_path(self):
+        return path.join(self.cache_dir, f"{self.playlist['id']}.tracks")
+
+    def _load_cache(self):
+        """
+        :return: TrackTable of this playlist, or None if not cached or cached for another snapshot
+        """
+        if self.cache_dir is None or not path.exists(self._cache_path()):
+            return None
+        try:
+            cached_tracks = TrackTable(self._cache_path())
+        except ValueError:  # Older cache format
+            return None
+        if cached_tracks.meta == {'version': self.CACHE_VERSION, 'snapshot_id': self.snapshot_id}:
+            return cached_tracks
+        cached_tracks.close()
+        return None
+
+    def _save_cache(self):
+        if self.cache_dir is None:
+            return
+        makedirs(self.cache_dir, exist_ok=True)
+        write_track_table(self._cache_path(), self.music_dict,
+                          meta={'version': self.CACHE_VERSION, 'snapshot_id': self.snapshot_id})
+
+    def _fetch_playlist_page(self, offset):
+        with metrics.http('spotify'):
+            return self.playlist_items(self.playlist_id,
+                                       limit=self.PAGE_SIZE,
+                                       offset=offset,
+                                       fields='items,name,uri',
+                                       additional_types=['track'])['items']
+
+    def _fetch_tracks(self):
+        """
+        The playlist response already contains the first page of tracks. Once the total number of tracks is known,
+        the remaining pages (bins of 100 tracks) are downloaded concurrently. Every page is parsed into the music
+        dictionary as it arrives (in playlist order) and then dropped.
+        """
+        first_page = self.playlist['tracks'].pop('items')
+        offsets = range(len(first_page), self.playlist_total_items, self.PAGE_SIZE)
+        self._build_music_dict(first_page)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for page in executor.map(self._fetch_playlist_page, offsets):
+                self._build_music_dict(page)
+
+    def _build_music_dict(self, playlist_items):
+        """
+        Add playlist items to the dictionary containing track names as keys and Spotify data as items
+        :param playlist_items: items of a playlist page
+        """
+        for item in playlist_items:
+            uri = item['track']['uri']
+
+            track_title = spotify_title(item['track']['name'])
+            contributing_artists = [artist['name'] for artist in item['track']['artists']]
             contributing_artists_joined = ', '.join(contributing_artists)
-            artists_and_title = contributing_artists_joined + " - " + track_title
-
-            # Deal with illegal characters
-            illegal_characters = '\/:*?"<>|'
-            char_list = [c for c in artists_and_title if c in illegal_characters]
-            char_list = list(dict.fromkeys(char_list))  # Remove duplicates from list
-            for c in char_list:
-                artists_and_title = artists_and_title.replace(c, '')
-            artists_and_title = sub(' +', ' ', artists_and_title)  # Remove double spaces
-
-            self.music_dict.update(
-                {
-                    artists_and_title:
-                        {
-                            "uri": uri,
-                            "img_url": self.playlist_music[n]['track']['album']['images'][0]['url'],
-                            "preview_url": self.playlist_music[n]['track']['preview_url'],
-                            "artists": contributing_artists_joined,
-                            "tracktitle": track_title,
-                        }
-                }
+            # Without characters that are illegal in file names
+            artists_and_title = sanitize_file_name(contributing_artists_joined + " - " + track_title)
+
+            self.music_dict[artists_and_title] = TrackRecord(
+                uri=uri,
+                img_url=item['track']['album']['images'][0]['url'],
+                preview_url=item['track']['preview_url'],
+                artists=contributing_artists_joined,
+                tracktitle=track_title,
+                isrc=item['track'].get('external_ids', {}).get('isrc'),
             )
 
-    def export_playlist(self):
-        pd.DataFrame(self.music_dict.keys()).to_csv('../output/Spotify_playlist.txt', sep='\t', header=False)
+    def export_playlist(self, output_dir='../output'):
+        write_tsv(f'{output_dir}/Spotify_playlist.txt', self.music_dict.keys())
@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from os import path, stat
+import json
+from .json_file import save_json
+from .track_table import write_tsv
+
+
+def _signature(file_path):
+    """
+    :return: [size, mtime] of the file (a list, as stored in JSON), or None if it does not exist
+    """
+    try:
+        file_stat = stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+class TagCheckpoint:
+    def __init__(self, checkpoint_path=None):
+        """
+        Progress of the tag stage, so a failed file or an interrupted run does not cost the whole batch. It holds the
+        plan of the current run (files to tag with their picked genre) and the files completed so far, saved at every
+        checkpoint of the run, and a dead-letter list of the files that failed with the reason, kept until the file
+        is tagged successfully.
+        :param checkpoint_path: path of the JSON checkpoint, None keeps the checkpoint in memory only
+        """
+        self.checkpoint_path = checkpoint_path
+        self._run = None  # {'files': {file path: {'track_name', 'genre'}}, 'completed': [file paths]} or None
+        self._failed = {}  # Absolute file path as key, track name, stage, reason, attempts and time as value
+
+        if self.checkpoint_path is not None and path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            self._run = checkpoint['run']
+            self._failed = checkpoint['failed']
+
+    def start(self, files):
+        """
+        Start a run, replacing the plan of an earlier (interrupted) run.
+        :param files: dictionary with file path as key and {'track_name', 'genre'} as value, the files to tag
+        """
+        self._run = {'files': {path.abspath(file_path): info for file_path, info in files.items()}, 'completed': []}
+        self.save()
+
+    def unfinished(self):
+        """
+        :return: dictionary with absolute file path as key and {'track_name', 'genre'} as value, the files of an
+        interrupted run that were not completed (empty if the last run finished)
+        """
+        if self._run is None:
+            return {}
+        completed = set(self._run['completed'])
+        return {file_path: info for file_path, info in self._run['files'].items() if file_path not in completed}
+
+    def complete(self, file_paths):
+        """
+        Mark files as tagged (their tags are saved), which also removes them from the dead-letter list.
+        :param file_paths: paths of music files
+        """
+        for file_path in map(path.abspath, file_paths):
+            self._failed.pop(file_path, None)
+            if self._run is not None:
+                self._run['completed'].append(file_path)
+
+    def fail(self, file_path, track_name, stage, reason):
+        """
+        Add a file to the dead-letter list. It counts as completed for the run, so --resume does not try it again.
+        :param file_path: path of music file
+        :param track_name: file name without extension
+        :param stage: step that failed, e.g. 'tag' (Beatport data or artwork) or 'save'
+        :param reason: error message
+        """
+        file_path = path.abspath(file_path)
+        attempts = self._failed.get(file_path, {}).get('attempts', 0) + 1
+        self._failed[file_path] = {
+            'track_name': track_name,
+            'stage': stage,
+            'reason': reason,
+            'attempts': attempts,
+            'failed_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'signature': _signature(file_path),
+        }
+        if self._run is not None:
+            self._run['completed'].append(file_path)
+
+    def failed(self):
+        """
+        :return: dictionary with absolute file path as key and the failure as value
+        """
+        return dict(self._failed)
+
+    def is_failed(self, file_path):
+        """
+        :param file_path: path of music file
+        :return: True if the file failed in an earlier run and has not changed since (a new version is tried again)
+        """
+        failure = self._failed.get(path.abspath(file_path))
+        return failure is not None and failure['signature'] == _signature(file_path)
+
+    def finish(self):
+        """
+        End the run, all its files are completed or failed.
+        """
+        self._run = None
+        self.save()
+
+    def export_failed(self, output_path):
+        """
+        Write the dead-letter list to a tab separated report (track name, stage, reason, attempts, time, path).
+        """
+        write_tsv(output_path, ((failure['track_name'], failure['stage'], failure['reason'], failure['attempts'],
+                                 failure['failed_at'], file_path) for file_path, failure in self._failed.items()),
+                  header=('track_name', 'stage', 'reason', 'attempts', 'failed_at', 'path'), index=False)
+
+    def save(self):
+        if self.checkpoint_path is None:
+            return
+
+        save_json(self.checkpoint_path, {'run': self._run, 'failed': self._failed}, indent=2)
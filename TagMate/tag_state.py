@@ -0,0 +1,138 @@
+from hashlib import blake2b
+from os import path, stat
+import json
+from .json_file import save_json
+from .instrumentation import metrics
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(file_path):
+    """
+    :param file_path: path of file to hash
+    :return: hex digest of the file content
+    """
+    digest = blake2b(digest_size=16)
+    with open(file_path, 'rb') as file_in:
+        for chunk in iter(lambda: file_in.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TagState:
+    def __init__(self, state_path=None, force=False):
+        """
+        Manifest of processed files, so each MusicTagger stage only processes new or changed files.
+        Per file it records size, mtime, a content hash and, per stage, the key the stage was run with and the
+        tag set it applied. A file is unchanged when its size and mtime match, or when the content hash matches.
+        :param state_path: path of the JSON manifest, None keeps the manifest in memory only
+        :param force: treat every file as unprocessed (retag everything)
+        """
+        self.state_path = state_path
+        self.force = force
+        self._files = {}  # Absolute file path as key, fingerprint and stage records as value
+
+        if self.state_path is not None and path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as state_file:
+                self._files = json.load(state_file)
+
+    def _is_unchanged(self, file_path, entry):
+        """
+        :param file_path: absolute path of music file
+        :param entry: manifest entry of the file
+        :return: True if the file content is the same as when it was last recorded
+        """
+        file_stat = stat(file_path)
+        if file_stat.st_size != entry['size']:
+            return False
+        if file_stat.st_mtime_ns == entry['mtime']:
+            return True
+
+        # Same size, different mtime (e.g. the file was copied back): compare content
+        if content_hash(file_path) != entry['hash']:
+            return False
+        entry['mtime'] = file_stat.st_mtime_ns
+        return True
+
+    def is_recorded(self, file_path):
+        """
+        :param file_path: path of music file
+        :return: True if the file was recorded and has the same size and mtime as when it was last recorded
+        """
+        entry = self._files.get(path.abspath(file_path))
+        if entry is None or 'size' not in entry:
+            return False
+        file_stat = stat(file_path)
+        return entry['size'] == file_stat.st_size and entry['mtime'] == file_stat.st_mtime_ns
+
+    def current_hash(self, file_path):
+        """
+        :param file_path: path of music file
+        :return: content hash of the file, taken from the manifest if the file is unchanged
+        """
+        file_path = path.abspath(file_path)
+        entry = self._files.get(file_path)
+        if entry is not None and self._is_unchanged(file_path, entry):
+            return entry['hash']
+        return content_hash(file_path)
+
+    def stage_tags(self, file_path, stage):
+        """
+        :param file_path: path of music file
+        :param stage: name of the MusicTagger stage
+        :return: tag set the stage last applied to the file, or None if the stage never ran on the current file
+        """
+        file_path = path.abspath(file_path)
+        entry = self._files.get(file_path)
+        if entry is None or stage not in entry['stages'] or not self._is_unchanged(file_path, entry):
+            return None
+        return entry['stages'][stage]['tags']
+
+    def is_done(self, file_path, stage, key=None):
+        """
+        :param file_path: path of music file
+        :param stage: name of the MusicTagger stage
+        :param key: JSON serializable input the stage depends on (e.g. Spotify data or source file tags)
+        :return: True if the stage already ran with the same key and the file has not changed since
+        """
+        if self.force:
+            return False
+
+        file_path = path.abspath(file_path)
+        entry = self._files.get(file_path)
+        done = (entry is not None and stage in entry['stages'] and entry['stages'][stage]['key'] == key
+                and self._is_unchanged(file_path, entry))
+        metrics.cache('tag_state', hit=done)
+        return done
+
+    def record(self, file_path, stage, key=None, tags=None):
+        """
+        Record that a stage was applied to a file. Call after the tags were saved.
+        :param file_path: path of music file
+        :param stage: name of the MusicTagger stage
+        :param key: JSON serializable input the stage depended on
+        :param tags: JSON serializable tag set the stage applied
+        """
+        file_path = path.abspath(file_path)
+        file_stat = stat(file_path)
+        entry = self._files.setdefault(file_path, {'stages': {}})
+        if entry.get('size') != file_stat.st_size or entry.get('mtime') != file_stat.st_mtime_ns:
+            entry.update({
+                'size': file_stat.st_size,
+                'mtime': file_stat.st_mtime_ns,
+                'hash': content_hash(file_path),
+            })
+        entry['stages'][stage] = {'key': key, 'tags': tags}
+
+    def forget(self, file_path):
+        """
+        Remove a file from the manifest (e.g. after it was moved to the possible mismatch directory).
+        :param file_path: path of music file
+        """
+        self._files.pop(path.abspath(file_path), None)
+
+    def save(self):
+        if self.state_path is None:
+            return
+
+        save_json(self.state_path, self._files)
@@ -0,0 +1,114 @@
+from collections import defaultdict
+from rapidfuzz import fuzz, process
+import numpy as np
+from .normalize import normalize_track_name, parse_track_name, split_track_name, EDIT_PARENTHESES_PATTERN
+
+ORIGINAL_VERSION = 'original mix'  # Spotify leaves it out of track names, Beatport file names usually include it
+
+
+def version_key(track_name):
+    """
+    :param track_name: Full track name, including artists, title, and version type
+    :return: normalized version part of the track name (e.g. 'club mix' or 'radio edit'), empty for the original mix
+    """
+    version_type = parse_track_name(track_name).version_type
+    if version_type is None:
+        version_type = ' '.join(EDIT_PARENTHESES_PATTERN.findall(split_track_name(track_name)[1].lower()))
+    version = normalize_track_name(version_type)
+    return '' if version == ORIGINAL_VERSION else version
+
+
+def artists_and_title(track_name):
+    """
+    :param track_name: Full track name, including artists, title, and version type
+    :return: normalized artists and title without the version part, the string that is scored by the TrackMatcher
+    """
+    parts = parse_track_name(track_name)
+    return normalize_track_name(f'{parts.artists} {parts.title}')
+
+
+class TrackMatcher:
+    def __init__(self, track_names, ngram_size=3, max_candidates=50, max_ngram_frequency=0.05):
+        """
+        Matching index over Spotify track names. Names are matched exactly after normalization first, remaining
+        names are blocked on shared character n-grams and scored in one batched rapidfuzz call. A fuzzy match requires
+        the same version part (e.g. 'Club Mix' never matches 'Dub Mix'), only the artists and title are scored.
+        :param track_names: Spotify track names (music_dict keys)
+        :param ngram_size: length of the character n-grams used for blocking
+        :param max_candidates: maximum number of candidates scored per track name
+        :param max_ngram_frequency: n-grams occurring in a larger fraction of track names are ignored for blocking
+        """
+        self.track_names = list(track_names)
+        self.ngram_size = ngram_size
+        self.max_candidates = max_candidates
+        self.normalized_names = [normalize_track_name(track_name) for track_name in self.track_names]
+        self._exact = {normalized: n for n, normalized in enumerate(self.normalized_names)}
+        self.scored_names = [artists_and_title(track_name) for track_name in self.track_names]
+        self._version_ids = {}  # Version key as key, small integer as value
+        self.versions = np.array([self._version_ids.setdefault(version_key(track_name), len(self._version_ids))
+                                  for track_name in self.track_names], dtype=np.int32)
+
+        self._ngram_index = defaultdict(list)  # N-gram as key, indices of track names containing it as value
+        for n, normalized in enumerate(self.normalized_names):
+            for ngram in self._ngrams(normalized):
+                self._ngram_index[ngram].append(n)
+
+        max_postings = max(max_candidates, int(len(self.track_names) * max_ngram_frequency))
+        self._ngram_index = {ngram: np.array(postings, dtype=np.int32) for ngram, postings in self._ngram_index.items()
+                             if len(postings) <= max_postings}
+
+    def _ngrams(self, normalized):
+        padded = f" {normalized} "
+        return {padded[i:i + self.ngram_size] for i in range(len(padded) - self.ngram_size + 1)}
+
+    def _candidates(self, normalized, version):
+        """
+        :param normalized: normalized track name
+        :param version: version key of the track name
+        :return: indices of the track names with the same version sharing the most n-grams with it
+        """
+        postings = [self._ngram_index[ngram] for ngram in self._ngrams(normalized) if ngram in self._ngram_index]
+        if version not in self._version_ids or not postings:
+            return np.empty(0, dtype=np.int32)
+
+        indices, counts = np.unique(np.concatenate(postings), return_counts=True)
+        same_version = self.versions[indices] == self._version_ids[version]
+        indices, counts = indices[same_version], counts[same_version]
+        if len(indices) > self.max_candidates:
+            indices = indices[np.argpartition(counts, -self.max_candidates)[-self.max_candidates:]]
+        return indices
+
+    def match(self, queries, threshold=90):
+        """
+        :param queries: track names (e.g. file names without extension) to resolve
+        :param threshold: minimum similarity score (0-100) of a fuzzy match
+        :return: dictionary with query as key and (matched track name, score) as value, for all resolved queries
+        """
+        matches = {}
+        unmatched = []
+        for query in queries:
+            normalized = normalize_track_name(query)
+            if normalized in self._exact:
+                matches[query] = (self.track_names[self._exact[normalized]], 100.0)
+            else:
+                candidates = self._candidates(normalized, version_key(query))
+                if len(candidates):
+                    unmatched.append((query, artists_and_title(query), candidates))
+
+        if not unmatched:
+            return matches
+
+        # Score every query against its own candidates in one vectorized pass over all (query, candidate) pairs
+        candidate_counts = np.array([len(candidates) for _, _, candidates in unmatched])
+        candidate_indices = np.concatenate([candidates for _, _, candidates in unmatched])
+        queries_per_pair = [scored for _, scored, candidates in unmatched for _ in candidates]
+        scores = process.cpdist(queries_per_pair, [self.scored_names[n] for n in candidate_indices],
+                                scorer=fuzz.token_sort_ratio, workers=-1)
+
+        # Best candidate per query
+        offsets = np.concatenate(([0], np.cumsum(candidate_counts)[:-1]))
+        for (query, _, _), offset, count in zip(unmatched, offsets, candidate_counts):
+            best_pair = offset + int(scores[offset:offset + count].argmax())
+            if scores[best_pair] >= threshold:
+                matches[query] = (self.track_names[candidate_indices[best_pair]], float(scores[best_pair]))
+        return matches
@@ -0,0 +1,161 @@
+from collections.abc import Mapping
+from os import replace
+import mmap
+import struct
+import json
+import csv
+
+TABLE_MAGIC = b'TMTT'
+TABLE_VERSION = 1
+
+
+class TrackRecord:
+    FIELDS = ('uri', 'img_url', 'preview_url', 'artists', 'tracktitle', 'isrc')
+    __slots__ = FIELDS
+
+    def __init__(self, uri, img_url, preview_url, artists, tracktitle, isrc=None):
+        """
+        Spotify data of a single playlist track. Fields are also readable like dictionary items
+        (record['img_url'], record.get('isrc')), as the stages read them.
+        :param uri: Uniform Resource Indicator - unique ID for Spotify tracks
+        :param img_url: image URL of track artwork
+        :param preview_url: URL to a preview of the track, or None
+        :param artists: string of artist names
+        :param tracktitle: string of track title
+        :param isrc: International Standard Recording Code of the track, or None
+        """
+        self.uri = uri
+        self.img_url = img_url
+        self.preview_url = preview_url
+        self.artists = artists
+        self.tracktitle = tracktitle
+        self.isrc = isrc
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.FIELDS else default
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __eq__(self, other):
+        return isinstance(other, TrackRecord) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"TrackRecord({', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS)})"
+
+
+def write_tsv(output_path, rows, header=None, index=True):
+    """
+    Stream rows to a tab separated file, quoted like pandas' to_csv (the format of the existing reports).
+    :param output_path: path of the TSV file
+    :param rows: iterable of row tuples (or single values)
+    :param header: optional tuple of column names
+    :param index: prefix every row with its row number
+    """
+    with open(output_path, 'w', encoding='utf-8', newline='') as tsv_file:
+        writer = csv.writer(tsv_file, delimiter='\t', lineterminator='\n')
+        if header is not None:
+            writer.writerow(header)
+        for n, row in enumerate(rows):
+            row = row if isinstance(row, tuple) else (row,)
+            writer.writerow((n, *row) if index else row)
+
+
+def write_track_table(table_path, tracks, meta=None):
+    """
+    Write tracks to a binary columnar file: a JSON header followed by one section per column (track name and every
+    TrackRecord field), each with uint32 value offsets, a null flag per track and the UTF-8 values. TrackTable maps it
+    without parsing.
+    :param table_path: path of the table file
+    :param tracks: dictionary with track name as key and TrackRecord as value
+    :param meta: JSON serializable metadata stored in the header (e.g. the playlist snapshot_id)
+    """
+    columns = ('name',) + TrackRecord.FIELDS
+    values = {'name': list(tracks.keys())}
+    for field in TrackRecord.FIELDS:
+        values[field] = [record[field] for record in tracks.values()]
+
+    sections = []
+    for column in columns:
+        encoded = [value.encode('utf-8') if value is not None else b'' for value in values[column]]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        sections.append((column,
+                         struct.pack(f'<{len(offsets)}I', *offsets),
+                         bytes(value is None for value in values[column]),
+                         b''.join(encoded)))
+
+    # Section positions are relative to the end of the header
+    layout = {}
+    position = 0
+    for column, offsets, nulls, data in sections:
+        layout[column] = {'offsets': position, 'nulls': position + len(offsets),
+                          'data': position + len(offsets) + len(nulls)}
+        position += len(offsets) + len(nulls) + len(data)
+        position += -position % 4  # Keep the offsets of the next column aligned
+    header = json.dumps({'version': TABLE_VERSION, 'n_rows': len(tracks), 'columns': layout,
+                         'meta': meta or {}}).encode('utf-8')
+
+    temp_path = f"{table_path}.tmp"
+    with open(temp_path, 'wb') as table_file:
+        table_file.write(TABLE_MAGIC + struct.pack('<I', len(header)) + header)
+        for column, offsets, nulls, data in sections:
+            section = offsets + nulls + data
+            table_file.write(section + bytes(-len(section) % 4))
+    replace(temp_path, table_path)
+
+
+class TrackTable(Mapping):
+    def __init__(self, table_path):
+        """
+        Read-only mapping of track names to TrackRecords, memory mapped from a file written by write_track_table.
+        Only the track names are decoded when it is opened, records are decoded on access.
+        :param table_path: path of the table file
+        """
+        with open(table_path, 'rb') as table_file:
+            self._mmap = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != TABLE_MAGIC:
+            self.close()
+            raise ValueError(f"'{table_path}' is not a track table")
+
+        header_length, = struct.unpack_from('<I', self._mmap, 4)
+        header = json.loads(self._mmap[8:8 + header_length])
+        if header['version'] != TABLE_VERSION:
+            self.close()
+            raise ValueError(f"'{table_path}' has table version {header['version']}, expected {TABLE_VERSION}")
+
+        start = 8 + header_length
+        self.meta = header['meta']
+        self._n_rows = header['n_rows']
+        self._columns = {column: (start + section['offsets'], start + section['nulls'], start + section['data'])
+                         for column, section in header['columns'].items()}
+        self._index = {self._value('name', row): row for row in range(self._n_rows)}
+
+    def _value(self, column, row):
+        offsets_position, nulls_position, data_position = self._columns[column]
+        if self._mmap[nulls_position + row]:
+            return None
+        value_start, value_end = struct.unpack_from('<II', self._mmap, offsets_position + 4 * row)
+        return self._mmap[data_position + value_start:data_position + value_end].decode('utf-8')
+
+    def __getitem__(self, track_name):
+        row = self._index[track_name]
+        return TrackRecord(*(self._value(field, row) for field in TrackRecord.FIELDS))
+
+    def __contains__(self, track_name):
+        return track_name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return self._n_rows
+
+    def close(self):
+        self._mmap.close()
@@ -0,0 +1,241 @@
+from os import scandir, stat, path
+from time import monotonic, sleep
+from .library_index import MUSIC_EXTENSIONS
+from .instrumentation import metrics
+
+
+class DirectoryWatcher:
+    def __init__(self, directories, extensions=MUSIC_EXTENSIONS, debounce_seconds=2, max_batch_seconds=30,
+                 poll_interval=1, poll=False):
+        """
+        Watches directories for new and changed music files, with inotify (Linux, pip install TagMate[watch]) or by
+        polling the directories. A file is ready once its size and mtime did not change for debounce_seconds, so files
+        that are still being downloaded or copied are not picked up halfway. Ready files are released in micro-batches:
+        when no other file is still being written, or at the latest max_batch_seconds after the first file was ready.
+        :param directories: paths of the directories to watch (not recursive)
+        :param extensions: music file extensions to watch
+        :param debounce_seconds: seconds a file must be unchanged before it is ready
+        :param max_batch_seconds: maximum number of seconds a ready file waits for other files to join its batch
+        :param poll_interval: seconds between checks of the pending files (and scans of the directories if polling)
+        :param poll: poll the directories even if inotify is available
+        """
+        self.directories = [path.normpath(directory) for directory in directories]
+        self.extensions = extensions
+        self.debounce_seconds = debounce_seconds
+        self.max_batch_seconds = max_batch_seconds
+        self.poll_interval = poll_interval
+        self._known = {}  # File path as key, (size, mtime) of the last released or acknowledged version as value
+        self._pending = {}  # File path as key, ((size, mtime), time of the last change) as value
+        self._first_ready_at = None
+        self._inotify = None if poll else self._open_inotify()
+
+    def _open_inotify(self):
+        """
+        :return: INotify watching all directories, or None if inotify is not available (polling is used instead)
+        """
+        try:
+            from inotify_simple import INotify, flags
+            inotify = INotify()
+            mask = flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE
+            self._watched = {inotify.add_watch(directory, mask): directory for directory in self.directories}
+        except (ImportError, OSError):
+            return None
+        self._overflow = flags.Q_OVERFLOW
+        return inotify
+
+    @property
+    def method(self):
+        return 'polling' if self._inotify is None else 'inotify'
+
+    def _is_music_file(self, file_name):
+        return file_name.rpartition('.')[2] in self.extensions
+
+    def _check(self, file_path, now):
+        """
+        Compare a file with its known version and (re)start its debounce period if it changed.
+        :param file_path: path of music file
+        :param now: monotonic time of the check
+        """
+        try:
+            file_stat = stat(file_path)
+        except FileNotFoundError:  # Deleted or moved away
+            self._known.pop(file_path, None)
+            self._pending.pop(file_path, None)
+            return
+
+        signature = (file_stat.st_size, file_stat.st_mtime_ns)
+        if self._known.get(file_path) == signature:
+            self._pending.pop(file_path, None)
+        elif file_path not in self._pending or self._pending[file_path][0] != signature:
+            self._pending[file_path] = (signature, now)
+
+    def _scan(self, now):
+        for directory in self.directories:
+            with scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and self._is_music_file(entry.name):
+                        self._check(entry.path, now)
+
+    def _wait(self):
+        """
+        Wait up to poll_interval seconds for changes, then check the changed and the pending files.
+        """
+        if self._inotify is None:
+            sleep(self.poll_interval)
+            self._scan(monotonic())
+        else:
+            events = self._inotify.read(timeout=int(self.poll_interval * 1000))
+            now = monotonic()
+            for event in events:
+                if event.mask & self._overflow:  # Events were dropped, rescan
+                    self._scan(now)
+                elif event.name and self._is_music_file(event.name):
+                    self._check(path.join(self._watched[event.wd], event.name), now)
+
+        now = monotonic()
+        for file_path in list(self._pending):
+            self._check(file_path, now)
+
+    def batches(self):
+        """
+        Files already in the directories when watching starts form the first batch. Runs until interrupted.
+        :return: generator of batches, lists of paths of new or changed music files
+        """
+        self._scan(monotonic())
+        while True:
+            self._wait()
+            now = monotonic()
+            ready = [file_path for file_path, (_, changed_at) in self._pending.items()
+                     if now - changed_at >= self.debounce_seconds]
+            if not ready:
+                self._first_ready_at = None
+                continue
+            if self._first_ready_at is None:
+                self._first_ready_at = now
+            if len(ready) < len(self._pending) and now - self._first_ready_at < self.max_batch_seconds:
+                continue  # Other files are still being written, let them join the batch
+
+            for file_path in ready:
+                self._known[file_path] = self._pending.pop(file_path)[0]
+            self._first_ready_at = None
+            yield sorted(ready)
+
+    def acknowledge(self, file_paths):
+        """
+        Remember the current version of files, so changes made by TagMate itself (saved tags) do not start another
+        batch.
+        :param file_paths: paths of music files
+        """
+        for file_path in file_paths:
+            file_stat = stat(file_path)
+            self._known[file_path] = (file_stat.st_size, file_stat.st_mtime_ns)
+            self._pending.pop(file_path, None)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+class WatchDaemon:
+    def __init__(self, runner, debounce_seconds=2, max_batch_seconds=30, playlist_refresh_seconds=300, poll=False,
+                 report_path=None):
+        """
+        Keeps running and tags files as they arrive in the music_to_be_tagged directory of every library. A batch only
+        runs the stages it needs (tag for MP3 files, transfer and primary for all files) and files processed by an
+        earlier batch are skipped by the tag state. Spotify playlists, HTTP connections, caches and tag state stay in
+        memory between batches.
+        :param runner: cli.Runner of the watch command, provides the clients and MusicTagger of every library
+        :param debounce_seconds: seconds a file must be unchanged before it is tagged
+        :param max_batch_seconds: maximum number of seconds a ready file waits for other files to join its batch
+        :param playlist_refresh_seconds: minimum number of seconds between downloads of a playlist, which is
+        downloaded again (if changed) when a batch has tracks that are missing from it
+        :param poll: poll the directories instead of using inotify
+        :param report_path: path of the run report, updated after every batch (None disables it)
+        """
+        self.runner = runner
+        self.debounce_seconds = debounce_seconds
+        self.max_batch_seconds = max_batch_seconds
+        self.playlist_refresh_seconds = playlist_refresh_seconds
+        self.poll = poll
+        self.report_path = report_path
+        self._music_taggers = {}  # Library name as key, MusicTagger as value
+        self._playlists = {}  # Library name as key, Spotify data and monotonic time of download as value
+
+    def _spotify_data(self, library_name, library_url, track_names):
+        """
+        :param library_name: name of the library in config.yaml
+        :param library_url: Spotify playlist URL of the library
+        :param track_names: track names of the batch
+        :return: dictionary generated by spotify_data.py, downloaded on first use and refreshed when tracks are
+        missing from it
+        """
+        spotify_data, loaded_at = self._playlists.get(library_name, (None, None))
+        if spotify_data is None or (any(track_name not in spotify_data for track_name in track_names)
+                                    and monotonic() - loaded_at >= self.playlist_refresh_seconds):
+            self._playlists.pop(library_name, None)  # Closed by the runner before its cache file is replaced
+            spotify_data = self.runner.spotify_data(library_name, library_url)
+            self._playlists[library_name] = (spotify_data, monotonic())
+        return spotify_data
+
+    def _run_batch(self, library_name, library_url, file_paths):
+        """
+        :param library_name: name of the library in config.yaml
+        :param library_url: Spotify playlist URL of the library
+        :param file_paths: paths of the new or changed music files in the music_to_be_tagged directory
+        """
+        print(f"{library_name}: tagging {len(file_paths)} new or changed files")
+        mt = self._music_taggers[library_name]
+        with metrics.stage(f"{library_name}/watch_batch"):
+            mp3_tracks = [path.basename(file_path).rpartition('.')[0] for file_path in file_paths
+                          if file_path.endswith('.mp3')]
+            if mp3_tracks:
+                mt.tag_music(spotify_data=self._spotify_data(library_name, library_url, mp3_tracks))
+            mt.transfer_tags()
+            mt.process_primary_or_substitute_tracks()
+            mt.flush()
+
+    def run(self, libraries):
+        """
+        Watch until interrupted (Ctrl+C).
+        :param libraries: dictionary of library names and Spotify playlist URLs
+        """
+        self.runner.open()
+        watcher = None
+        try:
+            local_dirs = {}  # Normalized music_to_be_tagged directory as key, library name as value
+            for library_name in libraries:
+                local_dirs[path.normpath(self.runner.library_dirs(library_name)[0])] = library_name
+                self._music_taggers[library_name] = self.runner.music_tagger(library_name)
+
+            watcher = DirectoryWatcher(list(local_dirs), debounce_seconds=self.debounce_seconds,
+                                       max_batch_seconds=self.max_batch_seconds, poll=self.poll)
+            print(f"Watching {len(local_dirs)} directories ({watcher.method}), press Ctrl+C to stop.")
+            for batch in watcher.batches():
+                for local_dir, library_name in local_dirs.items():
+                    file_paths = [file_path for file_path in batch if path.dirname(file_path) == local_dir]
+                    if not file_paths:
+                        continue
+                    try:
+                        self._run_batch(library_name, libraries[library_name], file_paths)
+                    except Exception as e:
+                        print(f"Error: batch of library '{library_name}' failed: {e}")
+                        # Drop the unsaved edits of the failed batch, the tag state is reloaded from its last save
+                        self._music_taggers[library_name].close()
+                        self._music_taggers[library_name] = self.runner.music_tagger(library_name)
+
+                    # Tags saved by the batch are not new arrivals
+                    tag_state = self._music_taggers[library_name].tag_state
+                    with scandir(local_dir) as entries:
+                        watcher.acknowledge([entry.path for entry in entries
+                                             if entry.is_file() and tag_state.is_recorded(entry.path)])
+
+                if self.report_path is not None:
+                    metrics.save(self.report_path, command='watch', libraries=list(libraries))
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            if watcher is not None:
+                watcher.close()
+            for mt in self._music_taggers.values():
+                mt.close()
+            self.runner.close()
@@ -0,0 +1,103 @@
+from argparse import ArgumentParser
+from random import Random
+from re import sub, search
+from time import perf_counter
+from unidecode import unidecode
+from TagMate import normalize
+from benchmarks.synthetic_library import synthetic_tracks
+
+ACCENTED = {'a': 'á', 'e': 'é', 'o': 'ö', 'u': 'ü', 'n': 'ñ', 'c': 'ç'}
+
+
+def track_names(n_names, seed=0):
+    """
+    :return: synthetic Spotify style track names, some with accents, '(feat. ...)' parts and illegal characters
+    """
+    rng = Random(seed)
+    names = []
+    for track in synthetic_tracks(n_names, seed):
+        artists, title = track['artists'], track['tracktitle']
+        if rng.random() < 0.3:
+            artists = ''.join(ACCENTED.get(c, c) if rng.random() < 0.3 else c for c in artists)
+        if rng.random() < 0.2:
+            title = title.replace(' (', f" (feat. {rng.choice(track['artists'].split(', '))}) (", 1)
+        if rng.random() < 0.1:
+            title = title.replace(' ', rng.choice((': ', ' / ', '  ', ' ? ')), 1)
+        names.append(f"{artists} - {title}")
+    return names
+
+
+# The implementations before the normalize module, as reference for speed and results
+def original_file_name(name):
+    illegal_characters = '\\/:*?"<>|'
+    char_list = list(dict.fromkeys(c for c in name if c in illegal_characters))
+    for c in char_list:
+        name = name.replace(c, '')
+    return sub(' +', ' ', name)
+
+
+def original_query(track_name):
+    return sub(r' ', '+', sub(r'\s+', ' ', sub(r'[^a-zA-Z\s]', '', track_name)))
+
+
+def original_track_info(track_name):
+    track_artists = unidecode(track_name.split(' - ')[0].lower())
+    title = sub(r'\([^)]*ix[^)]*\)\s*', '', track_name.split(' - ')[1].lower())
+    title = sub(r'\([^)]*edit[^)]*\)\s*', '', title).rstrip()
+    match = search(r'\((?!feat\.)[^)]*(Mix|Remix)[^)]*\)', track_name)
+    version_type = match.group().replace("(", "").replace(")", "") if match else None
+    return track_artists, title, version_type
+
+
+def original_normalized(track_name):
+    track_name = sub(r'\s*[(\[]\s*(feat|ft|featuring)\.?\s[^)\]]*[)\]]', '', unidecode(track_name), flags=2)
+    return sub(r'[^a-z0-9]+', ' ', track_name.lower()).strip()
+
+
+CASES = [
+    ('file name', original_file_name, normalize.sanitize_file_name),
+    ('query', original_query, normalize.format_query),
+    ('track info', original_track_info, normalize.parse_track_name),
+    ('normalized', original_normalized, normalize.normalize_track_name),
+]
+
+
+def throughput(function, names, repeat):
+    """
+    :return: names per second (best of repeat passes)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        for name in names:
+            function(name)
+        best = min(best, perf_counter() - start)
+    return len(names) / best
+
+
+def main():
+    parser = ArgumentParser(description="Throughput of the track name normalization functions.")
+    parser.add_argument('--names', type=int, default=20000, help="number of distinct track names")
+    parser.add_argument('--passes', type=int, default=5,
+                        help="passes over the names (a run sees every name this often)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the track names")
+    args = parser.parse_args()
+
+    names = track_names(args.names, args.seed)
+    print(f"{len(names)} names, {args.passes} passes")
+    print(f"{'function':<14}{'original/s':>13}{'cold/s':>13}{'warm/s':>13}{'run speedup':>13}")
+    for case_name, original, function in CASES:
+        mismatches = sum(tuple(original(name)) != tuple(function(name)) if case_name == 'track info'
+                         else original(name) != function(name) for name in names)
+        function.cache_clear()
+        cold = throughput(function, names, 1)
+        warm = throughput(function, names, 3)
+        reference = throughput(original, names, 1)
+        # A run normalizes every name once (cold) and looks it up passes - 1 times more (warm)
+        run_speedup = (args.passes / reference) / (1 / cold + (args.passes - 1) / warm)
+        print(f"{case_name:<14}{reference:>13,.0f}{cold:>13,.0f}{warm:>13,.0f}{run_speedup:>12.1f}x"
+              + (f"  {mismatches} results differ from the original" if mismatches else ''))
+
+
+if __name__ == '__main__':
+    main()
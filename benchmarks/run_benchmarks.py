@@ -0,0 +1,251 @@
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from os import path, makedirs, walk, stat, cpu_count
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import platform
+import subprocess
+import tracemalloc
+import json
+from TagMate.music_tagger import MusicTagger
+from TagMate.beatport_cache import BeatportCache
+from TagMate.beatport_lookup import BeatportLookup
+from TagMate.download_cache import ArtworkCache
+from TagMate.tag_state import TagState
+from TagMate.journal import Journal
+from benchmarks.synthetic_library import synthetic_tracks, generate_library
+from benchmarks.stand_ins import LocalServices, FakeSpotifyData
+
+RESULTS_DIR = path.join(path.abspath(path.dirname(__file__)), 'results')
+DEFAULT_SIZES = (100, 1000, 10000)
+PEAK_MEMORY_SCOPE = "Python allocations of the main process (tracemalloc), tag writer processes are not included"
+
+
+def snapshot(directories):
+    """
+    :param directories: directories to include (recursively)
+    :return: dictionary with file path as key and (size, mtime) as value
+    """
+    files = {}
+    for directory in directories:
+        for folder, _, file_names in walk(directory):
+            for file_name in file_names:
+                file_stat = stat(path.join(folder, file_name))
+                files[path.join(folder, file_name)] = file_stat.st_size, file_stat.st_mtime_ns
+    return files
+
+
+def bytes_written(before, after):
+    """
+    Every tag save rewrites the complete file, so the size of new and modified files is counted.
+    :return: total size of the files that are new or modified between the two snapshots
+    """
+    return sum(size for file_path, (size, mtime) in after.items() if before.get(file_path) != (size, mtime))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Benchmark:
+    def __init__(self, n_tracks, work_dir, tag_workers=4, beatport_workers=8, seed=0):
+        """
+        One synthetic library of n_tracks tracks, tagged in automatic mode against the local service stand-ins.
+        :param n_tracks: number of tracks in the library
+        :param work_dir: empty directory for the library, caches and reports
+        :param tag_workers: number of tag writer processes
+        :param beatport_workers: number of concurrent Beatport lookups
+        :param seed: random seed of the library
+        """
+        self.n_tracks = n_tracks
+        self.work_dir = work_dir
+        self.tag_workers = tag_workers
+        self.beatport_workers = beatport_workers
+        self.local_dir = path.join(work_dir, 'BENCH', 'music_to_be_tagged')
+        self.possible_mismatch_dir = path.join(work_dir, 'BENCH', 'possible_mismatch')
+        self.collection_dir = path.join(work_dir, 'BENCH', 'BENCH_collection')
+        self.output_dir = path.join(work_dir, 'output')
+        for directory in [self.possible_mismatch_dir, self.collection_dir, self.output_dir]:
+            makedirs(directory, exist_ok=True)
+
+        self.tracks = synthetic_tracks(n_tracks, seed=seed)
+        self.n_files = generate_library(self.local_dir, self.tracks, seed=seed)
+        self.services = LocalServices(self.tracks, seed=seed).start()
+        self.spotify_data = FakeSpotifyData(self.tracks, self.services).music_dict
+
+    def _music_tagger(self, beatport_cache, artwork_cache):
+        return MusicTagger(self.local_dir, self.possible_mismatch_dir, self.collection_dir, 'BENCH', 'automatic',
+                           beatport_cache=beatport_cache,
+                           artwork_cache=artwork_cache,
+                           tag_state=TagState(path.join(self.output_dir, 'tag_state.json')),
+                           primary_journal=Journal(path.join(self.output_dir, 'primary_journal.json')),
+                           tag_workers=self.tag_workers,
+                           collection_scan_cache=path.join(self.output_dir, 'collection_scan.json'),
+                           beatport_lookup=BeatportLookup(max_workers=self.beatport_workers,
+                                                          requests_per_second=0,
+                                                          cache=beatport_cache,
+                                                          search_url=self.services.search_url),
+                           output_dir=self.output_dir)
+
+    def _measure(self, stage, flush=None):
+        """
+        :param stage: function running the stage
+        :param flush: function saving the tag edits queued by the stage, timed as part of the stage
+        :return: dictionary of wall time (including the flush, which is also reported separately), throughput, peak
+        traced memory of the main process, bytes written and HTTP requests
+        """
+        directories = [self.local_dir, self.possible_mismatch_dir, self.output_dir]
+        before = snapshot(directories)
+        requests_before = self.services.requests
+
+        tracemalloc.start()
+        start = perf_counter()
+        stage()
+        flush_start = perf_counter()
+        if flush is not None:
+            flush()
+        seconds = perf_counter() - start
+        flush_seconds = perf_counter() - flush_start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'seconds': round(seconds, 4),
+            'flush_seconds': round(flush_seconds, 4),
+            'tracks_per_second': round(self.n_tracks / seconds, 1) if seconds else None,
+            'peak_memory_bytes': peak_memory,  # Main process only, see PEAK_MEMORY_SCOPE
+            'bytes_written': bytes_written(before, snapshot(directories)),
+            'http_requests': self.services.requests - requests_before,
+        }
+
+    def run(self):
+        """
+        Run every stage once on the untagged library, then the complete pipeline again (nothing left to do).
+        The tag, transfer and primary stages only queue tag edits, so each is timed including a flush that saves its
+        edits (the tagmate command saves once after all stages instead). The rerun times the pipeline as tagmate runs
+        it.
+        :return: dictionary with stage name as key and measurements as value
+        """
+        results = {}
+        for run_name in ('', 'rerun_'):
+            beatport_cache = BeatportCache(path.join(self.output_dir, 'beatport_cache.sqlite'))
+            artwork_cache = ArtworkCache(path.join(self.output_dir, 'artwork_cache'))
+            mt = self._music_tagger(beatport_cache, artwork_cache)
+            stages = [
+                ('tag', lambda: mt.tag_music(spotify_data=self.spotify_data), mt.flush),
+                ('transfer', mt.transfer_tags, mt.flush),
+                ('primary', mt.process_primary_or_substitute_tracks, mt.flush),
+                ('reconcile', lambda: mt.reconcile_collection(spotify_data=self.spotify_data), None),
+            ]
+            if run_name:
+                pipeline_stages = [stage for _, stage, _ in stages[:-1]] + [mt.flush, stages[-1][1]]
+                stages = [('pipeline', lambda: [stage() for stage in pipeline_stages], None)]
+
+            for stage_name, stage, flush in stages:
+                results[run_name + stage_name] = self._measure(stage, flush)
+            artwork_cache.close()
+            beatport_cache.close()
+
+        results['total'] = {'seconds': round(sum(result['seconds'] for name, result in results.items()
+                                                 if not name.startswith('rerun_')), 4)}
+        return results
+
+    def close(self):
+        self.services.stop()
+
+
+def run_benchmarks(sizes, tag_workers, beatport_workers, seed):
+    """
+    :return: dictionary with the environment and the results per library size
+    """
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+        'settings': {'tag_workers': tag_workers, 'beatport_workers': beatport_workers, 'seed': seed},
+        'peak_memory_scope': PEAK_MEMORY_SCOPE,
+        'results': {},
+    }
+    for n_tracks in sizes:
+        with TemporaryDirectory() as work_dir:
+            benchmark = Benchmark(n_tracks, work_dir, tag_workers=tag_workers, beatport_workers=beatport_workers,
+                                  seed=seed)
+            try:
+                report['results'][str(n_tracks)] = dict(n_files=benchmark.n_files, stages=benchmark.run())
+            finally:
+                benchmark.close()
+        print_results(report, n_tracks)
+    return report
+
+
+def print_results(report, n_tracks):
+    print(f"\n{n_tracks} tracks ({report['results'][str(n_tracks)]['n_files']} files)")
+    print(f"{'stage':<18}{'seconds':>10}{'flush s':>10}{'tracks/s':>12}{'peak MB*':>10}{'written MB':>12}"
+          f"{'requests':>10}")
+    for stage_name, result in report['results'][str(n_tracks)]['stages'].items():
+        if stage_name == 'total':
+            print(f"{stage_name:<18}{result['seconds']:>10.2f}")
+            continue
+        print(f"{stage_name:<18}{result['seconds']:>10.2f}{result['flush_seconds']:>10.2f}"
+              f"{result['tracks_per_second'] or 0:>12.1f}{result['peak_memory_bytes'] / 1e6:>10.1f}"
+              f"{result['bytes_written'] / 1e6:>12.2f}{result['http_requests']:>10}")
+    print(f"* {PEAK_MEMORY_SCOPE}")
+
+
+def compare(baseline_path, candidate_path):
+    """
+    Print the wall time of every stage in two result files and the ratio candidate / baseline.
+    """
+    with open(baseline_path) as baseline_file, open(candidate_path) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+
+    print(f"baseline {baseline['revision']} ({baseline['timestamp']}), "
+          f"candidate {candidate['revision']} ({candidate['timestamp']})")
+    for size, results in candidate['results'].items():
+        if size not in baseline['results']:
+            continue
+        print(f"\n{size} tracks")
+        print(f"{'stage':<18}{'baseline s':>12}{'candidate s':>13}{'ratio':>8}")
+        for stage_name, result in results['stages'].items():
+            baseline_result = baseline['results'][size]['stages'].get(stage_name)
+            if baseline_result is None:
+                continue
+            ratio = result['seconds'] / baseline_result['seconds'] if baseline_result['seconds'] else float('nan')
+            print(f"{stage_name:<18}{baseline_result['seconds']:>12.2f}{result['seconds']:>13.2f}{ratio:>8.2f}")
+
+
+def main():
+    parser = ArgumentParser(description="Time every MusicTagger stage on synthetic libraries.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="numbers of tracks")
+    parser.add_argument('--tag-workers', type=int, default=4, help="number of tag writer processes")
+    parser.add_argument('--beatport-workers', type=int, default=8, help="number of concurrent Beatport lookups")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the synthetic libraries")
+    parser.add_argument('--output', help="path of the JSON results (default: benchmarks/results/<time>_<rev>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="compare two result files instead of running the benchmarks")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_benchmarks(args.sizes, args.tag_workers, args.beatport_workers, args.seed)
+    output_path = args.output
+    if output_path is None:
+        makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = report['timestamp'].replace(':', '').replace('-', '')[:15]
+        output_path = path.join(RESULTS_DIR, f"{timestamp}_{report['revision']}.json")
+    with open(output_path, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+
+# Guarded, because tag writer processes re-import the main module on platforms that spawn new processes (Windows)
+if __name__ == '__main__':
+    main()
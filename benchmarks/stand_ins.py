@@ -0,0 +1,158 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qs
+from base64 import b64decode
+from random import Random
+import struct
+import json
+from TagMate.normalize import format_query
+from TagMate.track_table import TrackRecord, write_tsv
+
+# 8x8 JPEG, every album gets a unique copy by inserting its number as a JPEG comment segment
+ARTWORK_JPEG = b64decode(
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1xeXBk'
+    'eFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2P/wAARCAAIAAgD'
+    'ASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKB'
+    'kaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZ'
+    'mqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQF'
+    'BgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5'
+    'OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX'
+    '2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwDHooorhPqD/9k='
+)
+
+
+def artwork(album):
+    """
+    :param album: album number
+    :return: JPEG bytes, unique per album
+    """
+    comment = f"album {album}".encode()
+    return ARTWORK_JPEG[:2] + b'\xff\xfe' + struct.pack('>H', len(comment) + 2) + comment + ARTWORK_JPEG[2:]
+
+
+def beatport_candidate(artists, track_name, mix_name, genre, label, isrc=None):
+    return {
+        'isrc': isrc,
+        'artists': [{'artist_name': artist} for artist in artists.split(', ')],
+        'track_name': track_name,
+        'mix_name': mix_name,
+        'genre': [{'genre_name': genre}],
+        'label': {'label_name': label},
+    }
+
+
+class LocalServices:
+    def __init__(self, tracks, n_candidates=25, page_padding=150_000, isrc_coverage=0.9, seed=0):
+        """
+        Local HTTP stand-in for beatport.com search pages and Spotify artwork, served from a background thread.
+        Search pages embed the track and random other candidates in a __NEXT_DATA__ script, padded with HTML to the
+        size of a real page. Searching an ISRC known to the stand-in finds its track, the other tracks are only found
+        by name.
+        :param tracks: list of track dictionaries from synthetic_library.synthetic_tracks
+        :param n_candidates: number of search results per page
+        :param page_padding: bytes of HTML around the __NEXT_DATA__ script
+        :param isrc_coverage: fraction of the tracks with their ISRC on the stand-in
+        :param seed: random seed
+        """
+        self.n_candidates = n_candidates
+        self.padding = b'<div class="filler">' + b'x' * page_padding + b'</div>'
+        self.requests = 0
+        self._lock = Lock()
+        self._rng = Random(seed)
+        self._tracks = tracks
+        self._by_query = {format_query(track['name']): track for track in tracks}
+        self._isrcs = {track['isrc'] for track in tracks if self._rng.random() < isrc_coverage}
+        self._by_query.update({track['isrc']: track for track in tracks if track['isrc'] in self._isrcs})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def search_url(self):
+        return f"{self.base_url}/search/tracks?q="
+
+    def artwork_url(self, album):
+        return f"{self.base_url}/artwork/{album}.jpg"
+
+    def _candidate(self, track):
+        return beatport_candidate(track['artists'], track['title'], track['mix'], track['genre'], track['label'],
+                                  isrc=track['isrc'] if track['isrc'] in self._isrcs else None)
+
+    def search_page(self, query):
+        """
+        :param query: formatted Beatport query string
+        :return: HTML bytes of the search page
+        """
+        with self._lock:
+            others = self._rng.sample(self._tracks, min(self.n_candidates - 1, len(self._tracks)))
+        candidates = [self._candidate(track) for track in others]
+        track = self._by_query.get(query)
+        if track is not None:
+            candidates.insert(len(candidates) // 2, self._candidate(track))
+
+        next_data = {'props': {'pageProps': {'dehydratedState': {'queries': [{'state': {'data': {
+            'data': candidates}}}]}}}}
+        return (b'<html><head></head><body>' + self.padding
+                + b'<script id="__NEXT_DATA__" type="application/json">' + json.dumps(next_data).encode()
+                + b'</script>' + self.padding + b'</body></html>')
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with services._lock:
+                    services.requests += 1
+                url = urlparse(self.path)
+                if url.path == '/search/tracks':
+                    query = parse_qs(url.query, keep_blank_values=True).get('q', [''])[0].replace(' ', '+')
+                    body, content_type = services.search_page(query), 'text/html'
+                elif url.path.startswith('/artwork/'):
+                    body, content_type = artwork(int(url.path[len('/artwork/'):-len('.jpg')])), 'image/jpeg'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeSpotifyData:
+    def __init__(self, tracks, services):
+        """
+        Stand-in for SpotifyData: the same music_dict, built from synthetic tracks with artwork on the local services.
+        :param tracks: list of track dictionaries from synthetic_library.synthetic_tracks
+        :param services: LocalServices serving the artwork
+        """
+        self.music_dict = {
+            track['name']: TrackRecord(uri=f"spotify:track:{n:022d}",
+                                       img_url=services.artwork_url(track['album']),
+                                       preview_url=None,
+                                       artists=track['artists'],
+                                       tracktitle=track['tracktitle'],
+                                       isrc=track['isrc'])
+            for n, track in enumerate(tracks)
+        }
+
+    def export_playlist(self, output_dir):
+        write_tsv(f'{output_dir}/Spotify_playlist.txt', self.music_dict.keys())
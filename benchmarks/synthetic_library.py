@@ -0,0 +1,97 @@
+from os import path, makedirs
+from random import Random
+import struct
+
+FIRST_NAMES = ['Adam', 'Nina', 'Marco', 'Lena', 'Oscar', 'Yuki', 'Sven', 'Amara', 'Tomas', 'Ivy', 'Kai', 'Rosa',
+               'Felix', 'Mila', 'Jonas', 'Zara', 'Luca', 'Noor', 'Emil', 'Sade']
+LAST_NAMES = ['Beyer', 'Kraviz', 'Solomun', 'Dixon', 'Tale', 'Maceo', 'Kolsch', 'Fisher', 'Vath', 'Hawtin',
+              'Lange', 'Moss', 'Rivera', 'Novak', 'Santos', 'Okafor', 'Berg', 'Haas', 'Costa', 'Ito']
+TITLE_WORDS = ['Midnight', 'Echo', 'Pulse', 'Horizon', 'Velvet', 'Signal', 'Gravity', 'Ritual', 'Mirage', 'Orbit',
+               'Neon', 'Drift', 'Ember', 'Shadow', 'Tide', 'Static', 'Bloom', 'Cascade', 'Prism', 'Voltage',
+               'Desire', 'Fever', 'Silence', 'Motion', 'Paradise', 'Frequency', 'Spiral', 'Aurora', 'Rush', 'Haze']
+MIX_TYPES = ['Original Mix', 'Extended Mix', 'Dub Mix', '{artist} Remix', '{artist} Extended Remix']
+GENRES = ['Afro House', 'Deep House', 'Melodic House & Techno', 'Tech House', 'Techno (Peak Time / Driving)',
+          'Progressive House', 'Indie Dance', 'Organic House / Downtempo']
+LABELS = ['Afterlife', 'Innervisions', 'Drumcode', 'Dirtybird', 'Anjunadeep', 'Kompakt', 'Ostgut Ton', 'Hot Creations',
+          'Diynamic', 'Cercle Records']
+
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)  # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz frame of silence
+SAMPLE_RATE_80BIT = bytes([0x40, 0x0E, 0xAC, 0x44, 0, 0, 0, 0, 0, 0])  # 44100 as 80-bit extended float (AIFF)
+
+
+def synthetic_tracks(n_tracks, seed=0):
+    """
+    :param n_tracks: number of tracks
+    :param seed: random seed, the same seed gives the same tracks
+    :return: list of track dictionaries (name, artists, tracktitle, genre, label, album, isrc), names formatted like the
+    Spotify track names of spotify_data.py: 'Artist 1, Artist 2 - Title (Mix)'
+    """
+    rng = Random(seed)
+    artists_pool = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    tracks = {}
+    while len(tracks) < n_tracks:
+        artists = rng.sample(artists_pool, rng.choice((1, 1, 1, 2, 3)))
+        title = ' '.join(rng.sample(TITLE_WORDS, rng.choice((1, 2, 2, 3))))
+        mix = rng.choice(MIX_TYPES).format(artist=rng.choice(artists_pool))
+        name = f"{', '.join(artists)} - {title} ({mix})"
+        tracks[name] = {
+            'name': name,
+            'artists': ', '.join(artists),
+            'tracktitle': f"{title} ({mix})",
+            'title': title,
+            'mix': mix,
+            'genre': rng.choice(GENRES),
+            'label': rng.choice(LABELS),
+            'album': len(tracks) // 3,  # Three tracks per release share their artwork
+            'isrc': f"QZTM{seed % 100:02d}{len(tracks):06d}",
+        }
+    return list(tracks.values())
+
+
+def write_mp3(file_path, n_frames=40):
+    with open(file_path, 'wb') as file:
+        file.write(MP3_FRAME * n_frames)
+
+
+def write_wav(file_path, n_samples=4000):
+    data = bytes(2 * n_samples)
+    with open(file_path, 'wb') as file:
+        file.write(b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVE')
+        file.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, 44100, 88200, 2, 16))
+        file.write(b'data' + struct.pack('<I', len(data)) + data)
+
+
+def write_aif(file_path, n_samples=4000):
+    data = bytes(2 * n_samples)
+    comm = struct.pack('>hIh', 1, n_samples, 16) + SAMPLE_RATE_80BIT
+    ssnd = struct.pack('>II', 0, 0) + data
+    with open(file_path, 'wb') as file:
+        file.write(b'FORM' + struct.pack('>I', 4 + 8 + len(comm) + 8 + len(ssnd)) + b'AIFF')
+        file.write(b'COMM' + struct.pack('>I', len(comm)) + comm)
+        file.write(b'SSND' + struct.pack('>I', len(ssnd)) + ssnd)
+
+
+def generate_library(directory, tracks, aif_fraction=0.2, wav_fraction=0.1, seed=0):
+    """
+    Write an untagged MP3 for every track, plus AIF and/or WAV versions for a fraction of the tracks.
+    :param directory: music_to_be_tagged directory
+    :param tracks: list of track dictionaries from synthetic_tracks
+    :param aif_fraction: fraction of tracks with an AIF version
+    :param wav_fraction: fraction of tracks with a WAV version
+    :param seed: random seed
+    :return: number of files written
+    """
+    rng = Random(seed)
+    makedirs(directory, exist_ok=True)
+    n_files = 0
+    for track in tracks:
+        file_path = path.join(directory, track['name'])
+        write_mp3(f"{file_path}.mp3")
+        n_files += 1
+        if rng.random() < aif_fraction:
+            write_aif(f"{file_path}.aif")
+            n_files += 1
+        if rng.random() < wav_fraction:
+            write_wav(f"{file_path}.wav")
+            n_files += 1
+    return n_files
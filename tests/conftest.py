@@ -0,0 +1,24 @@
+import pytest
+
+# A few silent MPEG-1 Layer III frames, enough for music_tag to read and write ID3 tags
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+
+
+@pytest.fixture
+def make_mp3():
+    """
+    :return: function writing a silent MP3 file to a path, with optional tags
+    """
+    from music_tag import load_file
+
+    def make(file_path, **tags):
+        with open(file_path, 'wb') as mp3_file:
+            mp3_file.write(MP3_FRAME * 10)
+        if tags:
+            music_file = load_file(str(file_path))
+            for tag, value in tags.items():
+                music_file[tag] = value
+            music_file.save()
+        return str(file_path)
+
+    return make
@@ -0,0 +1,55 @@
+import pytest
+from TagMate import beatport_cache
+from TagMate.beatport_cache import BeatportCache
+
+RESULT = {'track_metadata': {'genre': 'Techno', 'label': 'Drumcode'}, 'similarity_ratios': {'artists': 100}}
+DAY = 86400
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    :return: list holding the current time of the cache, advance it by changing clock[0]
+    """
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(beatport_cache, 'time', lambda: now[0])
+    return now
+
+
+def test_result_valid_until_ttl(tmp_path, clock):
+    cache = BeatportCache(tmp_path / 'beatport.sqlite', ttl_days=30)
+    cache.put('adam beyer pulse', RESULT)
+
+    clock[0] += 30 * DAY
+    assert cache.get('adam beyer pulse') == RESULT
+    clock[0] += 1
+    assert cache.get('adam beyer pulse') is None
+    cache.close()
+
+
+def test_no_ttl_never_expires(tmp_path, clock):
+    cache = BeatportCache(tmp_path / 'beatport.sqlite', ttl_days=0)
+    cache.put('adam beyer pulse', RESULT)
+
+    clock[0] += 3650 * DAY
+    assert cache.get('adam beyer pulse') == RESULT
+    cache.close()
+
+
+def test_refresh_ignores_and_overwrites_cached_results(tmp_path, clock):
+    db_path = tmp_path / 'beatport.sqlite'
+    cache = BeatportCache(db_path)
+    cache.put('adam beyer pulse', RESULT)
+    cache.close()
+
+    refreshing = BeatportCache(db_path, refresh=True)
+    assert refreshing.get('adam beyer pulse') is None
+    clock[0] += DAY
+    refreshing.put('adam beyer pulse', {'track_metadata': {'genre': 'Techno (Peak Time)'}})
+    refreshing.close()
+
+    cache = BeatportCache(db_path, ttl_days=1)
+    assert cache.get('adam beyer pulse') == {'track_metadata': {'genre': 'Techno (Peak Time)'}}
+    clock[0] += DAY + 1
+    assert cache.get('adam beyer pulse') is None
+    cache.close()
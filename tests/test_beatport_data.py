@@ -0,0 +1,96 @@
+import json
+import numpy as np
+from TagMate import beatport_cache
+from TagMate.beatport_cache import BeatportCache
+from TagMate.beatport_data import BeatportScraper
+
+
+def candidate(artists, track_name, mix_name, genre='Techno (Peak Time / Driving)', label='Drumcode', isrc=None):
+    return {'artists': [{'artist_name': artist} for artist in artists], 'track_name': track_name,
+            'mix_name': mix_name, 'genre': {'genre_name': genre}, 'label': {'label_name': label}, 'isrc': isrc}
+
+
+def search_page(candidates):
+    data = {'props': {'pageProps': {'dehydratedState': {'queries': [{'state': {'data': {'data': candidates}}}]}}}}
+    return f'<html><script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script></html>'.encode()
+
+
+class FakeClient:
+    def __init__(self, pages):
+        """
+        :param pages: dictionary with search query as key and list of Beatport track dictionaries as value
+        """
+        self.pages = pages
+        self.queries = []
+
+    def get(self, url):
+        query = url.rpartition('?q=')[2]
+        self.queries.append(query)
+        return search_page(self.pages.get(query, []))
+
+
+def test_candidate_passing_thresholds_beats_higher_combined_score():
+    # The first candidate has the highest combined similarity, but its artists are below the threshold
+    ratios = (np.array([85.0, 95.0]), np.array([100.0, 75.0]), np.array([100.0, 80.0]))
+    assert BeatportScraper._pick_best_candidate(ratios) == 1
+
+
+def test_highest_combined_score_without_passing_candidates():
+    ratios = (np.array([50.0, 80.0, 60.0]), np.array([100.0, 100.0, 100.0]), np.array([0.0, 0.0, 0.0]))
+    assert BeatportScraper._pick_best_candidate(ratios) == 1
+
+
+def test_tie_keeps_beatport_order():
+    ratios = (np.array([80.0, 100.0, 100.0]), np.array([60.0, 90.0, 90.0]), np.array([100.0, 100.0, 100.0]))
+    assert BeatportScraper._pick_best_candidate(ratios) == 1
+
+
+def test_scrape_picks_matching_version():
+    client = FakeClient({'Adam+Beyer+Pulse+Club+Mix': [
+        candidate(['Adam Beyer'], 'Pulse', 'Dub Mix', genre='Techno (Raw / Deep / Hypnotic)', label='Dub Label'),
+        candidate(['Adam Beyers'], 'Pulse', 'Club Mix', genre='Tech House', label='Other'),
+        candidate(['Adam Beyer'], 'Pulse', 'Club Mix'),
+    ]})
+    result = BeatportScraper('Adam Beyer - Pulse (Club Mix)', http_client=client).scrape_track_data()
+
+    assert result['track_metadata'] == {'query_genre_name': 'Techno (Peak Time / Driving)',
+                                        'query_label_name': 'Drumcode'}
+    assert result['similarity_ratios']['similarity_ratio_mix'] == 100.0
+
+
+def test_isrc_hit_skips_name_search(tmp_path):
+    client = FakeClient({'GBABC1234567': [candidate(['Other'], 'Other', 'Original Mix', isrc='GBABC7654321'),
+                                          candidate(['Adam Beyer'], 'Pulse', 'Club Mix', isrc='GBABC1234567')]})
+    cache = BeatportCache(tmp_path / 'beatport.sqlite')
+    result = BeatportScraper('Adam Beyer - Pulse (Club Mix)', cache=cache, http_client=client,
+                             isrc='gbabc1234567').scrape_track_data()
+
+    assert client.queries == ['GBABC1234567']
+    assert result['track_metadata'] == {'query_genre_name': 'Techno (Peak Time / Driving)',
+                                        'query_label_name': 'Drumcode'}
+    assert cache.get('Adam+Beyer+Pulse+Club+Mix') == result  # Also cached under the name query
+    cache.close()
+
+
+def test_cached_isrc_miss_is_not_queried_again_within_ttl(tmp_path, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(beatport_cache, 'time', lambda: now[0])
+    client = FakeClient({'Adam+Beyer+Pulse+Club+Mix': [candidate(['Adam Beyer'], 'Pulse', 'Club Mix')],
+                         'Adam+Beyer+Pulse+Dub+Mix': [candidate(['Adam Beyer'], 'Pulse', 'Dub Mix')],
+                         'Adam+Beyer+Pulse+Radio+Mix': [candidate(['Adam Beyer'], 'Pulse', 'Radio Mix')]})
+    cache = BeatportCache(tmp_path / 'beatport.sqlite', ttl_days=30)
+
+    def scrape(track_name):
+        return BeatportScraper(track_name, cache=cache, http_client=client, isrc='GBABC1234567').scrape_track_data()
+
+    scrape('Adam Beyer - Pulse (Club Mix)')
+    assert client.queries == ['GBABC1234567', 'Adam+Beyer+Pulse+Club+Mix']  # Miss, found by name
+    assert cache.get('isrc:GBABC1234567') == {}
+
+    scrape('Adam Beyer - Pulse (Dub Mix)')
+    assert client.queries[2:] == ['Adam+Beyer+Pulse+Dub+Mix']  # Cached miss, no ISRC search
+
+    now[0] += 31 * 86400
+    scrape('Adam Beyer - Pulse (Radio Mix)')
+    assert client.queries[3:] == ['GBABC1234567', 'Adam+Beyer+Pulse+Radio+Mix']  # Expired, searched again
+    cache.close()
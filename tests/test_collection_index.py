@@ -0,0 +1,65 @@
+from os import path
+from TagMate.collection_index import CollectionIndex, best_conditions, comment_condition, track_identity
+
+
+def listing(mtime, *file_names):
+    return {'mtime': mtime, 'files': list(file_names), 'folders': []}
+
+
+def test_best_conditions():
+    assert best_conditions({'a.mp3': 'mp3'}) == {'a.mp3': 'Primary'}
+    assert best_conditions({'a.mp3': 'mp3', 'a.aif': 'aif'}) == {'a.mp3': 'Substitute', 'a.aif': 'Primary'}
+    assert best_conditions({'a.aif': 'aif', 'a.wav': 'wav', 'a.mp3': 'mp3'}) == {
+        'a.aif': 'Primary', 'a.wav': 'Primary', 'a.mp3': 'Substitute'}
+
+
+def test_comment_condition():
+    assert comment_condition('/* LIB / Substitute / Label */') == 'Substitute'
+    assert comment_condition('/* LIB / Primary */') == 'Primary'
+    assert comment_condition('/* LIB / Label */') is None
+
+
+def test_first_update_builds_index():
+    index = CollectionIndex()
+    index.update({'/c': listing(1, 'A - T1.mp3', 'A - T1.aif', 'cover.jpg'), '/c/sub': listing(1, 'B - T2.wav')})
+
+    assert index.take_changed() == set()
+    assert set(index.files(track_identity('A - T1.mp3'))) == {path.join('/c', 'A - T1.mp3'),
+                                                              path.join('/c', 'A - T1.aif')}
+    assert index.files(track_identity('B - T2.wav'))[path.join('/c/sub', 'B - T2.wav')]['format'] == 'wav'
+
+
+def test_update_marks_added_and_removed_tracks():
+    index = CollectionIndex()
+    index.update({'/c': listing(1, 'A - T1.mp3', 'B - T2.mp3'), '/c/sub': listing(1, 'C - T3.mp3')})
+
+    index.update({'/c': listing(2, 'A - T1.mp3', 'A - T1.aif')})  # B removed, A added, sub folder removed
+    assert index.take_changed() == {track_identity('A - T1.aif'), track_identity('B - T2.mp3'),
+                                    track_identity('C - T3.mp3')}
+    assert index.take_changed() == set()
+    assert index.files(track_identity('B - T2.mp3')) == {}
+    assert index.files(track_identity('C - T3.mp3')) == {}
+
+
+def test_update_skips_unmodified_folders():
+    index = CollectionIndex()
+    index.update({'/c': listing(1, 'A - T1.mp3')})
+
+    index.update({'/c': listing(1, 'A - T1.mp3', 'B - T2.mp3')})  # Same mtime, the folder is not listed again
+    assert index.take_changed() == set()
+    assert index.files(track_identity('B - T2.mp3')) == {}
+
+
+def test_save_and_load(tmp_path):
+    index_path = tmp_path / 'collection_index.json'
+    index = CollectionIndex(index_path)
+    index.update({'/c': listing(1, 'A - T1.mp3')})
+    index.set_condition(path.join('/c', 'A - T1.mp3'), 'Primary')
+    index.update({'/c': listing(2, 'A - T1.mp3', 'B - T2.mp3')})
+    index.save()
+
+    loaded = CollectionIndex(index_path)
+    assert loaded.files(track_identity('A - T1.mp3'))[path.join('/c', 'A - T1.mp3')]['condition'] == 'Primary'
+    assert loaded.take_changed() == {track_identity('B - T2.mp3')}  # Kept until evaluated
+    loaded.update({'/c': listing(2, 'A - T1.mp3', 'B - T2.mp3')})
+    assert loaded.take_changed() == set()
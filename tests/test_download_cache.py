@@ -0,0 +1,44 @@
+from TagMate.download_cache import ArtworkCache, PreviewCache
+from TagMate.music_tagger import MusicTagger
+
+
+class FakeClient:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return f'file at {url}'.encode()
+
+
+def test_index_saved_on_close(tmp_path):
+    client = FakeClient()
+    cache = ArtworkCache(str(tmp_path), http_client=client)
+    cache.prefetch(['https://img/1', 'https://img/2', 'https://img/1'])
+    assert cache.get('https://img/1') == b'file at https://img/1'
+    cache.close()
+    assert not list(tmp_path.glob('*.tmp'))
+
+    reopened = ArtworkCache(str(tmp_path), http_client=client)
+    assert reopened.get('https://img/2') == b'file at https://img/2'
+    assert sorted(client.urls) == ['https://img/1', 'https://img/2']  # Read from disk, not downloaded again
+    reopened.close()
+
+
+def test_music_tagger_closes_its_own_artwork_cache(tmp_path):
+    directories = [str(tmp_path / name) for name in ('local', 'possible_mismatch', 'collection')]
+    own = MusicTagger(*directories, 'LIB', 'automatic')
+    own.close()
+    assert own.artwork_cache._executor._shutdown
+
+    shared_cache = ArtworkCache(http_client=FakeClient())
+    MusicTagger(*directories, 'LIB', 'automatic', artwork_cache=shared_cache).close()
+    assert not shared_cache._executor._shutdown
+    shared_cache.close()
+
+
+def test_preview_cache_stores_mp3_files(tmp_path):
+    cache = PreviewCache(str(tmp_path), http_client=FakeClient())
+    assert cache.get('https://preview/1') == b'file at https://preview/1'
+    cache.close()
+    assert len(list(tmp_path.glob('*.mp3'))) == 1 and cache.name == 'preview'
@@ -0,0 +1,42 @@
+import json
+from os import makedirs
+from TagMate.genre_model import GenreModel, track_features
+from TagMate.music_tagger import MusicTagger
+
+
+def test_version_words_are_not_title_features():
+    assert sorted(track_features('Adam Beyer', 'Pulse Three (Original Mix)')) == [
+        'artist:adam beyer', 'title:pulse', 'title:three']
+    assert track_features('Adam Beyer', 'Pulse (Extended Mix)') == track_features('Adam Beyer', 'Pulse')
+
+
+def test_title_words_alone_are_not_applied():
+    model = GenreModel(['Techno', 'House']).fit([(track_features(f'Artist {n}', 'Common Words'), 'Techno')
+                                                 for n in range(30)])
+    genre, probability = model.predict(track_features('Unknown', 'Common Words'))[0]
+    assert genre == 'Techno' and probability > 0.99
+    assert model.auto_genre(track_features('Unknown', 'Common Words'), threshold=0.9) is None
+    assert model.auto_genre(track_features('Artist 1', 'Common Words'), threshold=0.9) == 'Techno'
+
+
+def test_unknown_track_goes_to_review(tmp_path, make_mp3):
+    directories = [str(tmp_path / name) for name in ('local', 'possible_mismatch', 'collection')]
+    for directory in directories:
+        makedirs(directory, exist_ok=True)
+    for n, genre in enumerate(['Techno'] * 30 + ['House'] * 3):
+        version = 'Original Mix' if n % 2 else 'Extended Mix'
+        make_mp3(tmp_path / 'collection' / f'Artist {n} - Track {n} ({version}).mp3', artist=f'Artist {n}',
+                 tracktitle=f'Track {n} ({version})', genre=genre)
+    custom_genres_path = tmp_path / 'custom_genres.json'
+    custom_genres_path.write_text(json.dumps({'LIB': {'Part_1': ['Techno', 'House']}}))
+    mt = MusicTagger(*directories, 'LIB', 'manual', tag_workers=1, output_dir=str(tmp_path),
+                     custom_genres_path=str(custom_genres_path))
+
+    mp3_files = [('Brand New Artist - Unrelated Title (Original Mix)', 'a.mp3'),
+                 ('Brand New Artist - Unrelated Title (Extended Mix)', 'b.mp3'),
+                 ('Artist 2 - Another Track (Original Mix)', 'c.mp3')]
+    suggestions, applied = mt._suggest_genres({}, mp3_files)
+    mt.close()
+
+    assert applied == {'Artist 2 - Another Track (Original Mix)': 'Techno'}
+    assert suggestions['Brand New Artist - Unrelated Title (Original Mix)'] == []  # Nothing known, review
@@ -0,0 +1,56 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter
+import pytest
+from requests import HTTPError
+from TagMate.http_client import HttpClient
+
+
+@pytest.fixture
+def server():
+    """
+    :return: local HTTP server answering every request with the next (status, headers) of server.responses, 200 with
+    body b'ok' when they run out; server.requests counts the requests
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            httpd.requests += 1
+            status, headers = httpd.responses.pop(0) if httpd.responses else (200, {})
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.requests = 0
+    httpd.responses = []
+    httpd.url = f'http://127.0.0.1:{httpd.server_port}/'
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_failed_requests_are_retried(server):
+    server.responses = [(503, {}), (500, {})]
+    assert HttpClient(retries=3, backoff_factor=0).get(server.url) == b'ok'
+    assert server.requests == 3
+
+
+def test_retry_after_header_is_honored(server):
+    server.responses = [(429, {'Retry-After': '1'})]
+    start = perf_counter()
+    assert HttpClient(retries=1, backoff_factor=0).get(server.url) == b'ok'
+    assert perf_counter() - start >= 1 and server.requests == 2
+
+
+def test_last_response_raised_when_retries_run_out(server):
+    server.responses = [(503, {})] * 3
+    with pytest.raises(HTTPError):
+        HttpClient(retries=2, backoff_factor=0).get(server.url)
+    assert server.requests == 3
@@ -0,0 +1,63 @@
+from os import makedirs
+from music_tag import load_file
+from TagMate.journal import Journal
+from TagMate.music_tagger import MusicTagger
+
+
+def comment(file_path):
+    return str(load_file(file_path)['comment'])
+
+
+def music_tagger(tmp_path, journal_path):
+    directories = [str(tmp_path / name) for name in ('local', 'possible_mismatch', 'collection')]
+    for directory in directories:
+        makedirs(directory, exist_ok=True)
+    return MusicTagger(*directories, 'LIB', 'automatic', primary_journal=Journal(journal_path), tag_workers=1,
+                       output_dir=str(tmp_path))
+
+
+def test_write_load_clear(tmp_path):
+    journal_path = tmp_path / 'primary_journal.json'
+    entries = [{'path': 'a.mp3', 'condition': 'Primary', 'old_comment': '/* LIB */',
+                'new_comment': '/* LIB / Primary */'}]
+    Journal(journal_path).write(entries)
+
+    journal = Journal(journal_path)
+    assert journal.load() == entries
+    journal.clear()
+    assert not journal_path.exists() and journal.load() == []
+
+
+def test_resume_interrupted_run(tmp_path, make_mp3):
+    journal_path = tmp_path / 'primary_journal.json'
+    mt = music_tagger(tmp_path, journal_path)
+    mp3_path = make_mp3(tmp_path / 'local' / 'A - T1.mp3', comment='/* LIB / Label */')
+    label_free_path = make_mp3(tmp_path / 'local' / 'B - T2.mp3', comment='/* LIB */')
+    mt.process_primary_or_substitute_tracks()  # Planned and journaled, interrupted before flush
+    assert len(Journal(journal_path).load()) == 2
+    assert comment(mp3_path) == '/* LIB / Label */'
+
+    mt = music_tagger(tmp_path, journal_path)
+    mt.process_primary_or_substitute_tracks()
+    mt.flush()
+    assert comment(mp3_path) == '/* LIB / Primary / Label */'
+    assert comment(label_free_path) == '/* LIB / Primary */'
+    assert not journal_path.exists()
+
+
+def test_rollback_interrupted_run(tmp_path, make_mp3):
+    journal_path = tmp_path / 'primary_journal.json'
+    mt = music_tagger(tmp_path, journal_path)
+    saved_path = make_mp3(tmp_path / 'local' / 'A - T1.mp3', comment='/* LIB / Primary / Label */')
+    unsaved_path = make_mp3(tmp_path / 'local' / 'B - T2.mp3', comment='/* LIB */')
+    Journal(journal_path).write([
+        {'path': saved_path, 'condition': 'Primary', 'old_comment': '/* LIB / Label */',
+         'new_comment': '/* LIB / Primary / Label */', 'collection': False},
+        {'path': unsaved_path, 'condition': 'Primary', 'old_comment': '/* LIB */',
+         'new_comment': '/* LIB / Primary */', 'collection': False},
+    ])
+
+    mt.rollback_primary_or_substitute_journal()
+    assert comment(saved_path) == '/* LIB / Label */'
+    assert comment(unsaved_path) == '/* LIB */'  # Not saved by the interrupted run, left as it is
+    assert not journal_path.exists()
@@ -0,0 +1,59 @@
+from io import BytesIO
+from os import stat
+import pytest
+from music_tag import load_file
+from TagMate.library_index import LibraryIndex
+
+
+def jpeg(color):
+    Image = pytest.importorskip('PIL.Image')
+    image_file = BytesIO()
+    Image.new('RGB', (8, 8), color).save(image_file, 'JPEG')
+    return image_file.getvalue()
+
+
+def stage_tags(library, file_path, artwork):
+    library.set(file_path, 'genre', 'Techno')
+    library.set(file_path, 'comment', '/* LIB / Drumcode */')
+    library.set(file_path, 'artwork', artwork)
+
+
+def test_second_save_writes_nothing(tmp_path, make_mp3, capsys):
+    first = make_mp3(tmp_path / 'A - T1.mp3')
+    second = make_mp3(tmp_path / 'B - T2.mp3')
+    library = LibraryIndex(str(tmp_path), max_workers=1)
+    for file_path in (first, second):
+        stage_tags(library, file_path, jpeg('red'))
+    assert sorted(library.flush()) == [first, second]
+    mtimes = [stat(file_path).st_mtime_ns for file_path in (first, second)]
+    capsys.readouterr()
+
+    library = LibraryIndex(str(tmp_path), max_workers=1)
+    for file_path in (first, second):
+        stage_tags(library, file_path, jpeg('red'))  # Same image, a new bytes object
+    assert library.flush() == []
+    assert [stat(file_path).st_mtime_ns for file_path in (first, second)] == mtimes
+    assert "Saved tags of 0 files, 2 files were already up to date." in capsys.readouterr().out
+
+
+def test_intermediate_values_are_not_written(tmp_path, make_mp3):
+    file_path = make_mp3(tmp_path / 'A - T1.mp3', genre='House')
+    mtime = stat(file_path).st_mtime_ns
+
+    library = LibraryIndex(str(tmp_path), max_workers=1)
+    library.set(file_path, 'genre', 'Placeholder')
+    library.set(file_path, 'genre', 'House')  # Only the last value of a tag is saved
+    assert library.flush() == []
+    assert stat(file_path).st_mtime_ns == mtime
+
+
+def test_changed_artwork_is_written(tmp_path, make_mp3):
+    file_path = make_mp3(tmp_path / 'A - T1.mp3')
+    library = LibraryIndex(str(tmp_path), max_workers=1)
+    library.set(file_path, 'artwork', jpeg('red'))
+    library.flush()
+
+    library = LibraryIndex(str(tmp_path), max_workers=1)
+    library.set(file_path, 'artwork', jpeg('blue'))
+    assert library.flush() == [file_path]
+    assert load_file(file_path)['artwork'].first.raw == jpeg('blue')
@@ -0,0 +1,33 @@
+from TagMate.normalize import normalize_track_name, parse_track_name, sanitize_file_name, title_without_version
+
+
+def test_normalize_drops_featuring_parts():
+    assert normalize_track_name('Artist - Title (feat. Other) (Extended Mix)') == 'artist title extended mix'
+    assert normalize_track_name('Artist - Title [ft. Other]') == normalize_track_name('Artist - Title (FT. Other)') \
+        == 'artist title'
+    assert normalize_track_name('Artist feat. Other - Title') == 'artist feat other title'  # Only in parentheses
+
+
+def test_normalize_transliterates_and_replaces_punctuation():
+    assert normalize_track_name('Röyksopp, Ólafur Arnalds - Éple') == 'royksopp olafur arnalds eple'
+    assert normalize_track_name('AC/DC - T.N.T.') == normalize_track_name(sanitize_file_name('AC/DC - T.N.T.')) \
+        == 'acdc t n t'
+    assert normalize_track_name('  A -- B!!  ') == 'a b'
+
+
+def test_parse_track_name_parts():
+    assert parse_track_name('Röyksopp, Other - Eple (Original Mix)') == ('royksopp, other', 'eple', 'Original Mix')
+    assert parse_track_name('Artist - Title (Artist2 Remix)') == ('artist', 'title', 'Artist2 Remix')
+    assert parse_track_name('Artist - Title (Radio Edit)') == ('artist', 'title', None)  # Edits have no version type
+    assert parse_track_name('Artist - Title (feat. Other) (Dub Mix)').version_type == 'Dub Mix'
+
+
+def test_parse_track_name_without_separator():
+    assert parse_track_name('Artist Title (Club Mix)') == ('artist title (club mix)', '', 'Club Mix')
+    assert parse_track_name('Artist - Part 1 - Part 2') == ('artist', 'part 1 - part 2', None)
+
+
+def test_title_without_version():
+    assert title_without_version('Title (Extended Mix)') == 'title'
+    assert title_without_version('Title (Radio Edit) ') == 'title'
+    assert title_without_version('Title (Live)') == 'title (live)'
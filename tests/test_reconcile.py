@@ -0,0 +1,31 @@
+from os import stat
+import json
+from TagMate.reconcile import CollectionReconciler, SCAN_CACHE_VERSION
+
+
+def touch(file_path):
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_bytes(b'')
+
+
+def test_every_format_counts_as_a_track(tmp_path):
+    for file_name in ('A - T1.mp3', 'B - T2.flac', 'sub/C - T3.aiff', 'sub/D - T4.m4a', 'E - T5.wav'):
+        touch(tmp_path / file_name)
+    reconciler = CollectionReconciler(str(tmp_path))
+
+    assert reconciler.scan() == {'A - T1', 'B - T2', 'C - T3', 'D - T4', 'E - T5'}
+    assert sorted(file_path.rpartition('.')[2] for file_path in reconciler.scan_files()) == ['mp3', 'wav']
+
+    report = reconciler.reconcile({'A - T1': {}, 'B - T2': {}, 'C - T3': {}, 'D - T4': {}, 'F - T6': {}})
+    assert report['missing_in_local_collection'] == ['F - T6']
+    assert report['missing_in_spotify_playlist'] == ['E - T5']
+
+
+def test_cache_of_older_version_is_rescanned(tmp_path):
+    touch(tmp_path / 'collection' / 'B - T2.flac')
+    cache_path = tmp_path / 'scan_cache.json'
+    mtime = stat(tmp_path / 'collection').st_mtime_ns  # An unversioned cache listing only music files, up to date
+    cache_path.write_text(json.dumps({str(tmp_path / 'collection'): {'mtime': mtime, 'files': [], 'folders': []}}))
+
+    assert CollectionReconciler(str(tmp_path / 'collection'), cache_path=str(cache_path)).scan() == {'B - T2'}
+    assert json.loads(cache_path.read_text())['version'] == SCAN_CACHE_VERSION
@@ -0,0 +1,42 @@
+from os import path
+from TagMate.tag_checkpoint import TagCheckpoint
+
+
+def test_unfinished_files_of_interrupted_run(tmp_path):
+    checkpoint_path = tmp_path / 'tag_checkpoint.json'
+    files = {str(tmp_path / f'{name}.mp3'): {'track_name': name, 'genre': 'House'} for name in ('A', 'B', 'C')}
+    checkpoint = TagCheckpoint(checkpoint_path)
+    checkpoint.start(files)
+    checkpoint.complete([str(tmp_path / 'A.mp3')])
+    checkpoint.fail(str(tmp_path / 'B.mp3'), 'B', 'tag', 'artwork not found')
+    checkpoint.save()
+
+    resumed = TagCheckpoint(checkpoint_path)
+    assert resumed.unfinished() == {path.abspath(tmp_path / 'C.mp3'): {'track_name': 'C', 'genre': 'House'}}
+    resumed.finish()
+    assert TagCheckpoint(checkpoint_path).unfinished() == {}
+
+
+def test_is_failed_until_file_changes(tmp_path):
+    file_path = tmp_path / 'A.mp3'
+    file_path.write_bytes(b'broken')
+    checkpoint = TagCheckpoint()
+    checkpoint.fail(str(file_path), 'A', 'save', 'not an MP3 file')
+
+    assert checkpoint.is_failed(str(file_path))
+    assert checkpoint.failed()[path.abspath(file_path)]['attempts'] == 1
+    file_path.write_bytes(b'a new version')
+    assert not checkpoint.is_failed(str(file_path))
+
+
+def test_complete_clears_failure(tmp_path):
+    file_path = tmp_path / 'A.mp3'
+    file_path.write_bytes(b'broken')
+    checkpoint = TagCheckpoint()
+    checkpoint.fail(str(file_path), 'A', 'tag', 'timeout')
+    checkpoint.fail(str(file_path), 'A', 'tag', 'timeout')
+    assert checkpoint.failed()[path.abspath(file_path)]['attempts'] == 2
+
+    checkpoint.complete([str(file_path)])
+    assert not checkpoint.is_failed(str(file_path))
+    assert checkpoint.failed() == {}
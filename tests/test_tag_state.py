@@ -0,0 +1,78 @@
+from os import stat, utime
+import pytest
+from TagMate import tag_state
+from TagMate.tag_state import TagState
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    """
+    :return: list of the files hashed by TagState
+    """
+    calls = []
+    content_hash = tag_state.content_hash
+
+    def counted(file_path):
+        calls.append(file_path)
+        return content_hash(file_path)
+
+    monkeypatch.setattr(tag_state, 'content_hash', counted)
+    return calls
+
+
+def recorded(tmp_path, content=b'ID3 tags and audio'):
+    file_path = tmp_path / 'A - T1.mp3'
+    file_path.write_bytes(content)
+    state = TagState(tmp_path / 'tag_state.json')
+    state.record(str(file_path), 'tag', key='spotify:track:1', tags={'genre': 'Techno'})
+    state.save()
+    return file_path, TagState(tmp_path / 'tag_state.json')
+
+
+def test_unchanged_size_and_mtime_skip_hashing(tmp_path, hash_calls):
+    file_path, state = recorded(tmp_path)
+    hash_calls.clear()
+
+    assert state.is_done(str(file_path), 'tag', key='spotify:track:1')
+    assert state.stage_tags(str(file_path), 'tag') == {'genre': 'Techno'}
+    assert not state.is_done(str(file_path), 'tag', key='spotify:track:2')
+    assert not state.is_done(str(file_path), 'transfer', key='spotify:track:1')
+    assert hash_calls == []
+
+
+def test_touched_file_falls_back_to_content_hash(tmp_path, hash_calls):
+    file_path, state = recorded(tmp_path)
+    file_stat = stat(file_path)
+    utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10 ** 9))
+    hash_calls.clear()
+
+    assert state.is_done(str(file_path), 'tag', key='spotify:track:1')
+    assert len(hash_calls) == 1
+    assert state.is_done(str(file_path), 'tag', key='spotify:track:1')  # The new mtime is remembered
+    assert len(hash_calls) == 1
+
+
+def test_changed_content_is_not_done(tmp_path):
+    file_path, state = recorded(tmp_path)
+    file_stat = stat(file_path)
+    file_path.write_bytes(b'ID3 TAGS and audio')  # Same size, other content
+    utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10 ** 9))
+    assert not state.is_done(str(file_path), 'tag', key='spotify:track:1')
+
+    file_path.write_bytes(b'ID3 tags and longer audio')
+    assert not state.is_done(str(file_path), 'tag', key='spotify:track:1')
+    assert state.stage_tags(str(file_path), 'tag') is None
+
+
+def test_forget(tmp_path):
+    file_path, state = recorded(tmp_path)
+    state.forget(str(file_path))
+    state.forget(str(tmp_path / 'never recorded.mp3'))
+
+    assert not state.is_done(str(file_path), 'tag', key='spotify:track:1')
+    assert not state.is_recorded(str(file_path))
+
+
+def test_force_reprocesses_everything(tmp_path):
+    file_path, _ = recorded(tmp_path)
+    assert not TagState(tmp_path / 'tag_state.json', force=True).is_done(str(file_path), 'tag', key='spotify:track:1')
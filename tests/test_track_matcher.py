@@ -0,0 +1,33 @@
+from TagMate.track_matcher import TrackMatcher
+
+TRACK_NAMES = ['Daft Punk - One More Time', 'Orbital - Halcyon On and On', 'Röyksopp - Eple',
+               'Bicep - Glue', 'Bicep - Apricots']
+
+
+def test_exact_match_after_normalization():
+    matches = TrackMatcher(TRACK_NAMES).match(['daft punk - one more time (feat. Romanthony)', 'Royksopp - Eple'])
+    assert matches == {'daft punk - one more time (feat. Romanthony)': ('Daft Punk - One More Time', 100.0),
+                       'Royksopp - Eple': ('Röyksopp - Eple', 100.0)}
+
+
+def test_fuzzy_match_above_threshold():
+    matches = TrackMatcher(TRACK_NAMES).match(['Orbtal - Halcyon On & On'], threshold=80)
+    track_name, score = matches['Orbtal - Halcyon On & On']
+    assert track_name == 'Orbital - Halcyon On and On' and 80 <= score < 100
+
+
+def test_no_match_below_threshold_or_without_candidates():
+    matcher = TrackMatcher(TRACK_NAMES)
+    assert matcher.match(['Orbtal - Halcyon On & On'], threshold=95) == {}
+    assert matcher.match(['Zz - Qq']) == {}
+    assert matcher.match([]) == {}
+
+
+def test_different_title_or_version_is_not_matched():
+    matcher = TrackMatcher(['Adam Beyer - Pulse Two (Original Mix)', 'Adam Beyer - Pulse (Dub Mix)'])
+    assert matcher.match(['Adam Beyer - Pulse Three (Original Mix)', 'Adam Beyer - Pulse (Club Mix)']) == {}
+
+
+def test_original_mix_matches_spotify_name_without_version():
+    matches = TrackMatcher(['Bicep - Glue', 'Bicep - Glue (Radio Edit)']).match(['Bicep - Glue (Original Mix)'])
+    assert matches == {'Bicep - Glue (Original Mix)': ('Bicep - Glue', 100.0)}
@@ -0,0 +1,45 @@
+import pytest
+from TagMate.track_table import TrackRecord, TrackTable, write_track_table
+
+TRACKS = {
+    'Artist - Title': TrackRecord('spotify:track:1', 'https://img/1', None, 'Artist', 'Title', 'NLA123456789'),
+    'Ärtist, Other - Títle (Remix)': TrackRecord('spotify:track:2', 'https://img/2', 'https://preview/2',
+                                                 'Ärtist, Other', 'Títle (Remix)'),
+    'Empty - ': TrackRecord('spotify:track:3', '', None, 'Empty', ''),
+}
+
+
+def test_round_trip(tmp_path):
+    table_path = tmp_path / 'playlist.tracks'
+    write_track_table(table_path, TRACKS, meta={'version': 3, 'snapshot_id': 'abc'})
+
+    table = TrackTable(table_path)
+    try:
+        assert table.meta == {'version': 3, 'snapshot_id': 'abc'}
+        assert len(table) == len(TRACKS)
+        assert list(table) == list(TRACKS)
+        assert dict(table.items()) == TRACKS
+        assert table['Empty - '].img_url == ''  # Empty strings stay distinct from None
+        assert table['Artist - Title'].get('preview_url') is None
+        assert 'Unknown - Track' not in table
+        with pytest.raises(KeyError):
+            table['Unknown - Track']
+    finally:
+        table.close()
+
+
+def test_empty_table(tmp_path):
+    table_path = tmp_path / 'empty.tracks'
+    write_track_table(table_path, {})
+
+    table = TrackTable(table_path)
+    assert len(table) == 0 and table.meta == {}
+    table.close()
+
+
+def test_rejects_other_files(tmp_path):
+    other_path = tmp_path / 'playlist.json'
+    other_path.write_text('{"tracks": []}')
+
+    with pytest.raises(ValueError):
+        TrackTable(other_path)
@@ -0,0 +1,63 @@
+import pytest
+from TagMate import watch
+from TagMate.watch import DirectoryWatcher
+
+
+class Clock:
+    def __init__(self, monkeypatch):
+        """
+        Replaces the clock of the watcher, every poll_interval sleep advances it and calls on_sleep.
+        """
+        self.now = 0.0
+        self.on_sleep = None
+        monkeypatch.setattr(watch, 'monotonic', lambda: self.now)
+        monkeypatch.setattr(watch, 'sleep', self.sleep)
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.now > 100:
+            raise TimeoutError("No batch released")
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    return Clock(monkeypatch)
+
+
+def watcher(directory):
+    return DirectoryWatcher([str(directory)], debounce_seconds=2, max_batch_seconds=10, poll_interval=1, poll=True)
+
+
+def test_existing_files_form_first_batch_after_debounce(tmp_path, clock):
+    for file_name in ('B - T2.mp3', 'A - T1.aif', 'cover.jpg'):
+        (tmp_path / file_name).write_bytes(b'audio')
+
+    batch = next(watcher(tmp_path).batches())
+    assert batch == [str(tmp_path / 'A - T1.aif'), str(tmp_path / 'B - T2.mp3')]
+    assert clock.now == 2
+
+
+def test_file_still_being_written_is_left_out_after_max_batch(tmp_path, clock):
+    (tmp_path / 'A - T1.mp3').write_bytes(b'audio')
+    growing = tmp_path / 'B - T2.mp3'
+    growing.write_bytes(b'')
+    clock.on_sleep = lambda: growing.write_bytes(growing.read_bytes() + b'x')  # Still downloading
+
+    batch = next(watcher(tmp_path).batches())
+    assert batch == [str(tmp_path / 'A - T1.mp3')]
+    assert clock.now == 2 + 10  # Ready at 2, waited max_batch_seconds for the other file
+
+
+def test_acknowledged_changes_do_not_start_a_batch(tmp_path, clock):
+    tagged = tmp_path / 'A - T1.mp3'
+    tagged.write_bytes(b'audio')
+    directory_watcher = watcher(tmp_path)
+    batches = directory_watcher.batches()
+    assert next(batches) == [str(tagged)]
+
+    tagged.write_bytes(b'audio with tags')  # Saved by TagMate
+    directory_watcher.acknowledge([str(tagged)])
+    (tmp_path / 'B - T2.mp3').write_bytes(b'audio')
+    assert next(batches) == [str(tmp_path / 'B - T2.mp3')]